@@ -0,0 +1,171 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+base_dir = Path(__file__).resolve().parent.parent
+if str(base_dir) not in sys.path:
+    sys.path.append(str(base_dir))
+
+from benchmarks.generator import make_email, populate
+from server.auth_manager import AuthManager
+from server.data_manager import DataManager
+from server.email_manager import EmailManager
+
+# (users, messages) per dataset
+DEFAULT_SIZES = [(10, 100), (100, 1000), (500, 5000)]
+DEFAULT_REPEAT = 20
+DEFAULT_THRESHOLD = 0.25  # Flag ops whose p50 grew by more than 25%
+
+OPERATIONS = ("save_email", "get_user_emails", "get_unread_count", "move_to_trash", "login")
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def summarize(samples):
+    # Latencies in milliseconds, throughput in operations per second
+    ordered = sorted(samples)
+    total = sum(samples)
+    return {
+        'count': len(samples),
+        'mean_ms': statistics.mean(samples) * 1000,
+        'p50_ms': percentile(ordered, 0.50) * 1000,
+        'p90_ms': percentile(ordered, 0.90) * 1000,
+        'p99_ms': percentile(ordered, 0.99) * 1000,
+        'max_ms': ordered[-1] * 1000,
+        'ops_per_sec': len(samples) / total if total else 0.0,
+    }
+
+
+def time_calls(call, arguments):
+    samples = []
+    for args in arguments:
+        started = time.perf_counter()
+        call(*args)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def run_dataset(users, messages, repeat, seed=0):
+    # Time each operation against a freshly generated store of the given size
+    with tempfile.TemporaryDirectory() as data_dir:
+        data_manager = DataManager(data_dir)
+        users_data, emails_data = populate(data_manager, users, messages, seed)
+        auth_manager = AuthManager(data_manager)
+        # No consumers: operations are timed synchronously on this thread
+        email_manager = EmailManager(data_manager, consumers=0)
+
+        rng = random.Random(seed + 1)
+        usernames = sorted(users_data)
+        picks = [rng.choice(usernames) for _ in range(repeat)]
+        results = {}
+
+        results['login'] = time_calls(
+            auth_manager.login, [(name, users_data[name]['password']) for name in picks]
+        )
+        results['get_user_emails'] = time_calls(
+            email_manager.get_user_emails, [(name, 'inbox') for name in picks]
+        )
+        results['get_unread_count'] = time_calls(email_manager.get_unread_count, [(name,) for name in picks])
+
+        new_emails = [
+            make_email(rng, rng.choice(usernames), rng.choice(usernames), datetime.now())
+            for _ in range(repeat)
+        ]
+        results['save_email'] = time_calls(email_manager.save_email, [(email,) for email in new_emails])
+
+        inbox = [
+            (username, email['id'])
+            for username, user_emails in emails_data.items()
+            for email in user_emails if email['status'] == 'inbox'
+        ]
+        trash = rng.sample(inbox, min(repeat, len(inbox)))
+        results['move_to_trash'] = time_calls(email_manager.move_to_trash, trash)
+
+        return {op: summarize(results[op]) for op in OPERATIONS if results[op]}
+
+
+def run(sizes, repeat, seed=0):
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'results': {
+            f"{users}x{messages}": run_dataset(users, messages, repeat, seed)
+            for users, messages in sizes
+        },
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    # Operations whose median latency regressed past threshold, as
+    # (dataset, op, baseline p50 ms, current p50 ms) tuples
+    regressions = []
+    for dataset, ops in results['results'].items():
+        for op, stats in ops.items():
+            base = baseline.get('results', {}).get(dataset, {}).get(op)
+            if base and stats['p50_ms'] > base['p50_ms'] * (1 + threshold):
+                regressions.append((dataset, op, base['p50_ms'], stats['p50_ms']))
+    return regressions
+
+
+def format_table(results):
+    lines = [f"{'dataset':>12} {'operation':>18} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'ops/s':>9}"]
+    for dataset, ops in results['results'].items():
+        for op, stats in ops.items():
+            lines.append(
+                f"{dataset:>12} {op:>18} {stats['p50_ms']:>9.3f} {stats['p90_ms']:>9.3f} "
+                f"{stats['p99_ms']:>9.3f} {stats['ops_per_sec']:>9.1f}"
+            )
+    return "\n".join(lines)
+
+
+def parse_size(text):
+    users, _, messages = text.partition("x")
+    return int(users), int(messages)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark mailbox operations across dataset sizes.")
+    parser.add_argument("--sizes", nargs="+", type=parse_size,
+                        default=DEFAULT_SIZES, help="datasets as USERSxMESSAGES, e.g. 100x1000")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed calls per operation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed p50 growth over the baseline (0.25 = 25%%)")
+    options = parser.parse_args(argv)
+
+    results = run(options.sizes, options.repeat, options.seed)
+    print(format_table(results))
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if options.baseline:
+        with open(options.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, options.threshold)
+        for dataset, op, before, after in regressions:
+            print(f"REGRESSION {dataset} {op}: p50 {before:.3f} ms -> {after:.3f} ms")
+        if regressions:
+            return 1
+    return 0
@@ -0,0 +1,90 @@
+import random
+import uuid
+from datetime import datetime, timedelta
+
+WORDS = (
+    "meeting project update review schedule report budget team design "
+    "release customer feedback deadline draft proposal follow thanks "
+    "please attached agenda notes call question issue plan status"
+).split()
+
+# Body lengths (characters) follow a log-normal distribution: most messages
+# are a few hundred characters, a long tail runs to tens of kilobytes.
+BODY_MEDIAN = 600
+BODY_SIGMA = 1.3
+BODY_MIN = 20
+BODY_MAX = 200_000
+
+REPLY_FRACTION = 0.3
+READ_FRACTION = 0.6
+BASE_TIME = datetime(2024, 1, 1)
+
+
+def body_length(rng):
+    length = int(rng.lognormvariate(0, BODY_SIGMA) * BODY_MEDIAN)
+    return max(BODY_MIN, min(BODY_MAX, length))
+
+
+def make_text(rng, length):
+    words = []
+    total = 0
+    while total < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        total += len(word) + 1
+    return " ".join(words)[:length]
+
+
+def make_email(rng, sender, recipient, timestamp, parent=None):
+    # uuid from the seeded generator, so the same seed gives the same ids
+    email = {
+        'id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        'sender': sender,
+        'recipient': recipient,
+        'subject': ("Re: " + parent['subject']) if parent else make_text(rng, rng.randint(10, 60)).title(),
+        'body': make_text(rng, body_length(rng)),
+        'timestamp': timestamp.isoformat(),
+        'status': 'sent',
+    }
+    email['thread_id'] = parent['thread_id'] if parent else email['id']
+    if parent:
+        email['in_reply_to'] = parent['id']
+    return email
+
+
+def generate(users, messages, seed=0):
+    # Returns (users data, emails data) in the layout DataManager stores:
+    # every message has a sent copy for its sender and an inbox copy for
+    # its recipient, as EmailManager.save_email writes them.
+    rng = random.Random(seed)
+    usernames = [f"user{i:05d}" for i in range(users)]
+    users_data = {
+        username: {'password': f"password-{username}", 'created_at': BASE_TIME.isoformat()}
+        for username in usernames
+    }
+    emails_data = {username: [] for username in usernames}
+    sent = []
+
+    timestamp = BASE_TIME
+    for _ in range(messages):
+        timestamp += timedelta(seconds=rng.randint(1, 600))
+        parent = rng.choice(sent) if sent and rng.random() < REPLY_FRACTION else None
+        if parent:
+            sender, recipient = parent['recipient'], parent['sender']
+        else:
+            sender, recipient = rng.sample(usernames, 2) if users > 1 else (usernames[0], usernames[0])
+        email = make_email(rng, sender, recipient, timestamp, parent)
+        sent.append(email)
+
+        emails_data[sender].append(dict(email, status='sent'))
+        emails_data[recipient].append(dict(email, status='inbox', read=rng.random() < READ_FRACTION))
+
+    return users_data, emails_data
+
+
+def populate(data_manager, users, messages, seed=0):
+    # Write a generated dataset into data_manager's files
+    users_data, emails_data = generate(users, messages, seed)
+    data_manager.write_data(data_manager.users_file, users_data)
+    data_manager.write_data(data_manager.emails_file, emails_data)
+    return users_data, emails_data
@@ -0,0 +1,274 @@
+import argparse
+import json
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+base_dir = Path(__file__).resolve().parent.parent
+if str(base_dir) not in sys.path:
+    sys.path.append(str(base_dir))
+
+from benchmarks.bench import summarize
+from benchmarks.generator import make_email, populate
+from server.data_manager import DataManager
+from server.email_manager import EmailManager
+
+# Relative frequency of each session action
+DEFAULT_MIX = {"send": 40, "list": 30, "trash": 10, "read": 10, "draft": 10}
+
+
+class LoadRun:
+    # Drives `sessions` concurrent client threads against one EmailManager
+    # for `duration` seconds.
+    #
+    # Queued actions (send, trash, draft) are timed from the enqueue call to
+    # the change event EmailManager publishes after the write, i.e. until
+    # the change is persisted. Direct calls (list, read) are timed inline.
+    # A sampler thread records queue depth per lane and emails-file lock
+    # contention every `sample_interval` seconds.
+
+    def __init__(self, email_manager, usernames, sessions=20, duration=10.0,
+                 mix=None, think_time=0.01, sample_interval=0.5, seed=0):
+        self.email_manager = email_manager
+        self.usernames = usernames
+        self.sessions = sessions
+        self.duration = duration
+        self.mix = dict(mix or DEFAULT_MIX)
+        self.think_time = think_time
+        self.sample_interval = sample_interval
+        self.seed = seed
+
+        self.lock = threading.Lock()
+        self.in_flight = {}  # (action, username, email id) -> [enqueue times]
+        self.latencies = {action: [] for action in self.mix}
+        self.sent_ids = []
+        self.draft_ids = []
+        self.errors = Counter()
+        self.rejected = Counter()  # Tasks turned away by admission control
+        self.samples = []
+        self.stop = threading.Event()
+
+    def on_event(self, username, event):
+        # Runs on the consumer thread right after the change was written
+        email = event.get('email') or {}
+        if event['type'] == 'new' and email.get('status') == 'sent':
+            key = ("send", username, event['id'])
+        elif event['type'] == 'status' and email.get('status') == 'deleted':
+            key = ("trash", username, event['id'])
+        elif event['type'] in ('new', 'updated') and email.get('status') == 'draft':
+            key = ("draft", username, event['id'])
+        else:
+            return
+        now = time.perf_counter()
+        with self.lock:
+            started = self.in_flight.get(key)
+            if started:
+                self.latencies[key[0]].append(now - started.pop(0))
+                if not started:
+                    del self.in_flight[key]
+
+    def enqueue(self, action, username, email_id, *task):
+        # Returns whether the task was admitted; rejections are counted
+        key = (action, username, email_id)
+        with self.lock:
+            self.in_flight.setdefault(key, []).append(time.perf_counter())
+        if self.email_manager.enqueue(*task):
+            return True
+        with self.lock:
+            self.in_flight[key].pop()
+            if not self.in_flight[key]:
+                del self.in_flight[key]
+            self.rejected[action] += 1
+        return False
+
+    def timed(self, action, call, *args):
+        started = time.perf_counter()
+        result = call(*args)
+        with self.lock:
+            self.latencies[action].append(time.perf_counter() - started)
+        return result
+
+    def session(self, index):
+        rng = random.Random(self.seed * 1000 + index)
+        username = self.usernames[index % len(self.usernames)]
+        others = [name for name in self.usernames if name != username] or [username]
+        actions = list(self.mix)
+        weights = [self.mix[action] for action in actions]
+        inbox = []
+
+        while not self.stop.is_set():
+            action = rng.choices(actions, weights)[0]
+            try:
+                if action == "send":
+                    email = make_email(rng, username, rng.choice(others), datetime.now())
+                    if self.enqueue("send", username, email['id'], "send_email", email):
+                        with self.lock:
+                            self.sent_ids.append(email['id'])
+                elif action == "list":
+                    inbox = self.timed("list", self.email_manager.list_headers, username, 'inbox')
+                elif action == "trash" and inbox:
+                    email_id = inbox.pop(rng.randrange(len(inbox)))['id']
+                    self.enqueue("trash", username, email_id, "move_to_trash", username, email_id)
+                elif action == "read" and inbox:
+                    email_id = rng.choice(inbox)['id']
+                    self.timed("read", self.email_manager.mark_as_read, username, email_id)
+                elif action == "draft":
+                    draft = dict(make_email(rng, username, rng.choice(others), datetime.now()), status='draft')
+                    if self.enqueue("draft", username, draft['id'], "save_draft", draft):
+                        with self.lock:
+                            self.draft_ids.append((username, draft['id']))
+            except Exception as e:
+                with self.lock:
+                    self.errors[f"{action}: {type(e).__name__}"] += 1
+            if self.think_time:
+                self.stop.wait(self.think_time)
+
+    def sample(self, started):
+        lock = self.email_manager.lock
+        while True:
+            lock_stats = lock.stats()
+            self.samples.append({
+                'elapsed': time.perf_counter() - started,
+                'queue_depth': {
+                    lane: stats['depth'] for lane, stats in self.email_manager.email_queue.stats().items()
+                },
+                'lock_acquisitions': lock_stats['acquisitions'],
+                'lock_wait_seconds': lock_stats['wait_seconds'],
+            })
+            if self.stop.wait(self.sample_interval):
+                return
+
+    def run(self):
+        unsubscribes = [
+            self.email_manager.subscribe(name, lambda event, name=name: self.on_event(name, event))
+            for name in self.usernames
+        ]
+        started = time.perf_counter()
+        lock_before = self.email_manager.lock.stats()
+        sampler = threading.Thread(target=self.sample, args=(started,), daemon=True)
+        sampler.start()
+        threads = [threading.Thread(target=self.session, args=(i,), daemon=True) for i in range(self.sessions)]
+        for thread in threads:
+            thread.start()
+
+        time.sleep(self.duration)
+        self.stop.set()
+        for thread in threads:
+            thread.join()
+        # Let the consumers finish what was queued before checking the store
+        self.email_manager.email_queue.join()
+        elapsed = time.perf_counter() - started
+        sampler.join()
+        for unsubscribe in unsubscribes:
+            unsubscribe()
+
+        lock_after = self.email_manager.lock.stats()
+        acquisitions = lock_after['acquisitions'] - lock_before['acquisitions']
+        wait_seconds = lock_after['wait_seconds'] - lock_before['wait_seconds']
+        return {
+            'elapsed': elapsed,
+            'sessions': self.sessions,
+            'latency': {
+                action: summarize(samples) for action, samples in self.latencies.items() if samples
+            },
+            'lock': {
+                'acquisitions': acquisitions,
+                'mean_wait_ms': wait_seconds / acquisitions * 1000 if acquisitions else 0.0,
+                'max_wait_ms': lock_after['max_wait'] * 1000,
+            },
+            'queue_depth_max': max(sum(s['queue_depth'].values()) for s in self.samples),
+            'samples': self.samples,
+            'unacknowledged': sum(len(times) for times in self.in_flight.values()),
+            'dead_letters': len(self.email_manager.list_dead_letters()),
+            'rejected': dict(self.rejected),
+            'errors': dict(self.errors),
+            'integrity': self.verify(),
+        }
+
+    def verify(self):
+        # Every sent message must have exactly one sender copy and one
+        # recipient copy (trash only changes status), and every draft
+        # exactly one record
+        emails = self.email_manager.data_manager.read_data(self.email_manager.data_manager.emails_file) or {}
+        copies = Counter()
+        for username, user_emails in emails.items():
+            for email in user_emails:
+                copies[email['id']] += 1
+        expected = Counter({email_id: 2 for email_id in self.sent_ids})
+        expected.update({draft_id: 1 for _, draft_id in self.draft_ids})
+        lost = [email_id for email_id, count in expected.items() if copies[email_id] < count]
+        duplicated = [email_id for email_id, count in expected.items() if copies[email_id] > count]
+        return {
+            'messages_sent': len(self.sent_ids),
+            'drafts_saved': len(self.draft_ids),
+            'lost': lost,
+            'duplicated': duplicated,
+        }
+
+
+def format_report(report):
+    lines = [f"{report['sessions']} sessions for {report['elapsed']:.1f}s"]
+    lines.append(f"{'action':>8} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for action, stats in report['latency'].items():
+        lines.append(
+            f"{action:>8} {stats['count']:>7} {stats['p50_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}"
+        )
+    lock = report['lock']
+    lines.append(
+        f"lock: {lock['acquisitions']} acquisitions, mean wait {lock['mean_wait_ms']:.2f} ms, "
+        f"max wait {lock['max_wait_ms']:.2f} ms"
+    )
+    lines.append(f"queue depth max: {report['queue_depth_max']}")
+    integrity = report['integrity']
+    lines.append(
+        f"integrity: {integrity['messages_sent']} sent, {integrity['drafts_saved']} drafts, "
+        f"{len(integrity['lost'])} lost, {len(integrity['duplicated'])} duplicated, "
+        f"{report['dead_letters']} dead-lettered"
+    )
+    if report['rejected']:
+        lines.append(f"rejected by admission control: {report['rejected']}")
+    if report['errors']:
+        lines.append(f"errors: {report['errors']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a concurrent mixed workload against EmailManager.")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=500, help="messages in the starting dataset")
+    parser.add_argument("--consumers", type=int, default=2)
+    parser.add_argument("--think-time", type=float, default=0.01, help="seconds between a session's actions")
+    parser.add_argument("--no-admission", action="store_true", help="turn off admission control")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the full report, including samples, as JSON")
+    options = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        data_manager = DataManager(data_dir)
+        users_data, _ = populate(data_manager, options.users, options.messages, options.seed)
+        email_manager = EmailManager(data_manager, consumers=options.consumers)
+        if options.no_admission:
+            email_manager.admission = None
+        report = LoadRun(
+            email_manager, sorted(users_data), sessions=options.sessions, duration=options.duration,
+            think_time=options.think_time, seed=options.seed
+        ).run()
+
+    print(format_report(report))
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    integrity = report['integrity']
+    return 1 if integrity['lost'] or integrity['duplicated'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
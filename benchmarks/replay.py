@@ -0,0 +1,241 @@
+import argparse
+import functools
+import json
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+base_dir = Path(__file__).resolve().parent.parent
+if str(base_dir) not in sys.path:
+    sys.path.append(str(base_dir))
+
+from benchmarks.bench import summarize
+from client.remote_client import RemoteConnection
+from server.auth_manager import AuthManager
+from server.capture import REDACTED
+from server.data_manager import DataManager
+from server.email_manager import EmailManager
+from server.network_server import WIRE_OPS
+
+# Methods a local trace may contain that the server only offers under
+# another operation: method -> (wire op, arguments to put in front)
+WIRE_EQUIVALENTS = {
+    "save_email": ("enqueue", ["send_email"]),
+}
+
+
+def load_trace(trace_file):
+    # Trace records in start order; a torn final line is skipped
+    records = []
+    with open(trace_file, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return sorted(records, key=lambda record: record['t'])
+
+
+def replay_password(username):
+    # Passwords are redacted in traces, so replays use a known one
+    return f"replay-{username}"
+
+
+class Replayer:
+    # Drives a captured trace against local managers, or against a server
+    # through connect().
+    #
+    # Each recorded session is replayed on its own thread in its original
+    # order, so per-session ordering is deterministic while sessions
+    # overlap as they did when captured. Calls start at their recorded
+    # offset divided by `speed`; speed=None replays every session back to
+    # back as fast as possible.
+    #
+    # With connect(), a callable returning a new RemoteConnection, every
+    # session gets its own connection and logs in as the user it acted as,
+    # just like the clients it was recorded from. Remote calls go through
+    # connection.request, so an error response counts as an error; the
+    # Remote*Manager wrappers would turn it into a default value. Local
+    # managers also catch most errors themselves, so locally only calls
+    # that raise are counted. Calls a local trace recorded that have no
+    # wire operation (warm_up, flush_drafts and other server-side
+    # housekeeping) are skipped and counted separately.
+
+    def __init__(self, auth_manager=None, email_manager=None, speed=1.0, connect=None):
+        self.managers = {"auth": auth_manager, "email": email_manager}
+        self.speed = speed
+        self.connect = connect
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.original = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.skipped = defaultdict(int)
+
+    def prepare(self, records):
+        # Register users the trace doesn't register itself, since it has no
+        # passwords: those who log in and those sessions acted as
+        registered = {r['args'][0] for r in records if r['component'] == "auth" and r['op'] == "register"}
+        users = set()
+        for record in records:
+            if record['component'] == "auth" and record['op'] == "login":
+                users.add(record['args'][0])
+            if record.get('user'):
+                users.add(record['user'])
+        if self.connect is not None:
+            connection = self.connect()
+            try:
+                for username in sorted(users - registered):
+                    connection.request("register", username, replay_password(username))
+            finally:
+                connection.close()
+        else:
+            for username in sorted(users - registered):
+                self.managers["auth"].register(username, replay_password(username))
+
+    def call(self, record, connection=None, state=None):
+        args = list(record['args'])
+        if record['component'] == "auth" and len(args) > 1 and args[1] == REDACTED:
+            args[1] = replay_password(args[0])
+        op = f"{record['component']}.{record['op']}"
+        if connection is not None:
+            wire_op, leading = WIRE_EQUIVALENTS.get(record['op'], (record['op'], []))
+            if wire_op not in WIRE_OPS:
+                with self.lock:
+                    self.skipped[op] += 1
+                return
+            args = leading + args
+            user = record.get('user')
+            if user and user != state['user']:
+                # The capture started after this session logged in
+                try:
+                    if connection.request("login", user, replay_password(user)):
+                        state['user'] = user
+                except Exception:
+                    pass  # The call below fails and is counted
+            # Most operations on the wire have the same names as the methods
+            method = functools.partial(connection.request, wire_op)
+        else:
+            method = getattr(self.managers[record['component']], record['op'])
+        started = time.perf_counter()
+        failed = False
+        try:
+            result = method(*args, **record.get('kwargs', {}))
+        except Exception:
+            result = None
+            failed = True
+        elapsed = time.perf_counter() - started
+        if connection is not None and record['op'] == "login" and result:
+            state['user'] = args[0]
+        with self.lock:
+            self.latencies[op].append(elapsed)
+            self.original[op].append(record['duration'])
+            if failed:
+                self.errors[op] += 1
+
+    def replay_session(self, records, started):
+        connection = self.connect() if self.connect is not None else None
+        state = {'user': None}
+        try:
+            for record in records:
+                if self.speed is not None:
+                    delay = started + record['t'] / self.speed - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                self.call(record, connection, state)
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def run(self, records):
+        sessions = defaultdict(list)
+        for record in records:
+            sessions[record['session']].append(record)
+
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=self.replay_session, args=(session_records, started), daemon=True)
+            for session_records in sessions.values()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        email_queue = getattr(self.managers["email"], 'email_queue', None)
+        if email_queue is not None:
+            email_queue.join()  # Include queued work in the elapsed time
+        elapsed = time.perf_counter() - started
+
+        calls = sum(len(samples) for samples in self.latencies.values())
+        return {
+            'calls': calls,
+            'sessions': len(sessions),
+            'elapsed': elapsed,
+            'throughput': calls / elapsed if elapsed else 0.0,
+            'errors': sum(self.errors.values()),
+            'skipped': dict(self.skipped),
+            'operations': {
+                op: dict(
+                    summarize(samples),
+                    original_p50_ms=summarize(self.original[op])['p50_ms'],
+                    errors=self.errors[op],
+                )
+                for op, samples in sorted(self.latencies.items())
+            },
+        }
+
+
+def format_report(report):
+    lines = [
+        f"{report['calls']} calls from {report['sessions']} sessions in {report['elapsed']:.2f}s "
+        f"({report['throughput']:.1f} calls/s, {report['errors']} errors, "
+        f"{sum(report['skipped'].values())} skipped)",
+        f"{'operation':>28} {'count':>6} {'p50 ms':>9} {'p99 ms':>9} {'orig p50':>9} {'errors':>6}",
+    ]
+    for op, stats in report['operations'].items():
+        lines.append(
+            f"{op:>28} {stats['count']:>6} {stats['p50_ms']:>9.3f} {stats['p99_ms']:>9.3f} "
+            f"{stats['original_p50_ms']:>9.3f} {stats['errors']:>6}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a captured workload trace.")
+    parser.add_argument("trace", help="JSON-lines trace written by server.capture")
+    parser.add_argument("--speed", default="1",
+                        help="time scale: 1 for original pacing, 2 for twice as fast, or 'max'")
+    parser.add_argument("--data-dir", help="replay against this data directory (default: a fresh one)")
+    parser.add_argument("--server", metavar="HOST:PORT", help="replay against a running mail server")
+    parser.add_argument("--consumers", type=int, default=2)
+    parser.add_argument("--output", help="write the report as JSON")
+    options = parser.parse_args(argv)
+
+    speed = None if options.speed == "max" else float(options.speed)
+    records = load_trace(options.trace)
+
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        if options.server:
+            host, _, port = options.server.rpartition(":")
+            replayer = Replayer(speed=speed, connect=lambda: RemoteConnection(host or "127.0.0.1", int(port)))
+        else:
+            data_manager = DataManager(options.data_dir or scratch_dir)
+            email_manager = EmailManager(data_manager, consumers=options.consumers)
+            # Replays measure the store, not the rate limits of the original run
+            email_manager.admission = None
+            replayer = Replayer(AuthManager(data_manager), email_manager, speed)
+
+        replayer.prepare(records)
+        report = replayer.run(records)
+
+    print(format_report(report))
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,11 @@
+import time
+STARTED_AT = time.perf_counter()  # Before the other imports, so they are timed too
+
 import tkinter as tk
-from tkinter import messagebox, ttk
+from tkinter import filedialog, messagebox, ttk
 import uuid
+import queue
+import threading
 from datetime import datetime
 import sys,os
 
@@ -9,15 +14,39 @@ if base_dir not in sys.path:
     sys.path.append(base_dir)
 
 from server.auth_manager import AuthManager
+from server.capture import CapturingProxy, WorkloadRecorder
+from server.data_manager import DataManager
 from server.email_manager import EmailManager
+from client.remote_client import RemoteConnection, RemoteAuthManager, RemoteEmailManager
+from client.startup import StartupTimer
+
+startup = StartupTimer(STARTED_AT)
+startup.mark("import")
 
 class ModernEmailClient(tk.Tk):
     def __init__(self):
         super().__init__()
         
-        # Initialize managers
-        self.auth_manager = AuthManager()
-        self.email_manager = EmailManager()
+        # Initialize managers: talk to a mail server when MAIL_SERVER=host:port
+        # is set, otherwise use the in-process managers
+        server_address = os.environ.get("MAIL_SERVER")
+        if server_address:
+            host, _, port = server_address.rpartition(":")
+            connection = RemoteConnection(host or "127.0.0.1", int(port))
+            self.auth_manager = RemoteAuthManager(connection)
+            self.email_manager = RemoteEmailManager(connection)
+        else:
+            # One DataManager shared by both managers; EmailManager starts its
+            # consumer threads on first use, not here
+            data_manager = DataManager()
+            self.auth_manager = AuthManager(data_manager)
+            self.email_manager = EmailManager(data_manager)
+            # MAIL_CAPTURE=<trace file> records this session's workload
+            capture_file = os.environ.get("MAIL_CAPTURE")
+            if capture_file:
+                recorder = WorkloadRecorder(capture_file, redact_bodies=os.environ.get("MAIL_CAPTURE_REDACT") == "1")
+                self.auth_manager = CapturingProxy(self.auth_manager, recorder, "auth")
+                self.email_manager = CapturingProxy(self.email_manager, recorder, "email")
         
         # Setup window
         self.title("Modern Email")
@@ -41,6 +70,15 @@ class ModernEmailClient(tk.Tk):
         
         # Initialize state
         self.current_user = None
+        self.current_folder = None
+        self.email_cards = {}  # email id -> card frame in the open folder
+        self.card_order = []  # (timestamp, id) of rendered cards, newest first
+        self.unread_count = 0
+        self.mail_events = queue.Queue()
+        self.ui_tasks = queue.Queue()  # callables from worker threads, run on the Tk thread
+        self.compose_attachments = []
+        self.uploads_in_progress = 0
+        self.unsubscribe_events = None
         
         # Configure styles
         self.setup_styles()
@@ -49,6 +87,15 @@ class ModernEmailClient(tk.Tk):
         self.show_login_screen()
         
         self.current_draft = None
+        self.draft_saved = False
+        
+        startup.mark("init")
+        # Idle callbacks run after the widgets above have been drawn
+        self.after_idle(self.report_startup)
+    
+    def report_startup(self):
+        startup.mark("first-paint")
+        startup.print_report()
     
     def setup_styles(self):
         # Configure ttk styles
@@ -186,8 +233,9 @@ class ModernEmailClient(tk.Tk):
             ("Trash", "deleted"),
         ]
         
+        self.folder_buttons = {}
         for text, folder in folders:
-            tk.Button(
+            self.folder_buttons[folder] = tk.Button(
                 sidebar,
                 text=text,
                 command=lambda f=folder: self.show_folder(f),
@@ -200,7 +248,11 @@ class ModernEmailClient(tk.Tk):
                 anchor='w',
                 activebackground=self.colors['accent'],
                 activeforeground=self.colors['white']
-            ).pack(fill=tk.X)
+            )
+            self.folder_buttons[folder].pack(fill=tk.X)
+        
+        self.unread_count = 0
+        self.update_unread_badge()
         
         # Logout button at bottom of sidebar
         tk.Button(
@@ -220,11 +272,37 @@ class ModernEmailClient(tk.Tk):
         self.content_frame = tk.Frame(main_container, bg=self.colors['bg'])
         self.content_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=20, pady=20)
         
-        # Show inbox by default
-        self.show_folder("inbox")
+        # Paint the window now and show the inbox once the mailbox index
+        # has been warmed in the background
+        self.loading_label = tk.Label(
+            self.content_frame,
+            text="Loading mailbox...",
+            font=('Helvetica', 12),
+            bg=self.colors['bg'],
+            fg=self.colors['text_light']
+        )
+        self.loading_label.pack(pady=20)
+        username = self.current_user
+        
+        def warm_up():
+            self.email_manager.warm_up()
+            self.ui_tasks.put(lambda: self.mailbox_ready(username))
+        
+        threading.Thread(target=warm_up, daemon=True).start()
+    
+    def mailbox_ready(self, username):
+        if username != self.current_user:
+            return  # Logged out while loading
+        # Cheap now: served from the warmed header cache
+        self.unread_count = self.email_manager.get_unread_count(username)
+        self.update_unread_badge()
+        # Only replace the placeholder; the user may have opened something else
+        if self.loading_label.winfo_exists():
+            self.show_folder("inbox")
     
     def show_compose(self, draft_data=None):
         self.clear_content()
+        self.current_folder = None
         
         compose_frame = tk.Frame(self.content_frame, bg=self.colors['white'], padx=30, pady=30)
         compose_frame.pack(fill=tk.BOTH, expand=True)
@@ -270,7 +348,41 @@ class ModernEmailClient(tk.Tk):
             body_text.delete("1.0", tk.END)
             body_text.insert("1.0", draft_data['body'])
         else:
-            self.current_draft = None
+            # Give new messages an id up front so autosaves update one draft
+            self.current_draft = str(uuid.uuid4())
+        self.draft_saved = bool(draft_data)
+        self.compose_attachments = list((draft_data or {}).get('attachments') or [])
+        
+        # Attachments
+        attachments_frame = tk.Frame(compose_frame, bg=self.colors['white'])
+        attachments_frame.pack(fill=tk.X)
+        attachments_label = tk.Label(
+            attachments_frame,
+            text=self.describe_attachments(),
+            font=('Helvetica', 10),
+            bg=self.colors['white'],
+            fg=self.colors['text_light']
+        )
+        attachments_label.pack(side=tk.LEFT)
+        tk.Button(
+            attachments_frame,
+            text="📎 Attach File",
+            command=lambda: self.attach_file(attachments_label),
+            font=('Helvetica', 11),
+            bg=self.colors['white'],
+            fg=self.colors['primary'],
+            bd=0,
+            padx=10
+        ).pack(side=tk.RIGHT)
+        
+        # Autosave as the user types; the server coalesces these edits
+        autosave = lambda event: self.autosave_draft(
+            recipients_entry.get(),
+            subject_entry.get(),
+            body_text.get("1.0", tk.END)
+        )
+        for widget in (recipients_entry, subject_entry, body_text):
+            widget.bind('<KeyRelease>', autosave)
         
         # Button frame
         button_frame = tk.Frame(compose_frame, bg=self.colors['white'])
@@ -300,16 +412,99 @@ class ModernEmailClient(tk.Tk):
             )
         ).pack(side=tk.LEFT, padx=5)
     
-    def save_draft(self, recipient, subject, body):
-        email_data = {
+    def build_draft(self, recipient, subject, body):
+        return {
             'id': str(uuid.uuid4()) if not self.current_draft else self.current_draft,
             'sender': self.current_user,
             'recipient': recipient,
             'subject': subject,
             'body': body,
             'timestamp': datetime.now().isoformat(),
-            'status': 'draft'
+            'status': 'draft',
+            'attachments': list(self.compose_attachments)
         }
+    
+    def describe_attachments(self):
+        return ", ".join(
+            f"{attachment['filename']} ({self.format_size(attachment['size'])})"
+            for attachment in self.compose_attachments
+        )
+    
+    def format_size(self, size):
+        for unit in ("B", "KB", "MB"):
+            if size < 1024:
+                return f"{size:.0f} {unit}"
+            size /= 1024
+        return f"{size:.1f} GB"
+    
+    def attach_file(self, attachments_label):
+        path = filedialog.askopenfilename()
+        if not path:
+            return
+        
+        draft_id = self.current_draft
+        name = os.path.basename(path)
+        total = os.path.getsize(path)
+        self.uploads_in_progress += 1
+        
+        def show_progress(done):
+            if attachments_label.winfo_exists() and draft_id == self.current_draft:
+                percent = 100 * done // total if total else 100
+                attachments_label.configure(text=f"Uploading {name}... {percent}%")
+        
+        def finish(attachment):
+            self.uploads_in_progress -= 1
+            if draft_id != self.current_draft:
+                return
+            if attachment:
+                self.compose_attachments.append(attachment)
+            else:
+                messagebox.showerror("Error", f"Failed to attach {name}.")
+            if attachments_label.winfo_exists():
+                attachments_label.configure(text=self.describe_attachments())
+        
+        # Upload on a worker thread; progress is handed back to the Tk thread
+        def upload():
+            attachment = self.email_manager.upload_attachment(
+                path,
+                progress=lambda done: self.ui_tasks.put(lambda: show_progress(done))
+            )
+            self.ui_tasks.put(lambda: finish(attachment))
+        
+        threading.Thread(target=upload, daemon=True).start()
+    
+    def save_attachment(self, email_id, attachment, status_label):
+        destination = filedialog.asksaveasfilename(initialfile=attachment['filename'])
+        if not destination:
+            return
+        
+        def show_progress(done):
+            if status_label.winfo_exists():
+                percent = 100 * done // attachment['size'] if attachment['size'] else 100
+                status_label.configure(text=f"Downloading... {percent}%")
+        
+        def finish(ok):
+            if status_label.winfo_exists():
+                status_label.configure(text="Saved" if ok else "Download failed")
+        
+        def download():
+            ok = self.email_manager.download_attachment(
+                self.current_user, email_id, attachment['id'], destination,
+                progress=lambda done: self.ui_tasks.put(lambda: show_progress(done))
+            )
+            self.ui_tasks.put(lambda: finish(ok))
+        
+        threading.Thread(target=download, daemon=True).start()
+    
+    def autosave_draft(self, recipient, subject, body):
+        # Nothing worth keeping while only the placeholders are showing
+        if recipient in ("", "To:") and subject in ("", "Subject:") and not body.strip():
+            return
+        if self.email_manager.autosave_draft(self.build_draft(recipient, subject, body)):
+            self.draft_saved = True
+    
+    def save_draft(self, recipient, subject, body):
+        email_data = self.build_draft(recipient, subject, body)
         
         if self.email_manager.save_draft(email_data):
             messagebox.showinfo("Success", "Draft saved successfully!")
@@ -319,9 +514,12 @@ class ModernEmailClient(tk.Tk):
     
     def show_folder(self, folder):
         self.clear_content()
+        self.current_folder = folder
+        self.email_cards = {}
+        self.card_order = []
         
-        folder_frame = tk.Frame(self.content_frame, bg=self.colors['bg'])
-        folder_frame.pack(fill=tk.BOTH, expand=True)
+        self.folder_frame = tk.Frame(self.content_frame, bg=self.colors['bg'])
+        self.folder_frame.pack(fill=tk.BOTH, expand=True)
         
         # Title with folder icon
         folder_icons = {
@@ -333,87 +531,272 @@ class ModernEmailClient(tk.Tk):
         
         title = f"{folder_icons.get(folder, '')} {folder.title()}"
         tk.Label(
-            folder_frame,
+            self.folder_frame,
             text=title,
             font=('Helvetica', 20, 'bold'),
             bg=self.colors['bg'],
             fg=self.colors['text']
         ).pack(anchor='w', pady=(0, 20))
         
-        # Get emails
-        emails = self.email_manager.get_user_emails(self.current_user, folder)
+        # Empty state message, shown while the folder has no cards
+        self.empty_label = tk.Label(
+            self.folder_frame,
+            text=f"No emails in {folder}",
+            font=('Helvetica', 12),
+            bg=self.colors['bg'],
+            fg=self.colors['text_light']
+        )
+        
+        # Get message summaries (already sorted newest first); bodies are
+        # only fetched when a message is opened
+        emails = self.email_manager.list_headers(self.current_user, folder)
         
         if not emails:
-            # Show empty state message
-            tk.Label(
-                folder_frame,
-                text=f"No emails in {folder}",
-                font=('Helvetica', 12),
-                bg=self.colors['bg'],
-                fg=self.colors['text_light']
-            ).pack(pady=20)
+            self.empty_label.pack(pady=20)
             return
         
         # Email list
         for email in emails:
-            email_card = tk.Frame(
-                folder_frame,
-                bg=self.colors['white'],
-                padx=20,
-                pady=15
-            )
+            self.add_email_card(email)
+    
+    def add_email_card(self, email):
+        folder = self.current_folder
+        key = (email['timestamp'], email['id'])
+        
+        # Keep cards ordered newest first without re-rendering the list
+        position = 0
+        while position < len(self.card_order) and self.card_order[position] > key:
+            position += 1
+        self.card_order.insert(position, key)
+        
+        email_card = tk.Frame(
+            self.folder_frame,
+            bg=self.colors['white'],
+            padx=20,
+            pady=15
+        )
+        if position + 1 < len(self.card_order):
+            email_card.pack(fill=tk.X, pady=5, before=self.email_cards[self.card_order[position + 1][1]])
+        else:
             email_card.pack(fill=tk.X, pady=5)
-            
-            # Sender/Subject
+        self.email_cards[email['id']] = email_card
+        self.empty_label.pack_forget()
+        
+        # Sender/Subject
+        tk.Label(
+            email_card,
+            text=email['sender'],
+            font=('Helvetica', 12, 'bold'),
+            bg=self.colors['white'],
+            fg=self.colors['text']
+        ).pack(anchor='w')
+        
+        tk.Label(
+            email_card,
+            text=email['subject'],
+            font=('Helvetica', 11),
+            bg=self.colors['white'],
+            fg=self.colors['text_light']
+        ).pack(anchor='w')
+        
+        if email.get('snippet'):
             tk.Label(
                 email_card,
-                text=email['sender'],
-                font=('Helvetica', 12, 'bold'),
+                text=email['snippet'],
+                font=('Helvetica', 10),
                 bg=self.colors['white'],
-                fg=self.colors['text']
+                fg=self.colors['text_light']
             ).pack(anchor='w')
-            
+        
+        # Action buttons
+        button_frame = tk.Frame(email_card, bg=self.colors['white'])
+        button_frame.pack(side=tk.RIGHT)
+        
+        if folder == "draft":
+            # Edit button for drafts
+            tk.Button(
+                button_frame,
+                text="Edit",
+                command=lambda eid=email['id']: self.edit_draft(eid),
+                font=('Helvetica', 11),
+                bg=self.colors['white'],
+                fg=self.colors['primary'],
+                bd=0,
+                padx=10
+            ).pack(side=tk.RIGHT)
+        
+        else:
+            # Open button loads the full message
+            tk.Button(
+                button_frame,
+                text="Open",
+                command=lambda eid=email['id']: self.show_message(eid),
+                font=('Helvetica', 11),
+                bg=self.colors['white'],
+                fg=self.colors['primary'],
+                bd=0,
+                padx=10
+            ).pack(side=tk.RIGHT)
+        
+        # Delete button
+        tk.Button(
+            button_frame,
+            text="Delete",
+            command=lambda eid=email['id']: (
+                self.email_manager.delete_draft(self.current_user, eid)
+                if folder == "draft"
+                else self.delete_email(eid)
+            ),
+            font=('Helvetica', 11),
+            bg=self.colors['white'],
+            fg=self.colors['text_light'],
+            bd=0,
+            padx=10
+        ).pack(side=tk.RIGHT)
+    
+    def edit_draft(self, email_id):
+        draft = self.email_manager.get_message(self.current_user, email_id)
+        if draft:
+            self.show_compose(draft)
+        else:
+            messagebox.showerror("Error", "Draft not found.")
+    
+    def show_message(self, email_id):
+        email = self.email_manager.get_message(self.current_user, email_id)
+        if not email:
+            messagebox.showerror("Error", "Email not found.")
+            return
+        
+        folder = self.current_folder
+        self.clear_content()
+        self.current_folder = None
+        
+        message_frame = tk.Frame(self.content_frame, bg=self.colors['white'], padx=30, pady=30)
+        message_frame.pack(fill=tk.BOTH, expand=True)
+        
+        tk.Label(
+            message_frame,
+            text=email['subject'],
+            font=('Helvetica', 20, 'bold'),
+            bg=self.colors['white'],
+            fg=self.colors['text']
+        ).pack(anchor='w', pady=(0, 10))
+        
+        tk.Label(
+            message_frame,
+            text=f"From: {email['sender']}    To: {email['recipient']}    {email['timestamp'][:16].replace('T', ' ')}",
+            font=('Helvetica', 11),
+            bg=self.colors['white'],
+            fg=self.colors['text_light']
+        ).pack(anchor='w', pady=(0, 20))
+        
+        body_text = tk.Text(
+            message_frame,
+            font=('Helvetica', 11),
+            wrap=tk.WORD,
+            bd=0,
+            padx=10,
+            pady=10
+        )
+        body_text.insert("1.0", email.get('body', ''))
+        body_text.configure(state=tk.DISABLED)
+        body_text.pack(fill=tk.BOTH, expand=True)
+        
+        for attachment in email.get('attachments') or []:
+            attachment_row = tk.Frame(message_frame, bg=self.colors['white'])
+            attachment_row.pack(fill=tk.X, pady=(5, 0))
             tk.Label(
-                email_card,
-                text=email['subject'],
+                attachment_row,
+                text=f"📎 {attachment['filename']} ({self.format_size(attachment['size'])})",
                 font=('Helvetica', 11),
                 bg=self.colors['white'],
+                fg=self.colors['text']
+            ).pack(side=tk.LEFT)
+            status_label = tk.Label(
+                attachment_row,
+                font=('Helvetica', 10),
+                bg=self.colors['white'],
                 fg=self.colors['text_light']
-            ).pack(anchor='w')
-            
-            # Action buttons
-            button_frame = tk.Frame(email_card, bg=self.colors['white'])
-            button_frame.pack(side=tk.RIGHT)
-            
-            if folder == "draft":
-                # Edit button for drafts
-                tk.Button(
-                    button_frame,
-                    text="Edit",
-                    command=lambda e=email: self.show_compose(e),
-                    font=('Helvetica', 11),
-                    bg=self.colors['white'],
-                    fg=self.colors['primary'],
-                    bd=0,
-                    padx=10
-                ).pack(side=tk.RIGHT)
-            
-            # Delete button
+            )
+            status_label.pack(side=tk.RIGHT)
             tk.Button(
-                button_frame,
-                text="Delete",
-                command=lambda eid=email['id']: (
-                    self.email_manager.delete_draft(self.current_user, eid)
-                    if folder == "draft"
-                    else self.delete_email(eid)
-                ),
+                attachment_row,
+                text="Save",
+                command=lambda a=attachment, l=status_label: self.save_attachment(email_id, a, l),
                 font=('Helvetica', 11),
                 bg=self.colors['white'],
-                fg=self.colors['text_light'],
+                fg=self.colors['primary'],
                 bd=0,
                 padx=10
             ).pack(side=tk.RIGHT)
         
+        ttk.Button(
+            message_frame,
+            text="Back",
+            style='Modern.TButton',
+            command=lambda: self.show_folder(folder or "inbox")
+        ).pack(anchor='w', pady=(20, 0))
+        
+        if email['status'] == 'inbox' and not email.get('read', False):
+            self.email_manager.mark_as_read(self.current_user, email_id)
+    
+    def remove_email_card(self, email_id):
+        card = self.email_cards.pop(email_id, None)
+        if card is None:
+            return
+        card.destroy()
+        self.card_order = [key for key in self.card_order if key[1] != email_id]
+        if not self.card_order:
+            self.empty_label.pack(pady=20)
+    
+    def update_unread_badge(self):
+        text = f"Inbox ({self.unread_count})" if self.unread_count else "Inbox"
+        self.folder_buttons["inbox"].configure(text=text)
+    
+    def process_mail_events(self):
+        # Drain change events pushed by the email manager; nothing here
+        # touches the store, so an idle session costs no I/O.
+        if self.current_user is None:
+            return
+        while True:
+            try:
+                event = self.mail_events.get_nowait()
+            except queue.Empty:
+                break
+            self.apply_mail_event(event)
+        while True:
+            try:
+                task = self.ui_tasks.get_nowait()
+            except queue.Empty:
+                break
+            task()
+        self.after(200, self.process_mail_events)
+    
+    def apply_mail_event(self, event):
+        email = event.get('email') or {}
+        is_unread = email.get('status') == 'inbox' and not email.get('read', False)
+        
+        if event['type'] == 'new':
+            was_unread = False
+        elif event['type'] in ('status', 'updated'):
+            was_unread = event['previous_status'] == 'inbox' and not event['previous_read']
+        else:  # deleted
+            was_unread = is_unread
+            is_unread = False
+        
+        if is_unread != was_unread:
+            self.unread_count += 1 if is_unread else -1
+            self.update_unread_badge()
+        
+        if self.current_folder is None:
+            return
+        
+        in_folder = event['type'] != 'deleted' and email.get('status') == self.current_folder
+        if event['id'] in self.email_cards and (not in_folder or event['type'] == 'updated'):
+            self.remove_email_card(event['id'])
+        if in_folder and event['id'] not in self.email_cards:
+            self.add_email_card(email)
+        
     def clear_window(self):
         for widget in self.winfo_children():
             widget.destroy()
@@ -426,6 +809,9 @@ class ModernEmailClient(tk.Tk):
         if not recipient or not subject or not body:
             messagebox.showerror("Error", "All fields are required.")
             return
+        if self.uploads_in_progress:
+            messagebox.showerror("Error", "Please wait for attachments to finish uploading.")
+            return
         
         email_data = {
             'id': str(uuid.uuid4()),
@@ -434,16 +820,26 @@ class ModernEmailClient(tk.Tk):
             'subject': subject,
             'body': body,
             'timestamp': datetime.now().isoformat(),
-            'status': 'sent'
+            'status': 'sent',
+            'attachments': list(self.compose_attachments)
         }
         
-        self.email_manager.email_queue.put(("send_email", email_data))
+        result = self.email_manager.enqueue("send_email", email_data)
+        if not result:
+            # Rejected by admission control; nothing was queued, keep the draft
+            retry_after = getattr(result, 'seconds', None)
+            wait = f" Please try again in {max(1, round(retry_after))} seconds." if retry_after else ""
+            messagebox.showerror("Error", f"Email not sent: the server is busy.{wait}")
+            return
+        if self.current_draft and self.draft_saved:
+            # The message went out, so its draft (and any pending autosave) goes
+            self.email_manager.delete_draft(self.current_user, self.current_draft)
+            self.draft_saved = False
         messagebox.showinfo("Success", "Email sent successfully!")
         
     def delete_email(self, email_id):
         if self.email_manager.move_to_trash(self.current_user, email_id):
             messagebox.showinfo("Success", "Email moved to trash.")
-            self.show_folder("inbox")  # Refresh the inbox
         else:
             messagebox.showerror("Error", "Email not found.")
         
@@ -453,7 +849,9 @@ class ModernEmailClient(tk.Tk):
         
         if self.auth_manager.login(username, password):
             self.current_user = username
+            self.unsubscribe_events = self.email_manager.subscribe(username, self.mail_events.put)
             self.show_main_screen()
+            self.process_mail_events()
         else:
             messagebox.showerror("Error", "Invalid credentials.")
     
@@ -467,7 +865,11 @@ class ModernEmailClient(tk.Tk):
             messagebox.showerror("Error", "Username already exists.")
 
     def logout(self):
+        if self.unsubscribe_events:
+            self.unsubscribe_events()
+            self.unsubscribe_events = None
         self.current_user = None
+        self.current_folder = None
         self.show_login_screen()
 
 if __name__ == "__main__":
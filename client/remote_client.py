@@ -0,0 +1,272 @@
+import base64
+import hashlib
+import json
+import socket
+import threading
+from pathlib import Path
+from server.admission import RetryAfter
+# Uploads use the server's chunk size, so a file uploaded remotely shares
+# its chunks with the same file uploaded locally. Base64-encoded, a chunk
+# still fits well inside the server's line limit.
+from server.chunk_store import CHUNK_SIZE
+
+# Thin client for server.network_server. RemoteAuthManager and
+# RemoteEmailManager expose the same methods as the in-process managers,
+# so the UI can use either without changes.
+
+
+class RemoteError(Exception):
+    pass
+
+
+class RemoteConnection:
+    def __init__(self, host="127.0.0.1", port=8025, timeout=30):
+        self.timeout = timeout
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.settimeout(None)
+        self.file = self.sock.makefile("rb")
+        self.send_lock = threading.Lock()
+        self.pending = {}  # request id -> [threading.Event, response]
+        self.pending_lock = threading.Lock()
+        self.next_id = 0
+        self.event_handlers = []
+        self.closed = False
+
+        self.reader = threading.Thread(target=self.read_loop)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def request(self, op, *args):
+        with self.pending_lock:
+            if self.closed:
+                raise RemoteError("connection closed")
+            self.next_id += 1
+            request_id = self.next_id
+            slot = [threading.Event(), None]
+            self.pending[request_id] = slot
+
+        line = json.dumps({"id": request_id, "op": op, "args": list(args)}).encode() + b"\n"
+        try:
+            with self.send_lock:
+                self.sock.sendall(line)
+            if not slot[0].wait(self.timeout):
+                raise RemoteError(f"{op} timed out")
+        finally:
+            with self.pending_lock:
+                self.pending.pop(request_id, None)
+
+        response = slot[1]
+        if response is None:
+            raise RemoteError("connection closed")
+        if not response.get("ok"):
+            raise RemoteError(response.get("error"))
+        return response.get("result")
+
+    def read_loop(self):
+        try:
+            for line in self.file:
+                message = json.loads(line)
+                if "event" in message:
+                    for handler in list(self.event_handlers):
+                        handler(message["event"])
+                    continue
+                with self.pending_lock:
+                    slot = self.pending.get(message.get("id"))
+                if slot:
+                    slot[1] = message
+                    slot[0].set()
+        except (OSError, ValueError) as e:
+            if not self.closed:
+                print(f"Error reading from mail server: {e}")
+        finally:
+            # Wake anyone still waiting so they see the closed connection
+            with self.pending_lock:
+                self.closed = True
+                for slot in self.pending.values():
+                    slot[0].set()
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class RemoteAuthManager:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def register(self, username, password):
+        try:
+            return self.connection.request("register", username, password)
+        except Exception as e:
+            print(f"Error during registration: {e}")
+            return False
+
+    def login(self, username, password):
+        try:
+            return self.connection.request("login", username, password)
+        except Exception as e:
+            print(f"Error during login: {e}")
+            return False
+
+
+class RemoteEmailManager:
+    def __init__(self, connection):
+        self.connection = connection
+        self.subscribers = {}  # username -> list of event callbacks
+        self.subscribers_lock = threading.Lock()
+        connection.event_handlers.append(self._dispatch_event)
+
+    def _call(self, default, op, *args):
+        try:
+            return self.connection.request(op, *args)
+        except Exception as e:
+            print(f"Error calling {op} on mail server: {e}")
+            return default
+
+    def subscribe(self, username, callback):
+        # The server pushes events for the logged-in user over the connection
+        with self.subscribers_lock:
+            self.subscribers.setdefault(username, []).append(callback)
+        return lambda: self.unsubscribe(username, callback)
+
+    def unsubscribe(self, username, callback):
+        with self.subscribers_lock:
+            callbacks = self.subscribers.get(username, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self.subscribers.pop(username, None)
+
+    def _dispatch_event(self, event):
+        # The server only pushes events for the session's logged-in user
+        with self.subscribers_lock:
+            callbacks = [cb for cbs in self.subscribers.values() for cb in cbs]
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Error delivering event: {e}")
+
+    def _admitted_call(self, default, op, *args):
+        # For operations admission control can reject: the server sends the
+        # rejection as a dict, returned here as the falsy RetryAfter
+        result = self._call(default, op, *args)
+        if isinstance(result, dict) and 'retry_after' in result:
+            return RetryAfter(result['retry_after'], result['reason'])
+        return result
+
+    def enqueue(self, action, *args):
+        return self._admitted_call(False, "enqueue", action, *args)
+
+    def get_user_emails(self, username, folder=None):
+        return self._call([], "get_user_emails", username, folder)
+
+    def list_headers(self, username, folder=None):
+        return self._call([], "list_headers", username, folder)
+
+    def get_message(self, username, email_id):
+        return self._call(None, "get_message", username, email_id)
+
+    def get_threads(self, username, folder='inbox', page=1, page_size=20):
+        return self._call([], "get_threads", username, folder, page, page_size)
+
+    def get_thread_messages(self, username, thread_id, folder=None):
+        return self._call([], "get_thread_messages", username, thread_id, folder)
+
+    def get_unread_count(self, username):
+        return self._call(0, "get_unread_count", username)
+
+    def move_to_trash(self, username, email_id):
+        return self._admitted_call(False, "move_to_trash", username, email_id)
+
+    def mark_as_read(self, username, email_id):
+        return self._admitted_call(False, "mark_as_read", username, email_id)
+
+    def save_draft(self, email_data):
+        return self._admitted_call(False, "save_draft", email_data)
+
+    def schedule_send(self, email_data, send_at):
+        if hasattr(send_at, 'timestamp'):
+            send_at = send_at.timestamp()
+        return self._admitted_call(None, "schedule_send", email_data, send_at)
+
+    def snooze(self, username, email_id, until):
+        if hasattr(until, 'timestamp'):
+            until = until.timestamp()
+        return self._admitted_call(False, "snooze", username, email_id, until)
+
+    def autosave_draft(self, email_data):
+        return self._admitted_call(False, "autosave_draft", email_data)
+
+    def upload_attachment(self, source, filename=None, content_type=None, progress=None):
+        # Two passes over the local file: hash every chunk, ask the server
+        # which ones it lacks, then send only those
+        try:
+            path = Path(source)
+            digests = []
+            with open(path, 'rb') as f:
+                for data in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digests.append(hashlib.sha256(data).hexdigest())
+            missing = set(self.connection.request("missing_chunks", digests))
+
+            file_hash = hashlib.sha256()
+            done = 0
+            with open(path, 'rb') as f:
+                for digest in digests:
+                    data = f.read(CHUNK_SIZE)
+                    file_hash.update(data)
+                    if digest in missing:
+                        self.connection.request("put_chunk", base64.b64encode(data).decode())
+                        missing.discard(digest)
+                    done += len(data)
+                    if progress:
+                        progress(done)
+            return self.connection.request(
+                "commit_attachment", filename or path.name, content_type, digests, file_hash.hexdigest()
+            )
+        except Exception as e:
+            print(f"Error uploading attachment {source}: {e}")
+            return None
+
+    def get_metrics(self, format="json"):
+        # The server's metrics snapshot; format is "json" or "prometheus"
+        return self._call(None, "metrics", format)
+
+    def profile(self, kind, value=None):
+        # Trigger server-side profiling; returns the dump path
+        return self._call(None, "profile", kind, value)
+
+    def warm_up(self):
+        # The server keeps its own index warm
+        pass
+
+    def get_attachment(self, username, email_id, attachment_id):
+        return self._call(None, "get_attachment", username, email_id, attachment_id)
+
+    def download_attachment(self, username, email_id, attachment_id, destination, progress=None):
+        try:
+            attachment = self.connection.request("get_attachment", username, email_id, attachment_id)
+            if attachment is None:
+                return False
+            done = 0
+            with open(destination, 'wb') as f:
+                for index in range(len(attachment['chunks'])):
+                    encoded = self.connection.request(
+                        "get_attachment_chunk", username, email_id, attachment_id, index
+                    )
+                    data = base64.b64decode(encoded)
+                    f.write(data)
+                    done += len(data)
+                    if progress:
+                        progress(done)
+            return True
+        except Exception as e:
+            print(f"Error downloading attachment {attachment_id}: {e}")
+            return False
+
+    def delete_draft(self, username, email_id):
+        return self._admitted_call(False, "delete_draft", username, email_id)
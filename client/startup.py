@@ -0,0 +1,27 @@
+import sys
+import time
+
+
+class StartupTimer:
+    # Records how long each startup phase took, measured from `start`
+    # (a time.perf_counter() value taken before the first import).
+
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.last = self.start
+        self.phases = []  # (phase name, seconds)
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def total(self):
+        return self.last - self.start
+
+    def report(self):
+        parts = [f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in self.phases]
+        return f"Startup: {', '.join(parts)} (total {self.total() * 1000:.1f} ms)"
+
+    def print_report(self, file=None):
+        print(self.report(), file=file or sys.stderr)
@@ -0,0 +1,3 @@
+from server.network_server import main
+
+main()
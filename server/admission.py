@@ -0,0 +1,186 @@
+import queue
+import threading
+import time
+from array import array
+
+# Per-user limits: a bucket holds up to `burst` tokens and regains `rate`
+# tokens per second; every admitted task spends one
+SEND_BURST = 20
+SEND_RATE = 1.0
+MUTATION_BURST = 50
+MUTATION_RATE = 5.0
+
+# Suggested wait when the global cap or a full queue lane rejects a task
+BUSY_RETRY_AFTER = 0.5
+
+# Bucket each action draws from, and the user it is charged to. Queue
+# actions are charged on enqueue; the others are operations EmailManager
+# runs directly, charged when they are called.
+ACTION_BUCKETS = {
+    "send_email": "send",
+    "move_to_trash": "mutation",
+    "save_draft": "mutation",
+    "mark_as_read": "mutation",
+    "delete_draft": "mutation",
+    "autosave_draft": "mutation",
+    "snooze": "mutation",
+    "schedule_send": "send",
+}
+TASK_USERS = {
+    "send_email": lambda args: args[0]['sender'],
+    "move_to_trash": lambda args: args[0],
+    "save_draft": lambda args: args[0]['sender'],
+}
+ACTION_USERS = dict(
+    TASK_USERS,
+    mark_as_read=lambda args: args[0],
+    delete_draft=lambda args: args[0],
+    autosave_draft=lambda args: args[0]['sender'],
+    snooze=lambda args: args[0],
+    schedule_send=lambda args: args[0]['sender'],
+)
+
+
+class RetryAfter:
+    # Result of a rejected enqueue. It is falsy, so callers that only check
+    # `if enqueue(...)` treat it as a failure; `seconds` says when to retry.
+    __slots__ = ('seconds', 'reason')
+
+    def __init__(self, seconds, reason):
+        self.seconds = seconds
+        self.reason = reason
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return f"RetryAfter({self.seconds:.2f}, {self.reason!r})"
+
+    def to_dict(self):
+        return {'retry_after': self.seconds, 'reason': self.reason}
+
+
+class TokenBuckets:
+    # One token bucket per key, stored as two parallel float arrays indexed
+    # through a dict of slots. Buckets refill lazily from the elapsed time
+    # when they are checked, so there is no timer and take() is O(1) and
+    # creates no containers once a key has its slot.
+
+    def __init__(self, burst, rate):
+        self.burst = float(burst)
+        self.rate = float(rate)
+        self.slots = {}  # key -> index into the arrays
+        self.tokens = array('d')
+        self.updated = array('d')  # time.monotonic() of the last refill
+        self.prune_at = 1024
+
+    def take(self, key, now):
+        # Spend one token; returns 0.0 if there was one, otherwise the
+        # seconds until there will be
+        slot = self.slots.get(key)
+        if slot is None:
+            if len(self.slots) >= self.prune_at:
+                self.prune(now)
+            slot = self.slots[key] = len(self.tokens)
+            self.tokens.append(self.burst)
+            self.updated.append(now)
+        tokens = min(self.burst, self.tokens[slot] + (now - self.updated[slot]) * self.rate)
+        self.updated[slot] = now
+        if tokens >= 1.0:
+            self.tokens[slot] = tokens - 1.0
+            return 0.0
+        self.tokens[slot] = tokens
+        return (1.0 - tokens) / self.rate
+
+    def refund(self, key):
+        slot = self.slots.get(key)
+        if slot is not None:
+            self.tokens[slot] = min(self.burst, self.tokens[slot] + 1.0)
+
+    def prune(self, now):
+        # Drop buckets that have refilled completely: they behave exactly
+        # like a new bucket, so forgetting them changes nothing
+        keep = [
+            (key, self.tokens[slot], self.updated[slot])
+            for key, slot in self.slots.items()
+            if self.tokens[slot] + (now - self.updated[slot]) * self.rate < self.burst
+        ]
+        self.slots = {key: index for index, (key, _, _) in enumerate(keep)}
+        self.tokens = array('d', (tokens for _, tokens, _ in keep))
+        self.updated = array('d', (updated for _, _, updated in keep))
+        # Don't prune again until the table has doubled
+        self.prune_at = max(1024, 2 * len(self.slots))
+
+
+class AdmissionController:
+    # Decides whether a queue task may be enqueued: the user's token bucket
+    # for the action must have a token, and fewer than max_in_flight tasks
+    # may be queued or running. max_in_flight=None caps them at the total
+    # capacity of the queue's lanes, so the cap is reached under load
+    # spread across lanes while a single full lane still reports "queue
+    # full". Rejections return RetryAfter immediately rather than making
+    # the caller wait for space.
+
+    def __init__(self, send_burst=SEND_BURST, send_rate=SEND_RATE,
+                 mutation_burst=MUTATION_BURST, mutation_rate=MUTATION_RATE,
+                 max_in_flight=None):
+        self.buckets = {
+            "send": TokenBuckets(send_burst, send_rate),
+            "mutation": TokenBuckets(mutation_burst, mutation_rate),
+        }
+        self.max_in_flight = max_in_flight
+        self.lock = threading.Lock()
+
+    def admit(self, action, args, in_flight, max_in_flight=None):
+        # Returns None if the task may be enqueued, otherwise RetryAfter
+        with self.lock:
+            return self._admit(action, args, in_flight, max_in_flight)
+
+    def _admit(self, action, args, in_flight, max_in_flight=None):
+        # Called with self.lock held
+        cap = self.max_in_flight if self.max_in_flight is not None else max_in_flight
+        if cap is not None and in_flight >= cap:
+            return RetryAfter(BUSY_RETRY_AFTER, "busy")
+        return self._take(action, args)
+
+    def charge(self, action, args):
+        # Rate-limit an operation that runs directly rather than through
+        # the queue, so it has no in-flight cap. Returns None or RetryAfter.
+        with self.lock:
+            return self._take(action, args)
+
+    def _take(self, action, args):
+        # Called with self.lock held
+        bucket = ACTION_BUCKETS.get(action)
+        if bucket is None:
+            return None
+        wait = self.buckets[bucket].take(ACTION_USERS[action](args), time.monotonic())
+        if wait:
+            return RetryAfter(wait, "rate limited")
+        return None
+
+    def submit(self, task_queue, action, args, lane=None):
+        # Admit a task and put it on task_queue without blocking, as one
+        # step under the lock, so concurrent callers can't all pass the
+        # in-flight check for the last free slot. Returns None if the task
+        # was enqueued, otherwise RetryAfter.
+        with self.lock:
+            rejected = self._admit(action, args, task_queue.unfinished_tasks, task_queue.capacity())
+            if rejected is not None:
+                return rejected
+            try:
+                task_queue.put_nowait((action, *args), lane=lane)
+            except queue.Full:
+                self._refund(action, args)
+                return RetryAfter(BUSY_RETRY_AFTER, "queue full")
+        return None
+
+    def refund(self, action, args):
+        # Give back the token of a task that was admitted but not enqueued
+        with self.lock:
+            self._refund(action, args)
+
+    def _refund(self, action, args):
+        bucket = ACTION_BUCKETS.get(action)
+        if bucket is not None:
+            self.buckets[bucket].refund(ACTION_USERS[action](args))
@@ -1,28 +1,32 @@
 from datetime import datetime
 from server.data_manager import DataManager
+from server.metrics import metrics
 
 class AuthManager:
-    def __init__(self):
-        self.data_manager = DataManager()
+    def __init__(self, data_manager=None):
+        self.data_manager = data_manager or DataManager()
     
+    @metrics.instrument("auth")
     def register(self, username, password):
         try:
-            users = self.data_manager.load_data(self.data_manager.users_file) or {}
-            
-            if username in users:
-                return False
-            
-            users[username] = {
-                'password': password,
-                'created_at': datetime.now().isoformat()
-            }
-            self.data_manager.save_data(self.data_manager.users_file, users)
-            return True
+            with self.data_manager.lock(self.data_manager.users_file):
+                users = self.data_manager.load_data(self.data_manager.users_file) or {}
+                
+                if username in users:
+                    return False
+                
+                users[username] = {
+                    'password': password,
+                    'created_at': datetime.now().isoformat()
+                }
+                self.data_manager.save_data(self.data_manager.users_file, users)
+                return True
         
         except Exception as e:
             print(f"Error during registration: {e}")
             return False
     
+    @metrics.instrument("auth")
     def login(self, username, password):
         try:
             users = self.data_manager.load_data(self.data_manager.users_file) or {}
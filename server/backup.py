@@ -0,0 +1,42 @@
+import argparse
+import sys
+
+from server.data_manager import DataManager
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Snapshot or restore a mail data directory.")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--backup-dir", default="backups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("snapshot", help="take a snapshot (incremental after the first)")
+    commands.add_parser("list", help="list complete snapshots")
+    restore = commands.add_parser("restore", help="restore a snapshot; stop the server first")
+    restore.add_argument("snapshot", nargs="?", help="snapshot id (default: the latest)")
+    restore.add_argument("--no-verify", action="store_true", help="skip checking file digests")
+    options = parser.parse_args(argv)
+
+    data_manager = DataManager(options.data_dir)
+    if options.command == "snapshot":
+        path = data_manager.snapshot(options.backup_dir)
+        if path is None:
+            return 1
+        print(path)
+    elif options.command == "list":
+        for path in data_manager.list_snapshots(options.backup_dir):
+            print(path.name)
+    else:
+        snapshots = data_manager.list_snapshots(options.backup_dir)
+        if options.snapshot:
+            snapshots = [path for path in snapshots if path.name == options.snapshot]
+        if not snapshots:
+            print("No such snapshot")
+            return 1
+        if not data_manager.restore(snapshots[-1], verify=not options.no_verify):
+            return 1
+        print(f"Restored {snapshots[-1].name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
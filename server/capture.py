@@ -0,0 +1,122 @@
+import contextvars
+import json
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+DEFAULT_TRACE_FILE = Path("data") / "trace.jsonl"
+
+# Methods that take callbacks or file objects, or are internal plumbing;
+# they pass straight through without being recorded
+NOT_RECORDED = {
+    "subscribe", "unsubscribe", "ensure_consumers", "start_consumers", "process_queue",
+    "upload_attachment", "download_attachment", "iter_attachment",
+    "put_chunk", "get_chunk", "missing_chunks", "commit_attachment", "get_attachment_chunk",
+    "owned_chunks",
+}
+
+# Argument positions holding passwords, per auth operation
+PASSWORD_ARGS = {"register": 1, "login": 1}
+REDACTED = "***"
+
+# The client session a call is made for. The network server sets it for
+# each connection; records made outside one fall back to the thread name.
+current_session = contextvars.ContextVar("current_session", default=None)
+
+
+def _json_default(value):
+    # Times are stored as Unix timestamps, which the managers also accept
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return str(value)
+
+
+def _redact_bodies(value):
+    # Replace message bodies with filler of the same length, so replays
+    # still move the same number of bytes
+    if isinstance(value, dict):
+        return {
+            key: ("x" * len(item) if key == 'body' and isinstance(item, str) else _redact_bodies(item))
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [_redact_bodies(item) for item in value]
+    return value
+
+
+class WorkloadRecorder:
+    # Appends one JSON line per manager call: start offset from the start
+    # of the capture, session, the user that session was logged in as,
+    # component, operation, arguments, duration and whether it raised.
+    # Passwords are always redacted; message bodies too when redact_bodies
+    # is set.
+
+    def __init__(self, trace_file=DEFAULT_TRACE_FILE, redact_bodies=False):
+        self.trace_file = Path(trace_file)
+        self.redact_bodies = redact_bodies
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.trace_file.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.trace_file, 'a')
+
+    def record(self, component, op, args, kwargs, started, duration, error):
+        args = list(args)
+        if component == "auth" and op in PASSWORD_ARGS and len(args) > PASSWORD_ARGS[op]:
+            args[PASSWORD_ARGS[op]] = REDACTED
+        if self.redact_bodies:
+            args = _redact_bodies(args)
+            kwargs = _redact_bodies(kwargs)
+        session = current_session.get()
+        record = {
+            't': round(started - self.started, 6),
+            'session': f"session-{session.id}" if session is not None else threading.current_thread().name,
+            'user': session.username if session is not None else None,
+            'component': component,
+            'op': op,
+            'args': args,
+            'kwargs': kwargs,
+            'duration': round(duration, 6),
+            'error': error,
+        }
+        try:
+            line = json.dumps(record, separators=(',', ':'), default=_json_default)
+            with self.lock:
+                self.file.write(line + "\n")
+                self.file.flush()
+        except Exception as e:
+            print(f"Error writing trace record for {op}: {e}")
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class CapturingProxy:
+    # Stands in for an AuthManager or EmailManager and records every public
+    # method call through it. Attributes and unrecorded methods are passed
+    # through, so the proxy can be used anywhere the manager is.
+
+    def __init__(self, manager, recorder, component):
+        self._manager = manager
+        self._recorder = recorder
+        self._component = component
+
+    def __getattr__(self, name):
+        attribute = getattr(self._manager, name)
+        if name.startswith('_') or name in NOT_RECORDED or not callable(attribute):
+            return attribute
+
+        def recorded(*args, **kwargs):
+            started = time.perf_counter()
+            error = False
+            try:
+                return attribute(*args, **kwargs)
+            except Exception:
+                error = True
+                raise
+            finally:
+                self._recorder.record(
+                    self._component, name, args, kwargs, started, time.perf_counter() - started, error
+                )
+        return recorded
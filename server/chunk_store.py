@@ -0,0 +1,71 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024  # 1 MiB
+
+
+class ChunkStore:
+    # Content-addressed storage for attachment data. Files are split into
+    # fixed-size chunks stored once under their SHA-256 digest, so identical
+    # chunks are shared by every message and recipient that references them,
+    # and no file ever needs to be held in memory as a whole.
+
+    def __init__(self, root, chunk_size=CHUNK_SIZE):
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+
+    def chunk_path(self, digest):
+        if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+            raise ValueError(f"invalid chunk digest {digest!r}")
+        return self.root / digest[:2] / digest
+
+    def has_chunk(self, digest):
+        return self.chunk_path(digest).exists()
+
+    def put_chunk(self, data):
+        if len(data) > self.chunk_size:
+            raise ValueError(f"chunk of {len(data)} bytes exceeds the {self.chunk_size} byte chunk size")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        if path.exists():
+            return digest  # Already stored: deduplicated
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = Path(f"{path}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        return digest
+
+    def get_chunk(self, digest):
+        with open(self.chunk_path(digest), 'rb') as f:
+            return f.read()
+
+    def chunk_size_of(self, digest):
+        return self.chunk_path(digest).stat().st_size
+
+    def put_stream(self, fileobj, progress=None):
+        # Store a file chunk by chunk; returns (digests, size, file sha256).
+        # progress(bytes_done) is called after each chunk.
+        digests = []
+        size = 0
+        file_hash = hashlib.sha256()
+        while True:
+            data = fileobj.read(self.chunk_size)
+            if not data:
+                break
+            digests.append(self.put_chunk(data))
+            file_hash.update(data)
+            size += len(data)
+            if progress:
+                progress(size)
+        return digests, size, file_hash.hexdigest()
+
+    def iter_chunks(self, digests):
+        for digest in digests:
+            yield self.get_chunk(digest)
@@ -1,24 +1,112 @@
+import errno
+import hashlib
 import json
 import os
+import shutil
+import threading
+import time
+from datetime import datetime
 from pathlib import Path
+from server.metrics import metrics
+from server.profiling import profiler
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; locks are then per-process only
+    fcntl = None
+
+MANIFEST = "manifest.json"
+# Derived or transient files that snapshots leave out
+SNAPSHOT_EXCLUDE = (".lock", ".tmp", ".threads.json")
+
+
+class FileLock:
+    # Exclusive lock on a data file, held across threads (threading.Lock)
+    # and across processes (fcntl advisory lock on a sidecar ".lock" file).
+    _thread_locks = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, file_path):
+        self.lock_path = Path(str(file_path) + ".lock")
+        key = os.path.abspath(self.lock_path)
+        with FileLock._registry_lock:
+            # Share one thread lock per file between all DataManagers in the process
+            self.thread_lock = FileLock._thread_locks.setdefault(key, threading.Lock())
+        self.fd = None
+        self.name = Path(file_path).name
+        self.acquired_at = None
+        # Contention counters, only updated while the lock is held
+        self.acquisitions = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+
+    def acquire(self):
+        started = time.perf_counter()
+        with profiler.phase("lock_wait"):
+            self.thread_lock.acquire()
+            if fcntl is not None:
+                try:
+                    if self.fd is None:
+                        self.fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                    fcntl.flock(self.fd, fcntl.LOCK_EX)
+                except Exception:
+                    self.thread_lock.release()
+                    raise
+        waited = time.perf_counter() - started
+        self.acquisitions += 1
+        self.wait_seconds += waited
+        self.max_wait = max(self.max_wait, waited)
+        if metrics.enabled:
+            metrics.observe("mail_lock_wait_seconds", waited, file=self.name)
+            self.acquired_at = time.perf_counter()
+
+    def stats(self):
+        return {
+            'acquisitions': self.acquisitions,
+            'wait_seconds': self.wait_seconds,
+            'max_wait': self.max_wait,
+        }
+
+    def release(self):
+        if self.acquired_at is not None:
+            metrics.observe("mail_lock_hold_seconds", time.perf_counter() - self.acquired_at, file=self.name)
+            self.acquired_at = None
+        try:
+            if fcntl is not None and self.fd is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+        finally:
+            self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
 
 class DataManager:
-    def __init__(self):
-        self.data_dir = Path("data")
+    def __init__(self, data_dir="data"):
+        self.data_dir = Path(data_dir)
+        self.locks = {}
+        self.locks_guard = threading.Lock()
         try:
             self.data_dir.mkdir(exist_ok=True)
 
             self.users_file = self.data_dir / "users.json"
             self.emails_file = self.data_dir / "emails.json"
             self.queue_file = self.data_dir / "queue.json"
-            
+            self.schedule_file = self.data_dir / "schedule.jsonl"
+            self.dead_letters_file = self.data_dir / "dead_letters.json"
+            self.chunks_dir = self.data_dir / "chunks"
+
             # Initialize files if they don't exist
             self._init_file(self.users_file, {})
             self._init_file(self.emails_file, {})
             self._init_file(self.queue_file, [])
         except Exception as e:
             print(f"Error initializing DataManager: {e}")
-    
+
     def _init_file(self, file_path, default_data):
         try:
             if not file_path.exists():
@@ -27,19 +115,243 @@ class DataManager:
         except Exception as e:
             print(f"Error initializing file {file_path}: {e}")
 
+    def lock(self, file_path):
+        # Hold this around any load-modify-save of file_path so concurrent
+        # threads and worker processes don't overwrite each other's updates.
+        with self.locks_guard:
+            key = str(file_path)
+            if key not in self.locks:
+                self.locks[key] = FileLock(file_path)
+            return self.locks[key]
+
+    def file_stamp(self, file_path):
+        # Changes whenever file_path is rewritten (save_data always replaces
+        # the file), so it can key caches derived from its contents.
+        try:
+            stat = os.stat(file_path)
+            return (str(file_path), stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def write_data(self, file_path, data):
+        # Like save_data, but raises on failure so callers can retry. Writes
+        # to a temporary file and renames it into place, so readers in other
+        # threads or processes never see a half-written file.
+        started = time.perf_counter()
+        tmp_path = Path(f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with metrics.span("data.write", file=Path(file_path).name):
+                with profiler.phase("serialize"):
+                    text = json.dumps(data, indent=2)
+                with profiler.phase("write"):
+                    with open(tmp_path, 'w') as f:
+                        f.write(text)
+                        size = f.tell()
+                    os.replace(tmp_path, file_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        if metrics.enabled:
+            name = Path(file_path).name
+            metrics.inc("mail_data_written_bytes_total", size, file=name)
+            metrics.observe("mail_data_io_seconds", time.perf_counter() - started, op="write", file=name)
+
+    def read_data(self, file_path):
+        # Like load_data, but raises on failure instead of returning None, so
+        # an unreadable file is never mistaken for an empty one and overwritten
+        if not file_path.exists():
+            return None
+        started = time.perf_counter()
+        with metrics.span("data.read", file=Path(file_path).name), profiler.phase("load"):
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+                size = os.fstat(f.fileno()).st_size
+        if metrics.enabled:
+            name = Path(file_path).name
+            metrics.inc("mail_data_read_bytes_total", size, file=name)
+            metrics.observe("mail_data_io_seconds", time.perf_counter() - started, op="read", file=name)
+        return data
+
     def save_data(self, file_path, data):
         try:
-            with open(file_path, 'w') as f:
-                json.dump(data, f, indent=2)
+            self.write_data(file_path, data)
         except Exception as e:
             print(f"Error saving data to {file_path}: {e}")
 
     def load_data(self, file_path):
         try:
-            if not file_path.exists():
-                return None
-            with open(file_path, 'r') as f:
-                return json.load(f)
+            return self.read_data(file_path)
         except Exception as e:
             print(f"Error loading data from {file_path}: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    # Snapshots
+    #
+    # Every JSON data file is replaced atomically (write_data renames a new
+    # file into place) and attachment chunks are immutable, so a hard link
+    # to a file is a frozen copy of it. snapshot() takes all JSON file
+    # locks and the schedule log's lock at once just long enough to
+    # hard-link the JSON files into a staging directory and copy the log,
+    # which gives a consistent image across files without re-serializing
+    # anything while writers wait. Chunks are linked after the locks are
+    # released: they never change, and a message only references chunks
+    # stored before it was written, so every chunk the frozen JSON files
+    # reference is already there. The staged
+    # links are then moved into the backup, copying only files whose
+    # inode changed since the previous snapshot; unchanged files are
+    # linked (or copied, across filesystems) from that snapshot instead.
+
+    def _snapshot_data_files(self):
+        # The JSON files and logs a snapshot covers, relative to data_dir
+        files = []
+        for path in sorted(self.data_dir.iterdir()):
+            if path.is_file() and not path.name.endswith(SNAPSHOT_EXCLUDE) and path.suffix in (".json", ".jsonl"):
+                files.append(Path(path.name))
+        return files
+
+    def _snapshot_chunk_files(self):
+        # Attachment chunks, relative to data_dir
+        files = []
+        if self.chunks_dir.exists():
+            for path in sorted(self.chunks_dir.rglob("*")):
+                if path.is_file() and not path.name.endswith(SNAPSHOT_EXCLUDE):
+                    files.append(path.relative_to(self.data_dir))
+        return files
+
+    def _link_or_copy(self, source, destination):
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(source, destination)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            shutil.copy2(source, destination)
+
+    def _copy_log(self, source, destination):
+        # Append-only logs are written in place, so they are copied rather
+        # than linked, up to the last complete line
+        with open(source, 'rb') as f:
+            data = f.read()
+        with open(destination, 'wb') as f:
+            f.write(data[:data.rfind(b"\n") + 1])
+
+    def _file_digest(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def list_snapshots(self, backup_dir):
+        # Complete snapshots (those with a manifest), oldest first
+        backup_dir = Path(backup_dir)
+        if not backup_dir.exists():
+            return []
+        return sorted(path for path in backup_dir.iterdir() if (path / MANIFEST).exists())
+
+    def snapshot(self, backup_dir):
+        # Write a point-in-time image of the data directory to a new
+        # directory under backup_dir and return its path
+        backup_dir = Path(backup_dir)
+        snapshot_id = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        staging = self.data_dir / f".snapshot-{snapshot_id}"
+        destination = backup_dir / snapshot_id
+        try:
+            previous = self.list_snapshots(backup_dir)
+            previous = previous[-1] if previous else None
+            previous_files = self.read_data(previous / MANIFEST)['files'] if previous else {}
+
+            # Freeze: hold every JSON file lock, then the log locks, while
+            # linking, so no write lands between two files of the image
+            frozen = self._snapshot_data_files()
+            locks = [self.lock(self.data_dir / rel) for rel in frozen if rel.suffix == ".json"]
+            locks += [self.lock(self.data_dir / rel) for rel in frozen if rel.suffix == ".jsonl"]
+            for lock in locks:
+                lock.acquire()
+            try:
+                for rel in frozen:
+                    if rel.suffix == ".jsonl":
+                        (staging / rel).parent.mkdir(parents=True, exist_ok=True)
+                        self._copy_log(self.data_dir / rel, staging / rel)
+                    else:
+                        self._link_or_copy(self.data_dir / rel, staging / rel)
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+            # Listed only now, so chunks stored just before the freeze are in
+            chunks = self._snapshot_chunk_files()
+            for rel in chunks:
+                self._link_or_copy(self.data_dir / rel, staging / rel)
+            files = frozen + chunks
+
+            manifest = {
+                'id': snapshot_id,
+                'created_at': datetime.now().isoformat(),
+                'base': previous.name if previous else None,
+                'files': {},
+            }
+            copied = 0
+            for rel in files:
+                stat = os.stat(staging / rel)
+                stamp = [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+                key = rel.as_posix()
+                entry = previous_files.get(key)
+                if entry and entry['stamp'] == stamp and rel.suffix != ".jsonl":
+                    # Unchanged since the previous snapshot
+                    self._link_or_copy(previous / rel, destination / rel)
+                    sha256 = entry['sha256']
+                else:
+                    self._link_or_copy(staging / rel, destination / rel)
+                    sha256 = self._file_digest(staging / rel)
+                    copied += 1
+                manifest['files'][key] = {'size': stat.st_size, 'sha256': sha256, 'stamp': stamp}
+            manifest['changed'] = copied
+
+            # The manifest goes last: its presence marks a complete snapshot
+            self.write_data(destination / MANIFEST, manifest)
+            return destination
+        except Exception as e:
+            print(f"Error taking snapshot of {self.data_dir}: {e}")
+            shutil.rmtree(destination, ignore_errors=True)
+            return None
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def restore(self, snapshot_dir, verify=True):
+        # Replace the data files with a snapshot's. Each file is linked in
+        # under its lock and renamed into place, so readers see either the
+        # old or the restored version. Files the snapshot doesn't have are
+        # left alone. Restart the managers afterwards so in-memory state
+        # (e.g. scheduled tasks) is reloaded.
+        snapshot_dir = Path(snapshot_dir)
+        try:
+            manifest = self.read_data(snapshot_dir / MANIFEST)
+            if manifest is None:
+                raise ValueError(f"{snapshot_dir} is not a complete snapshot")
+            if verify:
+                for key, entry in manifest['files'].items():
+                    if self._file_digest(snapshot_dir / key) != entry['sha256']:
+                        raise ValueError(f"{key} does not match the snapshot manifest")
+
+            for key in manifest['files']:
+                rel = Path(key)
+                target = self.data_dir / rel
+                tmp_path = Path(f"{target}.{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp_path.parent.mkdir(parents=True, exist_ok=True)
+                if rel.suffix == ".jsonl":
+                    shutil.copy2(snapshot_dir / rel, tmp_path)
+                else:
+                    self._link_or_copy(snapshot_dir / rel, tmp_path)
+                try:
+                    if rel.suffix == ".json":
+                        with self.lock(target):
+                            os.replace(tmp_path, target)
+                    else:
+                        os.replace(tmp_path, target)
+                finally:
+                    if tmp_path.exists():
+                        tmp_path.unlink()
+            return True
+        except Exception as e:
+            print(f"Error restoring snapshot {snapshot_dir}: {e}")
+            return False
@@ -0,0 +1,140 @@
+import heapq
+import threading
+import time
+
+
+class DraftAutosaver:
+    # Coalesces a stream of draft edits into at most one persist per draft
+    # per `interval` seconds. update() only records the latest version; a
+    # background thread saves each dirty draft once its interval has passed
+    # since that draft was last saved. Saves of one draft never overlap, so
+    # an older version can't land after a newer one.
+
+    def __init__(self, save, interval=2.0):
+        self.save = save  # Persists one draft; may raise
+        self.interval = interval
+        self.pending = {}  # draft id -> latest unsaved version
+        self.last_saved = {}  # draft id -> monotonic time of last persist
+        self.pruned_at = time.monotonic()  # when last_saved was last pruned
+        self.due = []  # heap of (due time, draft id) for pending drafts
+        self.due_at = {}  # draft id -> due time of its live heap entry
+        self.saving = {}  # draft id being persisted right now -> discarded meanwhile
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def update(self, email_data):
+        draft_id = email_data['id']
+        with self.condition:
+            if draft_id not in self.pending:
+                # Leading edge: save now unless the last save was too recent
+                if draft_id in self.saving:
+                    due = time.monotonic() + self.interval
+                else:
+                    due = max(time.monotonic(), self.last_saved.get(draft_id, float('-inf')) + self.interval)
+                self._schedule(draft_id, due)
+            self.pending[draft_id] = email_data
+            self._start()
+
+    def flush(self, draft_id=None):
+        # Persist pending edits now (all drafts, or just draft_id). A save
+        # of the same draft already in progress is waited out first.
+        with self.condition:
+            ids = [draft_id] if draft_id else list(self.pending)
+        for draft_id in ids:
+            with self.condition:
+                email_data = self._claim(draft_id)
+            if email_data is not None:
+                self._persist(draft_id, email_data)
+
+    def discard(self, draft_id):
+        # Drop unsaved edits, waiting out a save already in progress, so a
+        # deleted or sent draft can't be written back afterwards
+        with self.condition:
+            self.pending.pop(draft_id, None)
+            self.due_at.pop(draft_id, None)
+            if draft_id in self.saving:
+                self.saving[draft_id] = True  # Don't keep the edit if that save fails
+            while draft_id in self.saving:
+                self.condition.wait()
+            self.last_saved.pop(draft_id, None)
+
+    def pending_count(self):
+        with self.condition:
+            return len(self.pending)
+
+    def _claim(self, draft_id):
+        # Called with the condition held. Waits until no save of draft_id is
+        # in progress, then takes its pending version (None if there is
+        # none) and marks it as being saved; the caller must _persist it.
+        while draft_id in self.saving:
+            self.condition.wait()
+        email_data = self.pending.pop(draft_id, None)
+        if email_data is not None:
+            self.due_at.pop(draft_id, None)
+            self.saving[draft_id] = False
+        return email_data
+
+    def _persist(self, draft_id, email_data):
+        try:
+            self.save(email_data)
+        except Exception as e:
+            print(f"Error autosaving draft {draft_id}: {e}")
+            with self.condition:
+                # Keep the edit and try again after another interval, unless
+                # a newer version has arrived or the draft was discarded in
+                # the meantime
+                if draft_id not in self.pending and not self.saving[draft_id]:
+                    self.pending[draft_id] = email_data
+                    self._schedule(draft_id, time.monotonic() + self.interval)
+        finally:
+            with self.condition:
+                del self.saving[draft_id]
+                now = time.monotonic()
+                self.last_saved[draft_id] = now
+                if now - self.pruned_at >= self.interval:
+                    self._prune(now)
+                self.condition.notify_all()
+
+    def _prune(self, now):
+        # Called with the condition held. A save longer than an interval
+        # ago no longer delays the next one, so its entry can go.
+        self.last_saved = {
+            draft_id: saved_at for draft_id, saved_at in self.last_saved.items()
+            if saved_at + self.interval > now
+        }
+        self.pruned_at = now
+
+    def _schedule(self, draft_id, due):
+        # Called with the condition held
+        self.due_at[draft_id] = due
+        heapq.heappush(self.due, (due, draft_id))
+        self.condition.notify_all()
+
+    def _start(self):
+        # Called with the condition held
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True  # Exit when main program exits
+            self.thread.start()
+
+    def run(self):
+        while True:
+            with self.condition:
+                # Skip heap entries for drafts that were flushed, discarded
+                # or rescheduled since they were pushed
+                while self.due and self.due_at.get(self.due[0][1]) != self.due[0][0]:
+                    heapq.heappop(self.due)
+                if not self.due:
+                    self.condition.wait()
+                    continue
+                delay = self.due[0][0] - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+                if self.due[0][1] in self.saving:
+                    self.condition.wait()  # Until flush() has saved this draft
+                    continue
+                _, draft_id = heapq.heappop(self.due)
+                email_data = self._claim(draft_id)
+            if email_data is not None:
+                self._persist(draft_id, email_data)
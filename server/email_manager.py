@@ -1,73 +1,473 @@
-import threading
 import queue
+import threading
+import time
+import uuid
 from datetime import datetime
+from pathlib import Path
+from server.admission import BUSY_RETRY_AFTER, AdmissionController, RetryAfter
+from server.chunk_store import ChunkStore
 from server.data_manager import DataManager
+from server.draft_autosave import DraftAutosaver
+from server.lane_queue import LaneQueue
+from server.metrics import metrics
+from server.profiling import profiler
+from server.retry import DEFAULT_RETRY_POLICIES, DeadLetterStore
+from server.scheduler import TaskScheduler
+
+SNIPPET_LENGTH = 100
 
 
 class EmailManager:
-    def __init__(self):
+    def __init__(self, data_manager=None, consumers=2, admission=None):
         try:
-            self.data_manager = DataManager()
-            self.email_queue = queue.Queue(maxsize=5)
-            self.lock = threading.Lock()
-            self.start_consumers()
+            self.data_manager = data_manager or DataManager()
+            # Interactive, normal and bulk lanes, each bounded at 5 tasks
+            self.email_queue = LaneQueue(maxsize=5)
+            # Per-user rate limits and a global cap in front of the queue;
+            # set to None to admit everything
+            self.admission = admission or AdmissionController()
+            self.subscribers = {}  # username -> list of event callbacks
+            self.subscribers_lock = threading.Lock()
+            self.header_cache = (None, {})  # (emails file stamp, username -> headers)
+            self.header_cache_lock = threading.Lock()
+            # Delayed tasks ("send later", snooze) are moved onto the queue when due
+            self.scheduler = TaskScheduler(self.data_manager.schedule_file, self._dispatch_scheduled)
+            # Failed tasks are retried through the scheduler, then dead-lettered
+            self.retry_policies = dict(DEFAULT_RETRY_POLICIES)
+            self.dead_letters = DeadLetterStore(self.data_manager)
+            # Compose-window edits are coalesced to one write per draft per interval
+            self.draft_autosaver = DraftAutosaver(self._save_draft, interval=2.0)
+            # Consumers start on first use (see ensure_consumers), so
+            # constructing a manager costs nothing however big the store is
+            self.consumer_count = consumers
+            self.consumers_started = False
+            self.consumers_lock = threading.Lock()
+            self.consumers_started_at = None
+            self.busy_seconds = 0.0  # Time consumers spent running tasks while metrics were on
+            self.busy_lock = threading.Lock()
+            metrics.add_collector(self._collect_metrics)
         except Exception as e:
             print(f"Error initializing EmailManager: {e}")
 
-    def start_consumers(self):
+    @property
+    def lock(self):
+        # Thread- and process-wide lock on the emails file
+        return self.data_manager.lock(self.data_manager.emails_file)
+
+    @property
+    def threads_file(self):
+        # The thread index lives next to the emails file it is derived from
+        emails_file = self.data_manager.emails_file
+        return emails_file.with_name(emails_file.stem + ".threads.json")
+
+    @property
+    def chunk_store(self):
+        return ChunkStore(self.data_manager.chunks_dir)
+
+    def start_consumers(self, count=2):
         try:
-            for _ in range(2):  # Start 2 consumer threads
+            # Consumers are threads: every queue action rewrites emails.json
+            # under its exclusive file lock, so worker processes would only
+            # add IPC. Separate server processes can still share a data
+            # directory, since they coordinate through the DataManager locks.
+            for _ in range(count):  # Start consumer threads
                 thread = threading.Thread(target=self.process_queue)
                 thread.daemon = True  # Exit when main program exits
                 thread.start()
+            if count:
+                # Resume tasks scheduled before a restart
+                self.scheduler.load()
         except Exception as e:
             print(f"Error starting consumer threads: {e}")
 
+    def ensure_consumers(self):
+        # Start the consumer threads and resume scheduled tasks, once
+        with self.consumers_lock:
+            if self.consumers_started:
+                return
+            self.consumers_started = True
+            self.consumers_started_at = time.monotonic()
+        self.start_consumers(self.consumer_count)
+
+    def warm_up(self):
+        # Meant to run in the background after login: start the consumers
+        # and build the header cache and thread index, so the first listing
+        # doesn't pay for a full parse of the emails file
+        try:
+            self.ensure_consumers()
+            self._load_headers()
+            self._load_thread_index()
+        except Exception as e:
+            print(f"Error warming up mailbox index: {e}")
+
+    def subscribe(self, username, callback):
+        # Register a callback for change events in username's mailbox.
+        # Callbacks run on the thread that made the change, so they should
+        # only hand the event off (e.g. put it on a queue) and return quickly.
+        with self.subscribers_lock:
+            self.subscribers.setdefault(username, []).append(callback)
+        return lambda: self.unsubscribe(username, callback)
+
+    def unsubscribe(self, username, callback):
+        with self.subscribers_lock:
+            callbacks = self.subscribers.get(username, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self.subscribers.pop(username, None)
+
+    def _publish(self, username, event):
+        # Events carry the message summary, not the body
+        if 'email' in event:
+            event = dict(event, email=self._summarize(event['email']))
+        with self.subscribers_lock:
+            callbacks = list(self.subscribers.get(username, []))
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Error delivering event to subscriber of {username}: {e}")
+
+    def _publish_all(self, events):
+        for username, event in events:
+            self._publish(username, event)
+
+    def _status_event(self, email):
+        # Capture the state before a change so subscribers can diff it;
+        # the caller fills in 'email' with the updated record.
+        return {
+            'type': 'status',
+            'id': email['id'],
+            'previous_status': email.get('status'),
+            'previous_read': email.get('read', False),
+        }
+
+    def enqueue(self, action, *args, lane=None):
+        # lane defaults to the action's lane; pass lane="bulk" for mass sends.
+        # Returns True, or a falsy RetryAfter if admission control rejected
+        # the task or its lane was full; it never waits for room.
+        self.ensure_consumers()
+        if self.admission is None:
+            try:
+                self.email_queue.put_nowait((action, *args), lane=lane)
+            except queue.Full:
+                metrics.inc("mail_admission_rejected_total", action=action, reason="queue full")
+                return RetryAfter(BUSY_RETRY_AFTER, "queue full")
+            return True
+
+        rejected = self.admission.submit(self.email_queue, action, args, lane=lane)
+        if rejected is None:
+            return True
+        metrics.inc("mail_admission_rejected_total", action=action, reason=rejected.reason)
+        return rejected
+
+    def _dispatch_scheduled(self, task_id, task):
+        # The scheduler id travels with the task so the consumer can mark it
+        # done once it has run. Never blocks the scheduler thread: if the
+        # lane is full, queue.Full makes the scheduler try again shortly.
+        self.email_queue.put_nowait(("scheduled", task_id, task))
+
+    def _charge(self, action, *args):
+        # Rate-limit an operation that doesn't go through the queue like the
+        # queue action it corresponds to. Returns None or RetryAfter.
+        if self.admission is None:
+            return None
+        rejected = self.admission.charge(action, args)
+        if rejected is not None:
+            metrics.inc("mail_admission_rejected_total", action=action, reason=rejected.reason)
+        return rejected
+
     def process_queue(self):
         while True:
+            task = self.email_queue.get()  # Sleep until a task arrives
+            scheduled_id = None
             try:
-                task = self.email_queue.get(timeout=10)  # Wait for a task for 10 seconds
                 if task is None:  # Exit signal
                     break
-                action, *args = task
-                if action == "send_email":
-                    self.save_email(*args)
-                elif action == "move_to_trash":
-                    self.move_to_trash(*args)
-                elif action == "save_draft":
-                    self.save_draft(*args)
-                self.email_queue.task_done()
-            except queue.Empty:
-                print("Queue is empty. Waiting for tasks.")
+                if task[0] == "scheduled":
+                    _, scheduled_id, task = task
+                    task = tuple(task)
+                attempt = 1
+                if task[0] == "retry":
+                    _, attempt, task = task
+                    task = tuple(task)
+                started = time.perf_counter() if metrics.enabled else None
+                try:
+                    with metrics.span("task", action=task[0], attempt=attempt), profiler.operation(task[0], task[1:]):
+                        self._execute(task)
+                except Exception as e:
+                    metrics.inc("mail_task_failures_total", action=task[0])
+                    if not self._handle_failure(task, attempt, e):
+                        # Leave a scheduled task in the schedule log, so it
+                        # at least runs again after a restart
+                        scheduled_id = None
+                finally:
+                    if started is not None:
+                        elapsed = time.perf_counter() - started
+                        metrics.observe("mail_task_seconds", elapsed, action=task[0])
+                        with self.busy_lock:
+                            self.busy_seconds += elapsed
             except Exception as e:
                 print(f"Error processing queue task: {e}")
+            finally:
+                if scheduled_id is not None:
+                    self.scheduler.complete(scheduled_id)
+                # Acknowledge every task, whatever happened, so join() returns
+                self.email_queue.task_done()
 
-    def save_email(self, email_data):
+    def _collect_metrics(self):
+        # Gauges read when a metrics snapshot is taken
+        for lane, stats in self.email_queue.stats().items():
+            yield "mail_queue_depth", {'lane': lane}, stats['depth']
+            yield "mail_queue_oldest_wait_seconds", {'lane': lane}, stats['oldest_wait']
+        consumers = self.consumer_count if self.consumers_started else 0
+        yield "mail_consumers", {}, consumers
+        yield "mail_consumer_busy_seconds", {}, self.busy_seconds
+        if consumers:
+            window = time.monotonic() - max(self.consumers_started_at, metrics.enabled_at)
+            if window > 0:
+                yield "mail_consumer_utilization", {}, min(1.0, self.busy_seconds / (consumers * window))
+        yield "mail_scheduled_tasks", {}, self.scheduler.pending()
+
+    def _execute(self, task):
+        # Raises on failure so process_queue can retry the task
+        action, *args = task
+        if action == "send_email":
+            self._save_email(*args)
+        elif action == "move_to_trash":
+            self._move_to_trash(*args)
+        elif action == "save_draft":
+            self._save_draft(*args)
+        elif action == "unsnooze":
+            self._unsnooze(*args)
+        else:
+            raise ValueError(f"unknown action {action}")
+
+    def _handle_failure(self, task, attempt, error):
+        # Retry later through the scheduler rather than sleeping here, so a
+        # failing task never holds up a consumer thread. Returns False if
+        # the task could be neither rescheduled nor dead-lettered.
+        policy = self.retry_policies.get(task[0])
+        if policy and policy.should_retry(attempt):
+            delay = policy.delay(attempt)
+            print(f"Task {task[0]} failed (attempt {attempt}), retrying in {delay:.1f}s: {error}")
+            try:
+                self.scheduler.schedule(time.time() + delay, ("retry", attempt + 1, list(task)))
+                return True
+            except Exception as e:
+                print(f"Error scheduling retry of task {task[0]}: {e}")
+                return False
+        print(f"Task {task[0]} failed after {attempt} attempt(s), moving to dead letters: {error}")
         try:
-            with self.lock:  # Ensure thread-safe access to emails
-                emails = self.data_manager.load_data(self.data_manager.emails_file) or {}
+            self.dead_letters.add(task, attempt, error)
+            return True
+        except Exception as e:
+            print(f"Error storing dead letter for task {task[0]}: {e}")
+            metrics.inc("mail_dead_letter_failures_total", action=task[0])
+            return False
 
-                # Initialize user entries if they don't exist
-                if email_data['sender'] not in emails:
-                    emails[email_data['sender']] = []
-                if email_data['recipient'] not in emails:
-                    emails[email_data['recipient']] = []
+    def list_dead_letters(self):
+        try:
+            return self.dead_letters.list()
+        except Exception as e:
+            print(f"Error listing dead letters: {e}")
+            return []
 
-                # Create sent copy for sender
-                sent_copy = email_data.copy()
-                sent_copy['status'] = 'sent'
-                emails[email_data['sender']].append(sent_copy)
+    def replay_dead_letter(self, entry_id):
+        # Put a dead-lettered task back on the queue with a fresh retry budget
+        try:
+            entry = self.dead_letters.remove(entry_id)
+            if entry is None:
+                return False
+            self.ensure_consumers()
+            self.email_queue.put(tuple(entry['task']))
+            return True
+        except Exception as e:
+            print(f"Error replaying dead letter {entry_id}: {e}")
+            return False
+
+    def purge_dead_letter(self, entry_id):
+        return self.dead_letters.remove(entry_id) is not None
+
+    @metrics.instrument("email")
+    def _save_email(self, email_data):
+        with self.lock:  # Ensure thread- and process-safe access to emails
+            emails = self.data_manager.read_data(self.data_manager.emails_file) or {}
+
+            # Initialize user entries if they don't exist
+            if email_data['sender'] not in emails:
+                emails[email_data['sender']] = []
+            if email_data['recipient'] not in emails:
+                emails[email_data['recipient']] = []
+
+            # A retried or re-dispatched send must not deliver twice
+            if email_data.get('id') is not None and any(
+                email.get('id') == email_data['id'] and email.get('status') != 'draft'
+                for email in emails[email_data['sender']]
+            ):
+                return
+
+            # Replies join their parent's thread; anything else starts one
+            if not email_data.get('thread_id'):
+                email_data = dict(email_data, thread_id=self._find_thread_id(emails, email_data))
+
+            # Create sent copy for sender
+            sent_copy = email_data.copy()
+            sent_copy['status'] = 'sent'
+            emails[email_data['sender']].append(sent_copy)
+
+            # Create inbox copy for recipient
+            inbox_copy = email_data.copy()
+            inbox_copy['status'] = 'inbox'
+            emails[email_data['recipient']].append(inbox_copy)
+
+            # Save updates
+            events = [
+                (email_data['sender'], {'type': 'new', 'id': sent_copy.get('id'), 'email': sent_copy}),
+                (email_data['recipient'], {'type': 'new', 'id': inbox_copy.get('id'), 'email': inbox_copy}),
+            ]
+            self._commit(emails, events)
 
-                # Create inbox copy for recipient
-                inbox_copy = email_data.copy()
-                inbox_copy['status'] = 'inbox'
-                emails[email_data['recipient']].append(inbox_copy)
+        self._publish_all(events)
 
-                # Save updates
-                self.data_manager.save_data(self.data_manager.emails_file, emails)
+    def save_email(self, email_data):
+        try:
+            return self._save_email(email_data)
         except Exception as e:
             print(f"Error saving email: {e}")
 
+    def _commit(self, emails, events):
+        # Persist the mailboxes and fold the change events into the thread
+        # index. The caller must hold self.lock. Only the emails write can
+        # fail the task: the index is derived data, and one left stale is
+        # rebuilt by _load_thread_index because its stamp no longer matches.
+        try:
+            index = self.data_manager.read_data(self.threads_file)
+        except Exception:
+            index = None
+        fresh = index is not None and index.get('emails_stamp') == self._emails_stamp()
+
+        self.data_manager.write_data(self.data_manager.emails_file, emails)
+
+        try:
+            if fresh:
+                for username, event in events:
+                    self._apply_to_thread_index(index['users'], username, event, emails.get(username, []))
+            else:
+                # Missing or out of step with the emails file (e.g. written by
+                # an older version): rebuild it from the mailboxes we just saved
+                index = {'users': self._build_thread_index(emails)}
+            index['emails_stamp'] = self._emails_stamp()
+            self.data_manager.write_data(self.threads_file, index)
+        except Exception as e:
+            print(f"Error updating thread index, it will be rebuilt: {e}")
+
+    def _emails_stamp(self):
+        stamp = self.data_manager.file_stamp(self.data_manager.emails_file)
+        return list(stamp) if stamp else None
+
+    def _find_thread_id(self, emails, email_data):
+        parent_id = email_data.get('in_reply_to')
+        if parent_id:
+            for username in (email_data['sender'], email_data['recipient']):
+                for email in emails.get(username, []):
+                    if email.get('id') == parent_id:
+                        return email.get('thread_id') or parent_id
+        return email_data.get('id')
+
+    def _add_to_thread_index(self, threads, email):
+        # Count one message into its thread's entry in the given user's index
+        folder = threads.setdefault(email.get('status'), {})
+        thread_id = email.get('thread_id') or email.get('id')
+        entry = folder.get(thread_id)
+        if entry is None:
+            entry = folder[thread_id] = {
+                'thread_id': thread_id,
+                'subject': email.get('subject'),
+                'last_activity': email.get('timestamp'),
+                'message_count': 0,
+                'unread_count': 0,
+            }
+        entry['message_count'] += 1
+        if email.get('status') == 'inbox' and not email.get('read', False):
+            entry['unread_count'] += 1
+        if (email.get('timestamp') or '') > (entry['last_activity'] or ''):
+            entry['last_activity'] = email.get('timestamp')
+
+    def _rebuild_thread_entry(self, threads, user_emails, folder, thread_id):
+        # Recompute one thread's entry in one folder from its messages
+        folder_threads = threads.get(folder, {})
+        folder_threads.pop(thread_id, None)
+        for email in user_emails:
+            if ('id' in email and email.get('status') == folder
+                    and (email.get('thread_id') or email.get('id')) == thread_id):
+                self._add_to_thread_index(threads, email)
+        if folder in threads and not threads[folder]:
+            del threads[folder]
+
+    def _apply_to_thread_index(self, users, username, event, user_emails):
+        # user_emails is the user's mailbox after the change
+        threads = users.setdefault(username, {})
+        email = event['email']
+        if event['type'] == 'new':
+            self._add_to_thread_index(threads, email)
+            return
+        # A message left (or changed within) a thread. Its latest activity
+        # and subject may have come from that message, so the affected
+        # entries are recomputed from their remaining messages.
+        thread_id = email.get('thread_id') or email.get('id')
+        folders = {email.get('status')}
+        if event['type'] in ('status', 'updated'):
+            folders.add(event['previous_status'])
+        for folder in folders:
+            self._rebuild_thread_entry(threads, user_emails, folder, thread_id)
+
+    def _build_thread_index(self, emails):
+        users = {}
+        for username, user_emails in emails.items():
+            threads = users.setdefault(username, {})
+            for email in user_emails:
+                if 'id' in email:
+                    self._add_to_thread_index(threads, email)
+        return users
+
+    def _load_thread_index(self):
+        index = self.data_manager.read_data(self.threads_file)
+        if index is not None and index.get('emails_stamp') == self._emails_stamp():
+            return index['users']
+        with self.lock:
+            # Another writer may have refreshed it while we waited
+            index = self.data_manager.read_data(self.threads_file)
+            if index is None or index.get('emails_stamp') != self._emails_stamp():
+                emails = self.data_manager.read_data(self.data_manager.emails_file) or {}
+                index = {'users': self._build_thread_index(emails), 'emails_stamp': self._emails_stamp()}
+                self.data_manager.write_data(self.threads_file, index)
+            return index['users']
+
+    @metrics.instrument("email")
+    def get_threads(self, username, folder='inbox', page=1, page_size=20):
+        # One page of a folder's threads, most recently active first
+        try:
+            threads = self._load_thread_index().get(username, {}).get(folder, {})
+            ordered = sorted(
+                threads.values(),
+                key=lambda entry: entry['last_activity'] or '',
+                reverse=True
+            )
+            start = (page - 1) * page_size
+            return ordered[start:start + page_size]
+        except Exception as e:
+            print(f"Error retrieving threads for {username}: {e}")
+            return []
+
+    def get_thread_messages(self, username, thread_id, folder=None):
+        # Summaries of a thread's messages, oldest first
+        return [
+            header for header in reversed(self.list_headers(username, folder))
+            if header['thread_id'] == thread_id
+        ]
+
+    @metrics.instrument("email")
     def get_user_emails(self, username, folder=None):
         try:
             emails = self.data_manager.load_data(self.data_manager.emails_file) or {}
@@ -89,91 +489,423 @@ class EmailManager:
             print(f"Error retrieving emails for {username}: {e}")
             return []
 
+    def _summarize(self, email):
+        body = email.get('body') or ''
+        return {
+            'id': email.get('id'),
+            'sender': email.get('sender'),
+            'recipient': email.get('recipient'),
+            'subject': email.get('subject'),
+            'timestamp': email.get('timestamp'),
+            'status': email.get('status'),
+            'read': email.get('read', False),
+            'thread_id': email.get('thread_id') or email.get('id'),
+            'in_reply_to': email.get('in_reply_to'),
+            'attachment_count': len(email.get('attachments') or []),
+            'snippet': ' '.join(body.split())[:SNIPPET_LENGTH],
+            'size': len(body.encode('utf-8')),
+        }
+
+    def _load_headers(self):
+        # Summaries for every mailbox, newest first, rebuilt only when the
+        # emails file changes so repeated listings skip the JSON parse.
+        stamp = self.data_manager.file_stamp(self.data_manager.emails_file)
+        with self.header_cache_lock:
+            if stamp is not None and self.header_cache[0] == stamp:
+                return self.header_cache[1]
+
+            emails = self.data_manager.load_data(self.data_manager.emails_file) or {}
+            headers = {
+                username: sorted(
+                    (self._summarize(email) for email in user_emails if 'id' in email),
+                    key=lambda x: datetime.fromisoformat(x['timestamp']),
+                    reverse=True
+                )
+                for username, user_emails in emails.items()
+            }
+            self.header_cache = (stamp, headers)
+            return headers
+
+    @metrics.instrument("email")
+    def list_headers(self, username, folder=None):
+        try:
+            headers = self._load_headers().get(username, [])
+            return [
+                dict(header) for header in headers
+                if not folder or header['status'] == folder
+            ]
+        except Exception as e:
+            print(f"Error listing headers for {username}: {e}")
+            return []
+
+    @metrics.instrument("email")
+    def get_message(self, username, email_id):
+        try:
+            emails = self.data_manager.load_data(self.data_manager.emails_file) or {}
+            for email in emails.get(username, []):
+                if email.get('id') == email_id:
+                    return email
+            return None
+        except Exception as e:
+            print(f"Error retrieving email {email_id} for {username}: {e}")
+            return None
+
+    @metrics.instrument("email")
+    def _move_to_trash(self, username, email_id):
+        with self.lock:  # Ensure thread- and process-safe access to emails
+            emails = self.data_manager.read_data(self.data_manager.emails_file) or {}
+            user_emails = emails.get(username, [])
+
+            for email in user_emails:
+                if email['id'] == email_id:
+                    event = self._status_event(email)
+                    email['status'] = 'deleted'
+                    event['email'] = email.copy()
+                    self._commit(emails, [(username, event)])
+                    break
+            else:
+                return False
+
+        self._publish(username, event)
+        return True
+
+    def _attachment_metadata(self, filename, content_type, digests, size, sha256):
+        # Messages only carry this reference; the data lives in the chunk store
+        return {
+            'id': str(uuid.uuid4()),
+            'filename': filename,
+            'content_type': content_type,
+            'size': size,
+            'sha256': sha256,
+            'chunks': digests,
+        }
+
+    def upload_attachment(self, source, filename=None, content_type=None, progress=None):
+        # Stream a file (path or binary file object) into the chunk store and
+        # return attachment metadata to put in email_data['attachments'].
+        # progress(bytes_done) is called after each chunk.
+        try:
+            if isinstance(source, (str, Path)):
+                with open(source, 'rb') as f:
+                    return self.upload_attachment(f, filename or Path(source).name, content_type, progress)
+            digests, size, sha256 = self.chunk_store.put_stream(source, progress)
+            return self._attachment_metadata(filename, content_type, digests, size, sha256)
+        except Exception as e:
+            print(f"Error uploading attachment {filename}: {e}")
+            return None
+
+    def put_chunk(self, data):
+        return self.chunk_store.put_chunk(data)
+
+    def get_chunk(self, digest):
+        return self.chunk_store.get_chunk(digest)
+
+    def owned_chunks(self, username, uploaded=()):
+        # Chunks username may reference: those they uploaded plus those of
+        # attachments already in their mailbox
+        owned = set(uploaded)
+        emails = self.data_manager.read_data(self.data_manager.emails_file) or {}
+        for email in emails.get(username, []):
+            for attachment in email.get('attachments') or []:
+                owned.update(attachment['chunks'])
+        return owned
+
+    def missing_chunks(self, digests, username=None, uploaded=()):
+        # Lets remote uploaders skip chunks the store already has. Given a
+        # username, chunks they don't own count as missing, so the answer
+        # says nothing about other users' files.
+        chunk_store = self.chunk_store
+        owned = self.owned_chunks(username, uploaded) if username is not None else None
+        return [
+            digest for digest in digests
+            if (owned is not None and digest not in owned) or not chunk_store.has_chunk(digest)
+        ]
+
+    def commit_attachment(self, filename, content_type, digests, sha256=None, username=None, uploaded=()):
+        # Build metadata for chunks uploaded one at a time with put_chunk.
+        # Given a username, every chunk must be one they own.
+        try:
+            if username is not None:
+                owned = self.owned_chunks(username, uploaded)
+                if any(digest not in owned for digest in digests):
+                    raise PermissionError("attachment references chunks that were not uploaded")
+            chunk_store = self.chunk_store
+            size = sum(chunk_store.chunk_size_of(digest) for digest in digests)
+            return self._attachment_metadata(filename, content_type, list(digests), size, sha256)
+        except Exception as e:
+            print(f"Error committing attachment {filename}: {e}")
+            return None
+
+    def get_attachment(self, username, email_id, attachment_id):
+        email = self.get_message(username, email_id)
+        for attachment in (email or {}).get('attachments') or []:
+            if attachment['id'] == attachment_id:
+                return attachment
+        return None
+
+    def get_attachment_chunk(self, username, email_id, attachment_id, index):
+        attachment = self.get_attachment(username, email_id, attachment_id)
+        if attachment is None:
+            raise KeyError(f"attachment {attachment_id} not found")
+        return self.chunk_store.get_chunk(attachment['chunks'][index])
+
+    def iter_attachment(self, username, email_id, attachment_id):
+        # Yields the attachment's data one chunk at a time
+        attachment = self.get_attachment(username, email_id, attachment_id)
+        if attachment is None:
+            raise KeyError(f"attachment {attachment_id} not found")
+        return self.chunk_store.iter_chunks(attachment['chunks'])
+
+    def download_attachment(self, username, email_id, attachment_id, destination, progress=None):
+        # Write an attachment to a path or binary file object, chunk by chunk
+        try:
+            if isinstance(destination, (str, Path)):
+                with open(destination, 'wb') as f:
+                    return self.download_attachment(username, email_id, attachment_id, f, progress)
+            done = 0
+            for data in self.iter_attachment(username, email_id, attachment_id):
+                destination.write(data)
+                done += len(data)
+                if progress:
+                    progress(done)
+            return True
+        except Exception as e:
+            print(f"Error downloading attachment {attachment_id} for {username}: {e}")
+            return False
+
     def move_to_trash(self, username, email_id):
         try:
-            with self.lock:  # Ensure thread-safe access to emails
-                emails = self.data_manager.load_data(self.data_manager.emails_file) or {}
+            rejected = self._charge("move_to_trash", username, email_id)
+            if rejected is not None:
+                return rejected
+            return self._move_to_trash(username, email_id)
+        except Exception as e:
+            print(f"Error moving email to trash for {username}: {e}")
+            return False
+
+    @metrics.instrument("email")
+    def schedule_send(self, email_data, send_at):
+        # Queue email_data for delivery at send_at (datetime or timestamp).
+        # Charged as a send now, since the scheduled send itself bypasses
+        # admission control when it is due.
+        try:
+            rejected = self._charge("schedule_send", email_data, send_at)
+            if rejected is not None:
+                return rejected
+            self.ensure_consumers()  # Due tasks are handed to the consumers
+            return self.scheduler.schedule(send_at, ("send_email", email_data))
+        except Exception as e:
+            print(f"Error scheduling email: {e}")
+            return None
+
+    def cancel_scheduled(self, task_id):
+        try:
+            return self.scheduler.cancel(task_id)
+        except Exception as e:
+            print(f"Error cancelling scheduled task {task_id}: {e}")
+            return False
+
+    @metrics.instrument("email")
+    def snooze(self, username, email_id, until):
+        # Hide an inbox email until `until`, then return it to the inbox unread
+        try:
+            rejected = self._charge("snooze", username, email_id, until)
+            if rejected is not None:
+                return rejected
+            if isinstance(until, datetime):
+                until = until.timestamp()
+            self.ensure_consumers()
+            with self.lock:
+                emails = self.data_manager.read_data(self.data_manager.emails_file) or {}
                 user_emails = emails.get(username, [])
 
                 for email in user_emails:
-                    if email['id'] == email_id:
-                        email['status'] = 'deleted'
-                        self.data_manager.save_data(self.data_manager.emails_file, emails)
-                        return True
+                    if email['id'] == email_id and email['status'] == 'inbox':
+                        event = self._status_event(email)
+                        email['status'] = 'snoozed'
+                        event['email'] = email.copy()
+                        # Log the unsnooze task before the status change, both
+                        # under the emails lock, so neither a snapshot nor a
+                        # crash can see a snoozed message with no task to
+                        # bring it back (an unsnooze of a message that isn't
+                        # snoozed does nothing). The task carries `until`, so
+                        # a task left over from an earlier snooze can't bring
+                        # the message back early.
+                        task_id = self.scheduler.schedule(until, ("unsnooze", username, email_id, until))
+                        email['snoozed_until'] = until
+                        email['snooze_task'] = task_id
+                        self._commit(emails, [(username, event)])
+                        break
+                else:
+                    return False
+
+            self._publish(username, event)
+            return True
+        except Exception as e:
+            print(f"Error snoozing email for {username}: {e}")
+            return False
+
+    @metrics.instrument("email")
+    def _unsnooze(self, username, email_id, until=None):
+        # `until` is set by the scheduled task and must match the current
+        # snooze; a manual unsnooze passes None and cancels that task
+        with self.lock:
+            emails = self.data_manager.read_data(self.data_manager.emails_file) or {}
+            user_emails = emails.get(username, [])
+
+            for email in user_emails:
+                if email['id'] == email_id and email['status'] == 'snoozed':
+                    if until is not None and email.get('snoozed_until', until) != until:
+                        return False
+                    event = self._status_event(email)
+                    email['status'] = 'inbox'
+                    email['read'] = False
+                    email.pop('snoozed_until', None)
+                    task_id = email.pop('snooze_task', None)
+                    event['email'] = email.copy()
+                    self._commit(emails, [(username, event)])
+                    if until is None and task_id:
+                        self.scheduler.cancel(task_id)
+                    break
+            else:
                 return False
+
+        self._publish(username, event)
+        return True
+
+    def unsnooze(self, username, email_id):
+        try:
+            return self._unsnooze(username, email_id)
         except Exception as e:
-            print(f"Error moving email to trash for {username}: {e}")
+            print(f"Error unsnoozing email for {username}: {e}")
             return False
 
+    @metrics.instrument("email")
     def get_unread_count(self, username):
         try:
-            emails = self.data_manager.load_data(self.data_manager.emails_file) or {}
-            user_emails = emails.get(username, [])
-
+            # Counted from the cached headers rather than a fresh parse
             return len([
-                email for email in user_emails
-                if email['status'] == 'inbox' and not email.get('read', False)
+                header for header in self._load_headers().get(username, [])
+                if header['status'] == 'inbox' and not header['read']
             ])
         except Exception as e:
             print(f"Error getting unread count for {username}: {e}")
             return 0
 
+    @metrics.instrument("email")
     def mark_as_read(self, username, email_id):
         try:
+            rejected = self._charge("mark_as_read", username, email_id)
+            if rejected is not None:
+                return rejected
             with self.lock:
-                emails = self.data_manager.load_data(self.data_manager.emails_file) or {}
+                emails = self.data_manager.read_data(self.data_manager.emails_file) or {}
                 user_emails = emails.get(username, [])
 
                 for email in user_emails:
                     if email['id'] == email_id:
+                        event = self._status_event(email)
                         email['read'] = True
-                        self.data_manager.save_data(self.data_manager.emails_file, emails)
-                        return True
-                return False
+                        event['email'] = email.copy()
+                        self._commit(emails, [(username, event)])
+                        break
+                else:
+                    return False
+
+            self._publish(username, event)
+            return True
         except Exception as e:
             print(f"Error marking email as read for {username}: {e}")
             return False
 
-    def save_draft(self, email_data):
-        try:
-            with self.lock:
-                emails = self.data_manager.load_data(self.data_manager.emails_file) or {}
+    @metrics.instrument("email")
+    def _save_draft(self, email_data):
+        with self.lock:
+            emails = self.data_manager.read_data(self.data_manager.emails_file) or {}
+            user_emails = emails.setdefault(email_data['sender'], [])
 
-            if email_data['sender'] not in emails:
-                emails[email_data['sender']] = []
+            # Set status as draft
+            draft = dict(email_data, status='draft')
 
-            # Limit the number of drafts to 3
-            max_drafts = 3
-            drafts = [email for email in emails[email_data['sender']] if email['status'] == 'draft']
+            # Editing an existing draft replaces it in place
+            for index, email in enumerate(user_emails):
+                if email.get('id') == draft.get('id') and email['status'] == 'draft':
+                    user_emails[index] = draft
+                    event = {
+                        'type': 'updated',
+                        'id': draft.get('id'),
+                        'previous_status': 'draft',
+                        'previous_read': email.get('read', False),
+                        'email': draft.copy(),
+                    }
+                    break
+            else:
+                user_emails.append(draft)
+                event = {'type': 'new', 'id': draft.get('id'), 'email': draft.copy()}
 
-            if len(drafts) >= max_drafts:
-                # Optionally, delete the oldest draft or show an error message
-                oldest_draft = min(drafts, key=lambda x: datetime.fromisoformat(x['timestamp']))
-                emails[email_data['sender']].remove(oldest_draft)
+            events = [(email_data['sender'], event)]
+            self._commit(emails, events)
 
-            # Set status as draft
-            email_data['status'] = 'draft'
-            emails[email_data['sender']].append(email_data)
+        self._publish_all(events)
+        return True
 
-            self.data_manager.save_data(self.data_manager.emails_file, emails)
-            return True
+    def save_draft(self, email_data):
+        try:
+            rejected = self._charge("save_draft", email_data)
+            if rejected is not None:
+                return rejected
+            # An explicit save supersedes any edits still waiting to autosave
+            self.draft_autosaver.discard(email_data['id'])
+            return self._save_draft(email_data)
         except Exception as e:
             print(f"Error saving draft: {e}")
             return False
 
+    def autosave_draft(self, email_data):
+        # Record the latest compose-window state; it is persisted in the
+        # background at most once per autosave interval
+        try:
+            rejected = self._charge("autosave_draft", email_data)
+            if rejected is not None:
+                return rejected
+            self.draft_autosaver.update(email_data)
+            return True
+        except Exception as e:
+            print(f"Error autosaving draft: {e}")
+            return False
+
+    def flush_drafts(self, email_id=None):
+        self.draft_autosaver.flush(email_id)
+
+    @metrics.instrument("email")
     def delete_draft(self, username, email_id):
         try:
+            rejected = self._charge("delete_draft", username, email_id)
+            if rejected is not None:
+                return rejected
+            self.draft_autosaver.discard(email_id)
             with self.lock:
-                emails = self.data_manager.load_data(self.data_manager.emails_file) or {}
+                emails = self.data_manager.read_data(self.data_manager.emails_file) or {}
                 user_emails = emails.get(username, [])
 
+                removed = [
+                    email for email in user_emails
+                    if email['id'] == email_id and email['status'] == 'draft'
+                ]
                 emails[username] = [
                     email for email in user_emails
                     if not (email['id'] == email_id and email['status'] == 'draft')
                 ]
 
-                self.data_manager.save_data(self.data_manager.emails_file, emails)
-                return True
+                events = [
+                    (username, {'type': 'deleted', 'id': email['id'], 'email': email})
+                    for email in removed
+                ]
+                self._commit(emails, events)
+
+            self._publish_all(events)
+            return True
         except Exception as e:
             print(f"Error deleting draft for {username}: {e}")
             return False
+
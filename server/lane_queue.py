@@ -0,0 +1,180 @@
+import queue
+import threading
+import time
+from collections import deque
+
+LANES = ("interactive", "normal", "bulk")
+
+# Relative share of dequeues each lane gets while all lanes are busy
+DEFAULT_WEIGHTS = {"interactive": 8, "normal": 4, "bulk": 1}
+
+# Lane for each queue action when the caller doesn't name one
+ACTION_LANES = {
+    "move_to_trash": "interactive",
+    "save_draft": "interactive",
+    "unsnooze": "normal",
+    "send_email": "normal",
+}
+
+WAIT_SAMPLES = 1000  # Recent wait times kept per lane for percentiles
+
+
+def classify_task(task):
+    # Exit signals (None) go to the interactive lane so they aren't stuck
+    # behind a backlog of bulk work; retries and scheduled tasks keep their
+    # original action's lane.
+    if task is None:
+        return "interactive"
+    if task[0] in ("retry", "scheduled"):
+        return classify_task(task[2])
+    return ACTION_LANES.get(task[0], "normal")
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+class LaneQueue:
+    # Drop-in replacement for queue.Queue with one bounded FIFO per lane.
+    # get() picks lanes by smooth weighted round-robin, so a burst in one
+    # lane only takes its weighted share of consumer time and never blocks
+    # the other lanes.
+
+    def __init__(self, maxsize=5, weights=None, classify=classify_task):
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        if isinstance(maxsize, dict):
+            self.maxsize = dict(maxsize)
+        else:
+            self.maxsize = {lane: maxsize for lane in self.weights}
+        self.classify = classify
+        self.lanes = {lane: deque() for lane in self.weights}
+        self.current = {lane: 0 for lane in self.weights}
+        self.counters = {lane: {'enqueued': 0, 'dequeued': 0} for lane in self.weights}
+        self.waits = {lane: deque(maxlen=WAIT_SAMPLES) for lane in self.weights}
+        self.unfinished_tasks = 0
+
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.not_full = threading.Condition(self.mutex)
+        self.all_tasks_done = threading.Condition(self.mutex)
+
+    def _lane_full(self, lane):
+        return 0 < self.maxsize.get(lane, 0) <= len(self.lanes[lane])
+
+    def put(self, item, block=True, timeout=None, lane=None):
+        lane = lane or self.classify(item)
+        if lane not in self.lanes:
+            raise ValueError(f"unknown lane {lane}")
+        with self.not_full:
+            if self._lane_full(lane):
+                if not block:
+                    raise queue.Full
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while self._lane_full(lane):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise queue.Full
+                    self.not_full.wait(remaining)
+            self.lanes[lane].append((time.monotonic(), item))
+            self.counters[lane]['enqueued'] += 1
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def put_nowait(self, item, lane=None):
+        return self.put(item, block=False, lane=lane)
+
+    def _next_lane(self):
+        # Smooth weighted round-robin over the non-empty lanes
+        busy = [lane for lane, items in self.lanes.items() if items]
+        total = 0
+        chosen = None
+        for lane in busy:
+            self.current[lane] += self.weights[lane]
+            total += self.weights[lane]
+            if chosen is None or self.current[lane] > self.current[chosen]:
+                chosen = lane
+        self.current[chosen] -= total
+        return chosen
+
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            if not block:
+                if not self._qsize():
+                    raise queue.Empty
+            elif timeout is None:
+                while not self._qsize():
+                    self.not_empty.wait()
+            else:
+                deadline = time.monotonic() + timeout
+                while not self._qsize():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self.not_empty.wait(remaining)
+
+            lane = self._next_lane()
+            enqueued_at, item = self.lanes[lane].popleft()
+            self.counters[lane]['dequeued'] += 1
+            self.waits[lane].append(time.monotonic() - enqueued_at)
+            # Wake every producer: the one waiting on this lane may be any of them
+            self.not_full.notify_all()
+            return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def task_done(self):
+        with self.all_tasks_done:
+            unfinished = self.unfinished_tasks - 1
+            if unfinished < 0:
+                raise ValueError('task_done() called too many times')
+            self.unfinished_tasks = unfinished
+            if unfinished == 0:
+                self.all_tasks_done.notify_all()
+
+    def join(self):
+        with self.all_tasks_done:
+            while self.unfinished_tasks:
+                self.all_tasks_done.wait()
+
+    def capacity(self):
+        # Tasks all lanes can hold together, or None if any lane is unbounded
+        if any(size <= 0 for size in self.maxsize.values()):
+            return None
+        return sum(self.maxsize.values())
+
+    def _qsize(self):
+        return sum(len(items) for items in self.lanes.values())
+
+    def qsize(self, lane=None):
+        with self.mutex:
+            return len(self.lanes[lane]) if lane else self._qsize()
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def full(self, lane=None):
+        with self.mutex:
+            if lane:
+                return self._lane_full(lane)
+            return all(self._lane_full(name) for name in self.lanes)
+
+    def stats(self):
+        # Per-lane depth, throughput counters and recent wait times (seconds)
+        with self.mutex:
+            snapshot = {}
+            for lane, items in self.lanes.items():
+                waits = sorted(self.waits[lane])
+                snapshot[lane] = {
+                    'depth': len(items),
+                    'enqueued': self.counters[lane]['enqueued'],
+                    'dequeued': self.counters[lane]['dequeued'],
+                    'oldest_wait': time.monotonic() - items[0][0] if items else 0.0,
+                    'wait_p50': _percentile(waits, 0.50),
+                    'wait_p99': _percentile(waits, 0.99),
+                    'wait_max': waits[-1] if waits else 0.0,
+                }
+            return snapshot
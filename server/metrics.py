@@ -0,0 +1,282 @@
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+MAX_SPANS = 1000  # Most recent finished trace spans kept in memory
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                break
+        else:
+            i = len(BUCKETS)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class _Span:
+    def __init__(self, metrics, name, attributes):
+        self.metrics = metrics
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        stack = self.metrics._span_stack()
+        parent = stack[-1] if stack else None
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        self.metrics._span_stack().pop()
+        self.metrics._finish_span({
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.started_at,
+            'duration': duration,
+            'attributes': self.attributes,
+            'error': repr(exc) if exc is not None else None,
+        })
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Metrics:
+    # Process-wide counters, latency histograms, gauges and trace spans.
+    #
+    # Disabled by default: every recording call returns after a single
+    # attribute check, so instrumented code pays next to nothing until
+    # enable() is called (or MAIL_METRICS=1 / MAIL_TRACING=1 is set).
+    # Gauges are pulled from collectors when a snapshot is taken rather
+    # than pushed on every change.
+
+    def __init__(self, enabled=False, tracing=False):
+        self.enabled = enabled or tracing
+        self.tracing = tracing
+        self.enabled_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.counters = {}  # name -> {label key: value}
+        self.histograms = {}  # name -> {label key: Histogram}
+        self.collectors = []  # weak references to callables yielding (name, labels, value)
+        self.spans = deque(maxlen=MAX_SPANS)
+        self.local = threading.local()
+
+    def enable(self, tracing=False):
+        if not self.enabled:
+            self.enabled_at = time.monotonic()
+        self.enabled = True
+        self.tracing = self.tracing or tracing
+
+    def disable(self):
+        self.enabled = False
+        self.tracing = False
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.spans.clear()
+        self.enabled_at = time.monotonic()
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(seconds)
+
+    def span(self, name, **attributes):
+        # Context manager recording a trace span; nested spans on the same
+        # thread share a trace id
+        if not self.tracing:
+            return NULL_SPAN
+        return _Span(self, name, attributes)
+
+    def _span_stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def _finish_span(self, record):
+        with self.lock:
+            self.spans.append(record)
+
+    def instrument(self, component):
+        # Decorator timing every call of a method as mail_operation_seconds
+        # (with a trace span when tracing) and counting calls that raise
+        def decorator(func):
+            op = func.__name__.lstrip('_')
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    with self.span(f"{component}.{op}"):
+                        return func(*args, **kwargs)
+                except Exception:
+                    self.inc("mail_operation_errors_total", component=component, op=op)
+                    raise
+                finally:
+                    self.observe("mail_operation_seconds", time.perf_counter() - started,
+                                 component=component, op=op)
+            return wrapper
+        return decorator
+
+    def add_collector(self, collect):
+        # collect() yields (gauge name, labels dict, value). Bound methods
+        # are held weakly so registering doesn't keep their object alive.
+        if hasattr(collect, '__self__'):
+            ref = weakref.WeakMethod(collect)
+        else:
+            ref = lambda: collect
+        with self.lock:
+            self.collectors.append(ref)
+
+    def _collect_gauges(self):
+        with self.lock:
+            self.collectors = [ref for ref in self.collectors if ref() is not None]
+            collectors = [ref() for ref in self.collectors]
+        gauges = {}
+        for collect in collectors:
+            if collect is None:
+                continue
+            try:
+                for name, labels, value in collect():
+                    gauges.setdefault(name, {})[_label_key(labels)] = value
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+        return gauges
+
+    def snapshot(self):
+        # Plain-data copy of every metric, suitable for JSON
+        gauges = self._collect_gauges()
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'tracing': self.tracing,
+                'counters': {
+                    name: [{'labels': dict(key), 'value': value} for key, value in series.items()]
+                    for name, series in self.counters.items()
+                },
+                'gauges': {
+                    name: [{'labels': dict(key), 'value': value} for key, value in series.items()]
+                    for name, series in gauges.items()
+                },
+                'histograms': {
+                    name: [
+                        {
+                            'labels': dict(key),
+                            'count': histogram.count,
+                            'sum': histogram.sum,
+                            'buckets': [
+                                ['+Inf' if bound == float('inf') else bound, count]
+                                for bound, count in histogram.cumulative()
+                            ],
+                        }
+                        for key, histogram in series.items()
+                    ]
+                    for name, series in self.histograms.items()
+                },
+                'spans': list(self.spans),
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        # Prometheus text exposition format (version 0.0.4)
+        gauges = self._collect_gauges()
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    for bound, count in histogram.cumulative():
+                        le = "+Inf" if bound == float('inf') else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', le)])} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by every manager in the process
+metrics = Metrics(
+    enabled=os.environ.get("MAIL_METRICS") == "1",
+    tracing=os.environ.get("MAIL_TRACING") == "1",
+)
@@ -0,0 +1,338 @@
+import argparse
+import asyncio
+import base64
+import contextvars
+import itertools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from server.admission import TASK_USERS, RetryAfter
+from server.auth_manager import AuthManager
+from server.capture import CapturingProxy, WorkloadRecorder, current_session
+from server.data_manager import DataManager
+from server.email_manager import EmailManager
+from server.metrics import metrics
+from server.profiling import DEFAULT_CAPTURE_SECONDS, profiler
+
+# Protocol: one JSON object per line in each direction.
+#   request:  {"id": 1, "op": "get_user_emails", "args": ["alice", "inbox"]}
+#   response: {"id": 1, "ok": true, "result": [...]}
+#             {"id": 1, "ok": false, "error": "..."}
+#   event:    {"event": {"type": "new", "id": "...", "email": {...}}}
+# Operations mirror the AuthManager / EmailManager methods of the same name.
+# Attachment chunks travel base64-encoded, one chunk of at most
+# chunk_store.CHUNK_SIZE bytes per request.
+
+MAX_LINE_BYTES = 4 * 1024 * 1024
+MAX_PENDING_WRITE_BYTES = 8 * 1024 * 1024
+
+# Mailbox operations whose first argument is the username they act on
+MAILBOX_OPS = (
+    "get_user_emails",
+    "list_headers",
+    "get_message",
+    "get_threads",
+    "get_thread_messages",
+    "get_attachment",
+    "get_unread_count",
+    "move_to_trash",
+    "mark_as_read",
+    "delete_draft",
+    "snooze",
+)
+
+# Operations that take an email record as their first argument
+EMAIL_DATA_OPS = (
+    "save_draft",
+    "autosave_draft",
+    "schedule_send",
+)
+
+# Queue actions a client may enqueue, and how to find the acting user
+QUEUE_ACTIONS = TASK_USERS
+
+# Every operation MailServer.dispatch accepts
+WIRE_OPS = (
+    ("ping", "register", "login", "logout")
+    + MAILBOX_OPS
+    + EMAIL_DATA_OPS
+    + ("put_chunk", "missing_chunks", "commit_attachment", "get_attachment_chunk")
+    + ("metrics", "profile", "enqueue")
+)
+
+
+class Session:
+    ids = itertools.count(1)
+
+    def __init__(self, writer):
+        self.id = next(Session.ids)
+        self.writer = writer
+        self.username = None
+        self.unsubscribe = None
+        self.uploaded_chunks = set()  # Digests this login sent with put_chunk
+        self.attachment_chunks = {}  # (email id, attachment id) -> chunk digests
+
+    def send(self, message):
+        if self.writer.is_closing():
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_PENDING_WRITE_BYTES:
+            # The peer is not reading; drop it rather than buffer without bound
+            self.writer.close()
+            return
+        self.writer.write(json.dumps(message).encode() + b"\n")
+
+    def logout(self):
+        if self.unsubscribe:
+            self.unsubscribe()
+            self.unsubscribe = None
+        self.username = None
+        self.uploaded_chunks = set()
+        self.attachment_chunks = {}
+
+
+class MailServer:
+    def __init__(self, host="127.0.0.1", port=8025, data_manager=None,
+                 auth_manager=None, email_manager=None, max_workers=32, admin_users=()):
+        # One set of managers is the single authority over the data directory
+        data_manager = data_manager or DataManager()
+        self.host = host
+        self.port = port
+        # Accounts allowed to read metrics and start profiling; none by default
+        self.admin_users = set(admin_users)
+        self.auth_manager = auth_manager or AuthManager(data_manager)
+        self.email_manager = email_manager or EmailManager(data_manager)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.server = None
+        self.loop = None
+        self.sessions = set()
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, limit=MAX_LINE_BYTES
+        )
+        # Port 0 asks the OS for a free port; report the real one
+        self.port = self.server.sockets[0].getsockname()[1]
+        # Resume scheduled tasks now rather than on the first request
+        self.email_manager.ensure_consumers()
+        return self.port
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for session in list(self.sessions):
+            session.logout()
+            session.writer.close()
+        self.executor.shutdown(wait=False)
+
+    async def handle_connection(self, reader, writer):
+        session = Session(writer)
+        self.sessions.add(session)
+        # Each connection is handled in its own task, so this only tags
+        # calls made for this session (see call)
+        current_session.set(session)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    session.send({"id": None, "ok": False, "error": "request too large"})
+                    break
+                if not line:
+                    break
+                response = await self.handle_line(session, line)
+                session.send(response)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            session.logout()
+            self.sessions.discard(session)
+            writer.close()
+
+    async def handle_line(self, session, line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            op = request["op"]
+            args = request.get("args", [])
+            result = await self.dispatch(session, op, args)
+            return {"id": request_id, "ok": True, "result": result}
+        except PermissionError as e:
+            return {"id": request_id, "ok": False, "error": str(e) or "forbidden"}
+        except Exception as e:
+            print(f"Error handling request {request_id}: {e}")
+            return {"id": request_id, "ok": False, "error": str(e)}
+
+    async def call(self, func, *args):
+        # Manager methods do blocking file I/O; keep them off the event loop.
+        # The executor thread runs in this task's context, so a workload
+        # capture sees which session the call was made for.
+        context = contextvars.copy_context()
+        return await self.loop.run_in_executor(self.executor, context.run, func, *args)
+
+    async def dispatch(self, session, op, args):
+        if op == "ping":
+            return "pong"
+        if op == "register":
+            return await self.call(self.auth_manager.register, *args)
+        if op == "login":
+            return await self.login(session, *args)
+        if op == "logout":
+            session.logout()
+            return True
+
+        if session.username is None:
+            raise PermissionError("not logged in")
+
+        if op in MAILBOX_OPS:
+            self.check_user(session, args[0])
+            result = await self.call(getattr(self.email_manager, op), *args)
+            if op == "get_attachment" and result is not None:
+                # Downloads ask for the metadata first; keep its chunk list
+                # for the get_attachment_chunk requests that follow
+                session.attachment_chunks[(args[1], args[2])] = result['chunks']
+            return result.to_dict() if isinstance(result, RetryAfter) else result
+        if op in EMAIL_DATA_OPS:
+            self.check_user(session, args[0]['sender'])
+            result = await self.call(getattr(self.email_manager, op), *args)
+            return result.to_dict() if isinstance(result, RetryAfter) else result
+        if op == "put_chunk":
+            digest = await self.call(self.email_manager.put_chunk, base64.b64decode(args[0]))
+            session.uploaded_chunks.add(digest)
+            return digest
+        if op == "missing_chunks":
+            return await self.call(
+                self.email_manager.missing_chunks, args[0], session.username, set(session.uploaded_chunks)
+            )
+        if op == "commit_attachment":
+            filename, content_type, digests, *rest = args
+            sha256 = rest[0] if rest else None
+            return await self.call(
+                self.email_manager.commit_attachment, filename, content_type, digests, sha256,
+                session.username, set(session.uploaded_chunks)
+            )
+        if op == "get_attachment_chunk":
+            username, email_id, attachment_id, index = args
+            self.check_user(session, username)
+            return base64.b64encode(await self.attachment_chunk(session, email_id, attachment_id, index)).decode()
+        if op == "metrics":
+            self.check_admin(session)
+            # Snapshot of this server's metrics: "prometheus" text or "json" data
+            if args and args[0] == "prometheus":
+                return metrics.to_prometheus()
+            return metrics.snapshot()
+        if op == "profile":
+            # Captures write files on the server, and the slow-op log records
+            # other users' task arguments
+            self.check_admin(session)
+            return self.profile(*args)
+        if op == "enqueue":
+            action, *task_args = args
+            if action not in QUEUE_ACTIONS:
+                raise ValueError(f"unknown action {action}")
+            self.check_user(session, QUEUE_ACTIONS[action](task_args))
+            result = await self.call(self.email_manager.enqueue, action, *task_args)
+            return result.to_dict() if isinstance(result, RetryAfter) else result
+        raise ValueError(f"unknown operation {op}")
+
+    async def attachment_chunk(self, session, email_id, attachment_id, index):
+        # The chunk list is resolved once per attachment and session, so
+        # each chunk request reads one chunk rather than the emails file
+        key = (email_id, attachment_id)
+        chunks = session.attachment_chunks.get(key)
+        if chunks is None:
+            attachment = await self.call(
+                self.email_manager.get_attachment, session.username, email_id, attachment_id
+            )
+            if attachment is None:
+                raise KeyError(f"attachment {attachment_id} not found")
+            chunks = session.attachment_chunks[key] = attachment['chunks']
+        return await self.call(self.email_manager.get_chunk, chunks[index])
+
+    def profile(self, kind, value=None):
+        # Start a capture ("sample" or "cprofile", value = seconds) and
+        # return its dump path, or set the slow-op threshold ("slow_ops",
+        # value = seconds, None to turn it off)
+        if kind == "sample":
+            path = profiler.sample(value or DEFAULT_CAPTURE_SECONDS)
+        elif kind == "cprofile":
+            path = profiler.capture_cprofile(value or DEFAULT_CAPTURE_SECONDS)
+        elif kind == "slow_ops":
+            profiler.set_slow_threshold(value)
+            return str(profiler.dump_dir / "slow_ops.jsonl")
+        else:
+            raise ValueError(f"unknown profile kind {kind}")
+        if path is None:
+            raise RuntimeError(f"a {kind} capture is already running")
+        return str(path)
+
+    def check_user(self, session, username):
+        if username != session.username:
+            raise PermissionError("forbidden")
+
+    def check_admin(self, session):
+        if session.username not in self.admin_users:
+            raise PermissionError("forbidden")
+
+    async def login(self, session, username, password):
+        if not await self.call(self.auth_manager.login, username, password):
+            return False
+        session.logout()
+        session.username = username
+        loop = self.loop
+        session.unsubscribe = self.email_manager.subscribe(
+            username,
+            lambda event: loop.call_soon_threadsafe(session.send, {"event": event})
+        )
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the mail server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--metrics", action="store_true", help="collect operation metrics")
+    parser.add_argument("--tracing", action="store_true", help="also record trace spans")
+    parser.add_argument("--profile-dir", default=str(profiler.dump_dir), help="where profiling dumps are written")
+    parser.add_argument("--slow-op-ms", type=float, help="log queue tasks slower than this")
+    parser.add_argument("--admin-user", action="append", default=[],
+                        help="account allowed to use the metrics and profile operations (repeatable)")
+    parser.add_argument("--capture", metavar="TRACE_FILE", help="record every manager call to this JSON-lines file")
+    parser.add_argument("--capture-redact-bodies", action="store_true", help="replace message bodies in the trace")
+    options = parser.parse_args()
+
+    if options.metrics or options.tracing:
+        metrics.enable(tracing=options.tracing)
+    profiler.configure(dump_dir=options.profile_dir)
+    if options.slow_op_ms is not None:
+        profiler.set_slow_threshold(options.slow_op_ms / 1000)
+    # SIGUSR1 / SIGUSR2 start a sampling / cProfile capture without a restart
+    profiler.install_signal_handlers()
+
+    data_manager = DataManager(options.data_dir)
+    auth_manager = AuthManager(data_manager)
+    email_manager = EmailManager(data_manager)
+    if options.capture:
+        recorder = WorkloadRecorder(options.capture, redact_bodies=options.capture_redact_bodies)
+        auth_manager = CapturingProxy(auth_manager, recorder, "auth")
+        email_manager = CapturingProxy(email_manager, recorder, "email")
+
+    server = MailServer(options.host, options.port, data_manager, auth_manager, email_manager,
+                        admin_users=options.admin_user)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import cProfile
+import json
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+DEFAULT_DUMP_DIR = "profiles"
+DEFAULT_CAPTURE_SECONDS = 10.0
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+MAX_ARG_LENGTH = 200  # Longer argument values are truncated in slow-op logs
+
+# Phases timed inside an operation; whatever is left over is "mutate"
+PHASES = ("lock_wait", "load", "serialize", "write")
+
+
+def _truncate(value):
+    # Keep slow-op log lines small: cut long strings (e.g. email bodies)
+    if isinstance(value, str):
+        return value if len(value) <= MAX_ARG_LENGTH else value[:MAX_ARG_LENGTH] + "..."
+    if isinstance(value, dict):
+        return {key: _truncate(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_truncate(item) for item in value]
+    return value
+
+
+class _NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_CONTEXT = _NullContext()
+
+
+class _Phase:
+    def __init__(self, operation, name):
+        self.operation = operation
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        phases = self.operation.phases
+        phases[self.name] = phases.get(self.name, 0.0) + time.perf_counter() - self.started
+        return False
+
+
+class _Operation:
+    # One queue task being watched for the slow-op log and/or profiled
+    def __init__(self, profiler, action, args):
+        self.profiler = profiler
+        self.action = action
+        self.args = args
+        self.phases = {}
+        self.profile = None
+
+    def __enter__(self):
+        self.profiler.local.operation = self
+        if self.profiler.cprofile_until is not None and self.profiler.cprofile_lock.acquire(blocking=False):
+            # Only one thread can run cProfile at a time; tasks on other
+            # consumers during the window go unprofiled
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        self.profiler.local.operation = None
+        if self.profile is not None:
+            self.profile.disable()
+            # Hand the profile over before releasing the lock, which
+            # _finish_cprofile waits on before collecting
+            self.profiler._add_profile(self.profile)
+            self.profiler.cprofile_lock.release()
+        threshold = self.profiler.slow_threshold
+        if threshold is not None and duration >= threshold:
+            self.profiler._log_slow_op(self, duration, exc)
+        return False
+
+
+class Profiler:
+    # Runtime-toggleable profiling for a running server:
+    #
+    # - sample(): records every thread's stack via sys._current_frames()
+    #   for a time window and writes collapsed stacks (flame graph input).
+    # - capture_cprofile(): runs cProfile around queue tasks for a time
+    #   window and writes a merged .prof file for pstats/snakeviz.
+    # - set_slow_threshold(): logs every queue task slower than the
+    #   threshold, with its arguments and a phase breakdown, to
+    #   slow_ops.jsonl.
+    #
+    # Dumps go to dump_dir. When nothing is active, the hooks in the hot
+    # path cost one or two attribute checks.
+
+    def __init__(self, dump_dir=DEFAULT_DUMP_DIR, slow_threshold=None):
+        self.dump_dir = Path(dump_dir)
+        self.slow_threshold = slow_threshold  # Seconds, or None when off
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.sampling = False
+        self.cprofile_until = None
+        self.cprofile_lock = threading.Lock()
+        self.profiles = []
+
+    def configure(self, dump_dir):
+        self.dump_dir = Path(dump_dir)
+
+    def set_slow_threshold(self, seconds):
+        # None turns the slow-op log off
+        self.slow_threshold = seconds
+
+    def operation(self, action, args=()):
+        # Wrap a queue task; returns a no-op context unless a slow-op
+        # threshold or a cProfile window is active
+        if self.slow_threshold is None and self.cprofile_until is None:
+            return NULL_CONTEXT
+        return _Operation(self, action, args)
+
+    def phase(self, name):
+        # Time part of the current operation on this thread, if any
+        if self.slow_threshold is None:
+            return NULL_CONTEXT
+        operation = getattr(self.local, 'operation', None)
+        if operation is None:
+            return NULL_CONTEXT
+        return _Phase(operation, name)
+
+    def _dump_path(self, kind, suffix):
+        self.dump_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        return self.dump_dir / f"{kind}-{stamp}.{suffix}"
+
+    def _log_slow_op(self, operation, duration, error):
+        phases = {name: operation.phases.get(name, 0.0) for name in PHASES}
+        phases['mutate'] = max(0.0, duration - sum(phases.values()))
+        record = {
+            'time': datetime.now().isoformat(),
+            'action': operation.action,
+            'args': _truncate(list(operation.args)),
+            'duration': duration,
+            'phases': phases,
+            'error': repr(error) if error is not None else None,
+        }
+        print(f"Slow task {operation.action}: {duration * 1000:.1f} ms")
+        try:
+            self.dump_dir.mkdir(parents=True, exist_ok=True)
+            with self.lock:
+                with open(self.dump_dir / "slow_ops.jsonl", 'a') as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+        except Exception as e:
+            print(f"Error writing slow-op log: {e}")
+
+    def sample(self, duration=DEFAULT_CAPTURE_SECONDS, interval=SAMPLE_INTERVAL):
+        # Start sampling in the background; returns the path the collapsed
+        # stacks will be written to, or None if a capture is already running
+        with self.lock:
+            if self.sampling:
+                return None
+            self.sampling = True
+        path = self._dump_path("sample", "txt")
+        thread = threading.Thread(target=self._run_sampler, args=(duration, interval, path))
+        thread.daemon = True  # Exit when main program exits
+        thread.start()
+        return path
+
+    def _run_sampler(self, duration, interval, path):
+        stacks = Counter()
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + duration
+        try:
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    stack.append(names.get(thread_id, str(thread_id)))
+                    stacks[";".join(reversed(stack))] += 1
+                time.sleep(interval)
+            with open(path, 'w') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        except Exception as e:
+            print(f"Error writing stack samples to {path}: {e}")
+        finally:
+            with self.lock:
+                self.sampling = False
+
+    def capture_cprofile(self, duration=DEFAULT_CAPTURE_SECONDS):
+        # Profile queue tasks for `duration` seconds; returns the path the
+        # merged stats will be written to, or None if already capturing
+        with self.lock:
+            if self.cprofile_until is not None:
+                return None
+            self.profiles = []
+            self.cprofile_until = time.monotonic() + duration
+        path = self._dump_path("cprofile", "prof")
+        timer = threading.Timer(duration, self._finish_cprofile, args=(path,))
+        timer.daemon = True
+        timer.start()
+        return path
+
+    def _add_profile(self, profile):
+        with self.lock:
+            self.profiles.append(profile)
+
+    def _finish_cprofile(self, path):
+        with self.lock:
+            self.cprofile_until = None
+        # Wait out a task still being profiled, so its stats are included
+        with self.cprofile_lock:
+            with self.lock:
+                profiles = self.profiles
+                self.profiles = []
+        try:
+            stats = pstats.Stats(*profiles) if profiles else pstats.Stats(cProfile.Profile())
+            stats.dump_stats(path)
+        except Exception as e:
+            print(f"Error writing profile to {path}: {e}")
+
+    def install_signal_handlers(self, duration=DEFAULT_CAPTURE_SECONDS):
+        # SIGUSR1 takes a stack-sampling capture, SIGUSR2 a cProfile capture
+        if not hasattr(signal, "SIGUSR1"):
+            return False  # Not available on Windows
+        signal.signal(signal.SIGUSR1, lambda signum, frame: print(f"Sampling to {self.sample(duration)}"))
+        signal.signal(signal.SIGUSR2, lambda signum, frame: print(f"Profiling to {self.capture_cprofile(duration)}"))
+        return True
+
+
+# Shared by every manager in the process
+profiler = Profiler(
+    dump_dir=os.environ.get("MAIL_PROFILE_DIR", DEFAULT_DUMP_DIR),
+    slow_threshold=float(os.environ["MAIL_SLOW_OP_SECONDS"]) if os.environ.get("MAIL_SLOW_OP_SECONDS") else None,
+)
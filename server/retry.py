@@ -0,0 +1,82 @@
+import random
+import uuid
+from datetime import datetime
+
+
+class RetryPolicy:
+    # Exponential backoff with jitter: attempt n waits about
+    # base_delay * 2 ** (n - 1), capped at max_delay, scaled down by a random
+    # factor of up to `jitter` so failed tasks don't retry in lockstep.
+
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=60.0, jitter=0.5):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def should_retry(self, attempt):
+        return attempt < self.max_attempts
+
+    def delay(self, attempt):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * random.uniform(1 - self.jitter, 1)
+
+
+# Per-action policies; actions without one go straight to the dead-letter store
+DEFAULT_RETRY_POLICIES = {
+    "send_email": RetryPolicy(max_attempts=5),
+    "move_to_trash": RetryPolicy(max_attempts=3),
+    "save_draft": RetryPolicy(max_attempts=3),
+    "unsnooze": RetryPolicy(max_attempts=5),
+}
+
+
+class DeadLetterStore:
+    # Tasks that exhausted their retries, persisted so they can be inspected
+    # and replayed after the underlying problem is fixed.
+
+    def __init__(self, data_manager):
+        self.data_manager = data_manager
+
+    @property
+    def file_path(self):
+        return self.data_manager.dead_letters_file
+
+    def add(self, task, attempts, error):
+        # Raises if the entry couldn't be stored, so the caller can say so
+        entry = {
+            'id': str(uuid.uuid4()),
+            'task': list(task),
+            'attempts': attempts,
+            'error': f"{type(error).__name__}: {error}",
+            'failed_at': datetime.now().isoformat(),
+        }
+        # read_data/write_data raise rather than returning None, so an
+        # unreadable file is never taken for an empty one and overwritten
+        with self.data_manager.lock(self.file_path):
+            entries = self.data_manager.read_data(self.file_path) or []
+            entries.append(entry)
+            self.data_manager.write_data(self.file_path, entries)
+        return entry['id']
+
+    def list(self):
+        return self.data_manager.read_data(self.file_path) or []
+
+    def get(self, entry_id):
+        for entry in self.list():
+            if entry['id'] == entry_id:
+                return entry
+        return None
+
+    def remove(self, entry_id):
+        try:
+            with self.data_manager.lock(self.file_path):
+                entries = self.data_manager.read_data(self.file_path) or []
+                remaining = [entry for entry in entries if entry['id'] != entry_id]
+                if len(remaining) == len(entries):
+                    return None
+                self.data_manager.write_data(self.file_path, remaining)
+                return next(entry for entry in entries if entry['id'] == entry_id)
+        except Exception as e:
+            print(f"Error removing dead letter {entry_id}: {e}")
+            return None
@@ -0,0 +1,214 @@
+import heapq
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from server.data_manager import FileLock
+
+DISPATCH_RETRY_DELAY = 1.0  # Seconds before a task whose dispatch raised is tried again
+
+
+class TaskScheduler:
+    # Delayed tasks kept in a min-heap ordered by due time. A single thread
+    # sleeps until the earliest task is due and hands it to
+    # `dispatch(task_id, task)`. The task stays pending until whoever runs
+    # it calls complete(task_id), so a task that was dispatched but not yet
+    # run when the process died is dispatched again by load().
+    #
+    # Tasks survive restarts through an append-only JSON-lines log of
+    # "add" and "done" records, so scheduling costs one appended line rather
+    # than a rewrite of every pending task. The log is compacted once most
+    # of its records are for finished tasks. Appends and compaction take
+    # the log's FileLock, since several processes can share one data
+    # directory and so one log.
+
+    def __init__(self, schedule_file, dispatch):
+        self.schedule_file = Path(schedule_file)
+        self.dispatch = dispatch
+        self.heap = []  # (due timestamp, sequence, task id)
+        self.tasks = {}  # task id -> (due timestamp, task) for pending tasks
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.file_lock = FileLock(self.schedule_file)
+        self.log = None
+        self.log_records = 0
+        self.thread = None
+        self.running = False
+        self.loaded = False
+
+    def load(self):
+        # Restore pending tasks from the log and start dispatching them
+        with self.condition:
+            if self.loaded:
+                return
+            self.loaded = True
+            try:
+                if not self.schedule_file.exists():
+                    return
+                pending, self.log_records = self._read_log()
+                for task_id, record in pending.items():
+                    self.tasks[task_id] = (record['due'], tuple(record['task']))
+                self.heap = [
+                    (due, next(self.sequence), task_id)
+                    for task_id, (due, _) in self.tasks.items()
+                ]
+                heapq.heapify(self.heap)
+                if self.tasks:
+                    self.start()
+            except Exception as e:
+                print(f"Error loading scheduled tasks from {self.schedule_file}: {e}")
+
+    def _read_log(self):
+        # Returns ({task id: add record} for pending tasks, record count)
+        pending = {}
+        count = 0
+        with open(self.schedule_file, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # A torn final line from an interrupted append
+                count += 1
+                if record['op'] == 'add':
+                    pending[record['id']] = record
+                else:
+                    pending.pop(record['id'], None)
+        return pending, count
+
+    def _log_is_current(self):
+        # False once the log was replaced by a compaction, here or in
+        # another process, or by a restore
+        try:
+            return os.fstat(self.log.fileno()).st_ino == os.stat(self.schedule_file).st_ino
+        except OSError:
+            return False
+
+    def _append(self, record):
+        with self.file_lock:
+            if self.log is not None and not self._log_is_current():
+                self.log.close()
+                self.log = None
+            if self.log is None:
+                self.log = open(self.schedule_file, 'a')
+            self.log.write(json.dumps(record) + "\n")
+            self.log.flush()
+        self.log_records += 1
+
+    def _compact(self):
+        # Rewrite the log with only pending tasks. Called without the
+        # condition held, so scheduling and dispatch carry on meanwhile.
+        # Pending tasks are read back from the log rather than self.tasks,
+        # which lacks those added by other processes sharing it.
+        with self.file_lock:
+            pending, _ = self._read_log()
+            tmp_path = Path(f"{self.schedule_file}.{os.getpid()}.tmp")
+            try:
+                with open(tmp_path, 'w') as f:
+                    for record in pending.values():
+                        f.write(json.dumps(record) + "\n")
+                os.replace(tmp_path, self.schedule_file)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+
+    def schedule(self, due, task):
+        # `due` is a datetime or a Unix timestamp; returns an id for cancel()
+        if isinstance(due, datetime):
+            due = due.timestamp()
+        task_id = str(uuid.uuid4())
+        with self.condition:
+            self._append({'op': 'add', 'id': task_id, 'due': due, 'task': list(task)})
+            self.tasks[task_id] = (due, tuple(task))
+            heapq.heappush(self.heap, (due, next(self.sequence), task_id))
+            # Only wake the scheduler thread if this task is now the earliest
+            if self.heap[0][2] == task_id:
+                self.condition.notify()
+        self.start()
+        return task_id
+
+    def cancel(self, task_id):
+        # The heap entry is skipped lazily when it reaches the top
+        with self.condition:
+            if task_id not in self.tasks:
+                return False
+            del self.tasks[task_id]
+            self._append({'op': 'done', 'id': task_id})
+            return True
+
+    def complete(self, task_id):
+        # Mark a dispatched task as run
+        compact = False
+        with self.condition:
+            if self.tasks.pop(task_id, None) is not None:
+                self._append({'op': 'done', 'id': task_id})
+            if self.log_records > 1000 and self.log_records > 2 * len(self.tasks):
+                # Reset the count now, so only this call compacts
+                self.log_records = len(self.tasks)
+                compact = True
+        if compact:
+            try:
+                self._compact()
+            except Exception as e:
+                print(f"Error compacting {self.schedule_file}: {e}")
+
+    def pending(self):
+        with self.condition:
+            return len(self.tasks)
+
+    def next_due(self):
+        with self.condition:
+            self._discard_cancelled()
+            return self.heap[0][0] if self.heap else None
+
+    def _discard_cancelled(self):
+        while self.heap and self.heap[0][2] not in self.tasks:
+            heapq.heappop(self.heap)
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True  # Exit when main program exits
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        while True:
+            with self.condition:
+                self._discard_cancelled()
+                if not self.running:
+                    return
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                delay = self.heap[0][0] - time.time()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+                _, _, task_id = heapq.heappop(self.heap)
+                _, task = self.tasks[task_id]
+
+            try:
+                self.dispatch(task_id, task)
+            except Exception as e:
+                # queue.Full just means the consumers are saturated
+                if not isinstance(e, queue.Full):
+                    print(f"Error dispatching scheduled task {task_id}, retrying: {e}")
+                with self.condition:
+                    if task_id in self.tasks:
+                        due = time.time() + DISPATCH_RETRY_DELAY
+                        heapq.heappush(self.heap, (due, next(self.sequence), task_id))
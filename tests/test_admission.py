@@ -0,0 +1,161 @@
+import pytest
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+# Add project root to Python path
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(base_dir)
+
+from server.admission import AdmissionController, RetryAfter, TokenBuckets
+from server.data_manager import DataManager
+from server.email_manager import EmailManager
+
+class TestTokenBuckets:
+    def test_burst_then_refill(self):
+        """Test that a bucket allows a burst, then refills at its rate"""
+        buckets = TokenBuckets(burst=3, rate=2.0)
+        assert [buckets.take("alice", 0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert buckets.take("alice", 0.0) == pytest.approx(0.5)
+        assert buckets.take("alice", 0.5) == 0.0  # One token back after 0.5s
+        assert buckets.take("bob", 0.5) == 0.0  # Other users are unaffected
+    
+    def test_refill_is_capped_at_burst(self):
+        """Test that idle time doesn't bank more than a burst"""
+        buckets = TokenBuckets(burst=2, rate=1.0)
+        buckets.take("alice", 0.0)
+        assert [buckets.take("alice", 100.0) for _ in range(3)][-1] > 0
+    
+    def test_prune_drops_only_full_buckets(self):
+        """Test that pruning forgets idle users but keeps partial buckets"""
+        buckets = TokenBuckets(burst=2, rate=1.0)
+        buckets.take("idle", 0.0)
+        buckets.take("busy", 10.0)
+        buckets.prune(10.0)
+        assert list(buckets.slots) == ["busy"]
+        assert buckets.tokens[buckets.slots["busy"]] == 1.0
+
+class TestAdmissionController:
+    def create_test_email(self, sender="alice"):
+        """Helper method to create a test email"""
+        return {
+            'id': str(uuid.uuid4()),
+            'sender': sender,
+            'recipient': "bob",
+            'subject': "Test Subject",
+            'body': "Test Body",
+            'timestamp': datetime.now().isoformat(),
+            'status': 'sent'
+        }
+    
+    def test_global_cap(self):
+        """Test that the in-flight cap rejects every action"""
+        admission = AdmissionController(max_in_flight=2)
+        assert admission.admit("send_email", (self.create_test_email(),), 1) is None
+        rejected = admission.admit("move_to_trash", ("alice", "x"), 2)
+        assert isinstance(rejected, RetryAfter)
+        assert rejected.reason == "busy"
+    
+    def test_rejected_sends_get_retry_after(self, tmp_path):
+        """Test that a flooding sender is turned away without blocking"""
+        email_manager = EmailManager(
+            DataManager(tmp_path), admission=AdmissionController(send_burst=2, send_rate=0.5)
+        )
+        results = [email_manager.enqueue("send_email", self.create_test_email()) for _ in range(3)]
+        assert results[:2] == [True, True]
+        assert not results[2]
+        assert results[2].reason == "rate limited"
+        assert 0 < results[2].seconds <= 2.0
+        
+        # Another sender still gets through
+        assert email_manager.enqueue("send_email", self.create_test_email("carol")) is True
+        email_manager.email_queue.join()
+        assert len(email_manager.get_user_emails("bob", "inbox")) == 3
+    
+    def test_full_lane_rejects_without_waiting(self, tmp_path):
+        """Test that a full lane returns "queue full" straight away"""
+        email_manager = EmailManager(DataManager(tmp_path), consumers=0)
+        for i in range(5):
+            assert email_manager.enqueue("send_email", self.create_test_email(f"user{i}")) is True
+        
+        started = time.monotonic()
+        rejected = email_manager.enqueue("send_email", self.create_test_email("late"))
+        assert time.monotonic() - started < 0.1
+        assert rejected.reason == "queue full"
+        # The rejected sender's token was refunded
+        assert email_manager.admission.buckets["send"].tokens[
+            email_manager.admission.buckets["send"].slots["late"]
+        ] == 20
+    
+    def test_global_cap_defaults_to_queue_capacity(self, tmp_path):
+        """Test that the default cap turns work away as busy once the queue is full"""
+        email_manager = EmailManager(DataManager(tmp_path), consumers=0)
+        assert email_manager.admission.max_in_flight is None
+        for i in range(5):
+            assert email_manager.enqueue("send_email", self.create_test_email(f"user{i}")) is True
+            assert email_manager.enqueue("move_to_trash", f"user{i}", "x") is True
+            assert email_manager.enqueue("send_email", self.create_test_email(f"bulk{i}"), lane="bulk") is True
+        
+        rejected = email_manager.enqueue("save_draft", self.create_test_email("late"))
+        assert rejected.reason == "busy"
+        assert email_manager.email_queue.unfinished_tasks == email_manager.email_queue.capacity() == 15
+    
+    def test_concurrent_callers_respect_cap(self, tmp_path):
+        """Test that racing enqueues never admit more than the cap"""
+        email_manager = EmailManager(
+            DataManager(tmp_path), consumers=0, admission=AdmissionController(max_in_flight=3)
+        )
+        barrier = threading.Barrier(10)
+        results = []
+        
+        def send(i):
+            barrier.wait()
+            results.append(email_manager.enqueue("send_email", self.create_test_email(f"user{i}")))
+        
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert results.count(True) == 3
+        assert {result.reason for result in results if result is not True} == {"busy"}
+        assert email_manager.email_queue.unfinished_tasks == 3
+    
+    def test_direct_operations_are_charged(self, tmp_path):
+        """Test that mutations and scheduled sends made outside the queue are rate limited"""
+        email_manager = EmailManager(
+            DataManager(tmp_path), consumers=0,
+            admission=AdmissionController(send_burst=1, send_rate=0.1, mutation_burst=2, mutation_rate=0.1)
+        )
+        draft = self.create_test_email()
+        assert email_manager.save_draft(draft) is True
+        assert email_manager.mark_as_read("alice", draft['id']) is True
+        rejected = email_manager.delete_draft("alice", draft['id'])
+        assert rejected.reason == "rate limited"
+        assert email_manager.get_user_emails("alice", "draft")  # Nothing was deleted
+        # Other users have their own buckets
+        assert email_manager.autosave_draft(self.create_test_email("carol")) is True
+        
+        # A scheduled send spends the sender's send token up front
+        assert email_manager.schedule_send(self.create_test_email(), time.time() + 60)
+        assert email_manager.schedule_send(self.create_test_email(), time.time()).reason == "rate limited"
+        assert email_manager.enqueue("send_email", self.create_test_email()).reason == "rate limited"
+        assert email_manager.scheduler.pending() == 1
+    
+    def test_full_lane_rejects_without_admission(self, tmp_path):
+        """Test that enqueue and scheduled dispatch never wait when admission control is off"""
+        email_manager = EmailManager(DataManager(tmp_path), consumers=0)
+        email_manager.admission = None
+        for i in range(5):
+            assert email_manager.enqueue("send_email", self.create_test_email(f"user{i}")) is True
+        
+        started = time.monotonic()
+        assert email_manager.enqueue("send_email", self.create_test_email("late")).reason == "queue full"
+        with pytest.raises(queue.Full):
+            email_manager._dispatch_scheduled("task", ("send_email", self.create_test_email("later")))
+        assert time.monotonic() - started < 0.1
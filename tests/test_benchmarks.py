@@ -0,0 +1,69 @@
+import pytest
+import os
+import sys
+
+# Add project root to Python path
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(base_dir)
+
+from benchmarks.bench import compare, run, summarize
+from benchmarks.generator import generate, populate
+from benchmarks.load import LoadRun
+from server.data_manager import DataManager
+from server.email_manager import EmailManager
+
+class TestGenerator:
+    def test_same_seed_same_data(self):
+        """Test that datasets are reproducible"""
+        assert generate(5, 50, seed=3) == generate(5, 50, seed=3)
+        assert generate(5, 50, seed=3) != generate(5, 50, seed=4)
+    
+    def test_every_message_has_sent_and_inbox_copies(self):
+        """Test the generated layout matches what save_email writes"""
+        users, emails = generate(5, 50)
+        assert len(users) == 5
+        copies = [email for user_emails in emails.values() for email in user_emails]
+        assert sum(email['status'] == 'sent' for email in copies) == 50
+        assert sum(email['status'] == 'inbox' for email in copies) == 50
+        for username, user_emails in emails.items():
+            for email in user_emails:
+                owner = email['sender'] if email['status'] == 'sent' else email['recipient']
+                assert owner == username
+
+class TestBench:
+    def test_summarize(self):
+        """Test percentiles and throughput"""
+        stats = summarize([0.001 * i for i in range(1, 101)])
+        assert stats['p50_ms'] == pytest.approx(51)
+        assert stats['p99_ms'] == pytest.approx(100)
+        assert stats['ops_per_sec'] == pytest.approx(100 / 5.05)
+    
+    def test_compare_flags_regressions(self):
+        """Test that only p50 growth past the threshold is reported"""
+        baseline = {'results': {'10x100': {'login': {'p50_ms': 1.0}, 'save_email': {'p50_ms': 10.0}}}}
+        results = {'results': {'10x100': {'login': {'p50_ms': 1.5}, 'save_email': {'p50_ms': 11.0}}}}
+        assert compare(results, baseline, threshold=0.25) == [('10x100', 'login', 1.0, 1.5)]
+    
+    def test_run_small_dataset(self):
+        """Test a full run reports every operation"""
+        results = run([(3, 10)], repeat=3)
+        assert set(results['results']['3x10']) == {
+            'save_email', 'get_user_emails', 'get_unread_count', 'move_to_trash', 'login'
+        }
+
+class TestLoadRun:
+    def test_mixed_workload_loses_nothing(self, tmp_path):
+        """Test a short concurrent run end to end"""
+        data_manager = DataManager(tmp_path)
+        users, _ = populate(data_manager, 4, 20)
+        email_manager = EmailManager(data_manager)
+        report = LoadRun(email_manager, sorted(users), sessions=4, duration=0.5, sample_interval=0.1).run()
+        
+        integrity = report['integrity']
+        assert integrity['messages_sent'] > 0
+        assert integrity['lost'] == []
+        assert integrity['duplicated'] == []
+        assert report['unacknowledged'] == 0
+        assert report['latency']['send']['count'] == integrity['messages_sent']
+        assert report['lock']['acquisitions'] > 0
+        assert len(report['samples']) >= 2
@@ -0,0 +1,233 @@
+import asyncio
+import os
+import sys
+import threading
+import uuid
+from datetime import datetime
+
+# Add project root to Python path
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(base_dir)
+
+from benchmarks.replay import Replayer, load_trace
+from client.remote_client import RemoteAuthManager, RemoteConnection, RemoteEmailManager
+from server.auth_manager import AuthManager
+from server.capture import REDACTED, CapturingProxy, WorkloadRecorder
+from server.data_manager import DataManager
+from server.email_manager import EmailManager
+from server.network_server import MailServer
+
+class TestCapture:
+    def create_test_email(self, body="Test Body"):
+        """Helper method to create a test email"""
+        return {
+            'id': str(uuid.uuid4()),
+            'sender': "alice",
+            'recipient': "bob",
+            'subject': "Test Subject",
+            'body': body,
+            'timestamp': datetime.now().isoformat(),
+            'status': 'sent'
+        }
+
+    def capture(self, data_dir, trace_file, redact_bodies=False):
+        """Helper method to wrap fresh managers in capturing proxies"""
+        data_manager = DataManager(data_dir)
+        recorder = WorkloadRecorder(trace_file, redact_bodies=redact_bodies)
+        auth_manager = CapturingProxy(AuthManager(data_manager), recorder, "auth")
+        email_manager = CapturingProxy(EmailManager(data_manager), recorder, "email")
+        return recorder, auth_manager, email_manager
+
+    def test_calls_are_recorded_with_passwords_redacted(self, tmp_path):
+        """Test that proxied calls are recorded and passwords never are"""
+        recorder, auth_manager, email_manager = self.capture(tmp_path / "data", tmp_path / "trace.jsonl")
+        assert auth_manager.register("alice", "secret")
+        assert auth_manager.login("alice", "secret")
+        assert email_manager.get_unread_count("alice") == 0
+        recorder.close()
+
+        records = load_trace(tmp_path / "trace.jsonl")
+        assert [(record['component'], record['op']) for record in records] == [
+            ("auth", "register"), ("auth", "login"), ("email", "get_unread_count")
+        ]
+        assert records[0]['args'] == ["alice", REDACTED]
+        assert records[2]['args'] == ["alice"]
+        assert all(record['duration'] >= 0 and not record['error'] for record in records)
+        assert "secret" not in (tmp_path / "trace.jsonl").read_text()
+
+    def test_body_redaction_keeps_length(self, tmp_path):
+        """Test that redacted bodies are replaced by filler of the same size"""
+        recorder, auth_manager, email_manager = self.capture(
+            tmp_path / "data", tmp_path / "trace.jsonl", redact_bodies=True
+        )
+        email_manager.enqueue("send_email", self.create_test_email("Meet at noon"))
+        email_manager.email_queue.join()
+        recorder.close()
+
+        record = load_trace(tmp_path / "trace.jsonl")[0]
+        assert record['args'][1]['body'] == "x" * len("Meet at noon")
+        assert record['args'][1]['subject'] == "Test Subject"
+
+    def test_subscribe_is_not_recorded(self, tmp_path):
+        """Test that callback methods pass straight through the proxy"""
+        recorder, auth_manager, email_manager = self.capture(tmp_path / "data", tmp_path / "trace.jsonl")
+        unsubscribe = email_manager.subscribe("alice", lambda event: None)
+        unsubscribe()
+        recorder.close()
+
+        assert load_trace(tmp_path / "trace.jsonl") == []
+
+    def test_replay_reproduces_mailbox(self, tmp_path):
+        """Test that replaying a trace on a fresh data dir recreates the emails"""
+        recorder, auth_manager, email_manager = self.capture(tmp_path / "data", tmp_path / "trace.jsonl")
+        auth_manager.register("alice", "secret")
+        auth_manager.register("bob", "hunter2")
+        auth_manager.login("alice", "secret")
+        email = self.create_test_email()
+        email_manager.enqueue("send_email", email)
+        email_manager.email_queue.join()
+        email_manager.get_user_emails("bob", "inbox")
+        recorder.close()
+
+        replay_manager = DataManager(tmp_path / "replay")
+        replay_emails = EmailManager(replay_manager)
+        replayer = Replayer(AuthManager(replay_manager), replay_emails, speed=None)
+        records = load_trace(tmp_path / "trace.jsonl")
+        replayer.prepare(records)
+        report = replayer.run(records)
+
+        assert report['calls'] == 5
+        assert all(stats['errors'] == 0 for stats in report['operations'].values())
+        inbox = replay_emails.get_user_emails("bob", "inbox")
+        assert [message['id'] for message in inbox] == [email['id']]
+        assert AuthManager(replay_manager).login("alice", "replay-alice")
+
+class TestServerCapture:
+    def start_server(self, data_dir, trace_file=None):
+        """Run a MailServer, optionally capturing, on a free localhost port"""
+        data_manager = DataManager(data_dir)
+        auth_manager = AuthManager(data_manager)
+        email_manager = EmailManager(data_manager)
+        recorder = None
+        if trace_file:
+            recorder = WorkloadRecorder(trace_file)
+            auth_manager = CapturingProxy(auth_manager, recorder, "auth")
+            email_manager = CapturingProxy(email_manager, recorder, "email")
+        mail_server = MailServer("127.0.0.1", 0, data_manager, auth_manager, email_manager)
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+        
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(mail_server.start())
+            started.set()
+            loop.run_forever()
+        
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        started.wait(5)
+        
+        def stop():
+            asyncio.run_coroutine_threadsafe(mail_server.close(), loop).result(5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(5)
+            if recorder:
+                recorder.close()
+        return mail_server, stop
+    
+    def create_test_email(self, sender, recipient):
+        """Helper method to create a test email"""
+        return {
+            'id': str(uuid.uuid4()),
+            'sender': sender,
+            'recipient': recipient,
+            'subject': "Test Subject",
+            'body': "Test Body",
+            'timestamp': datetime.now().isoformat(),
+            'status': 'sent'
+        }
+    
+    def capture_two_users(self, tmp_path):
+        """Helper method: alice and bob each send a message through the server"""
+        mail_server, stop = self.start_server(tmp_path / "data", tmp_path / "trace.jsonl")
+        sent = []
+        for username, other in (("alice", "bob"), ("bob", "alice")):
+            connection = RemoteConnection("127.0.0.1", mail_server.port)
+            auth, mail = RemoteAuthManager(connection), RemoteEmailManager(connection)
+            auth.register(username, "secret")
+            auth.login(username, "secret")
+            test_email = self.create_test_email(username, other)
+            assert mail.enqueue("send_email", test_email) is True
+            sent.append(test_email)
+            mail.list_headers(username, "inbox")
+            connection.close()
+        mail_server.email_manager.email_queue.join()
+        stop()
+        return sent
+    
+    def test_records_carry_client_session(self, tmp_path):
+        """Test that calls are tagged with their connection and user, not a worker thread"""
+        self.capture_two_users(tmp_path)
+        records = load_trace(tmp_path / "trace.jsonl")
+        
+        sessions = {}
+        for record in records:
+            sessions.setdefault(record['session'], []).append(record)
+        assert len(sessions) == 2
+        assert all(session.startswith("session-") for session in sessions)
+        for session_records in sessions.values():
+            assert [record['op'] for record in session_records] == ["register", "login", "enqueue", "list_headers"]
+            assert {record['user'] for record in session_records[2:]} in ({"alice"}, {"bob"})
+    
+    def test_replay_against_server(self, tmp_path):
+        """Test that each session replays on its own logged-in connection"""
+        sent = self.capture_two_users(tmp_path)
+        records = load_trace(tmp_path / "trace.jsonl")
+        
+        mail_server, stop = self.start_server(tmp_path / "replay")
+        connect = lambda: RemoteConnection("127.0.0.1", mail_server.port)
+        replayer = Replayer(speed=None, connect=connect)
+        replayer.prepare(records)
+        report = replayer.run(records)
+        mail_server.email_manager.email_queue.join()
+        
+        assert report['sessions'] == 2
+        assert report['errors'] == 0
+        inbox = mail_server.email_manager.get_user_emails("bob", "inbox")
+        assert [email['id'] for email in inbox] == [sent[0]['id']]
+        
+        # Calls the server refuses are counted as errors
+        forbidden = dict(records[-1], args=["somebody-else", "inbox"])
+        replayer = Replayer(speed=None, connect=connect)
+        report = replayer.run([forbidden])
+        assert report['errors'] == 1
+        stop()
+    
+    def test_local_trace_against_server(self, tmp_path):
+        """Test that calls with no wire operation are mapped or skipped, not counted as errors"""
+        data_manager = DataManager(tmp_path / "data")
+        recorder = WorkloadRecorder(tmp_path / "trace.jsonl")
+        auth_manager = CapturingProxy(AuthManager(data_manager), recorder, "auth")
+        email_manager = CapturingProxy(EmailManager(data_manager), recorder, "email")
+        auth_manager.register("alice", "secret")
+        auth_manager.register("bob", "hunter2")
+        auth_manager.login("alice", "secret")
+        email_manager.warm_up()
+        email = self.create_test_email("alice", "bob")
+        email_manager.save_email(email)
+        email_manager.flush_drafts()
+        email_manager.get_unread_count("alice")
+        recorder.close()
+        records = load_trace(tmp_path / "trace.jsonl")
+        
+        mail_server, stop = self.start_server(tmp_path / "replay")
+        replayer = Replayer(speed=None, connect=lambda: RemoteConnection("127.0.0.1", mail_server.port))
+        replayer.prepare(records)
+        report = replayer.run(records)
+        mail_server.email_manager.email_queue.join()
+        
+        assert report['errors'] == 0
+        assert report['skipped'] == {"email.warm_up": 1, "email.flush_drafts": 1}
+        inbox = mail_server.email_manager.get_user_emails("bob", "inbox")
+        assert [message['id'] for message in inbox] == [email['id']]
+        stop()
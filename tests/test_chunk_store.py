@@ -0,0 +1,48 @@
+import pytest
+import os
+import sys
+import io
+import hashlib
+
+# Add project root to Python path
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(base_dir)
+
+from server.chunk_store import ChunkStore
+
+class TestChunkStore:
+    def test_identical_chunks_are_stored_once(self, tmp_path):
+        """Test that putting the same data twice reuses one chunk file"""
+        store = ChunkStore(tmp_path)
+        first = store.put_chunk(b"hello")
+        second = store.put_chunk(b"hello")
+        
+        assert first == second == hashlib.sha256(b"hello").hexdigest()
+        assert store.get_chunk(first) == b"hello"
+        assert len(list(tmp_path.rglob("*"))) == 2  # One prefix directory, one chunk
+    
+    def test_put_stream_and_iter_chunks(self, tmp_path):
+        """Test splitting a stream into chunks and reading it back"""
+        store = ChunkStore(tmp_path, chunk_size=4)
+        data = b"0123456789"
+        progress = []
+        digests, size, sha256 = store.put_stream(io.BytesIO(data), progress.append)
+        
+        assert len(digests) == 3
+        assert size == len(data)
+        assert sha256 == hashlib.sha256(data).hexdigest()
+        assert progress == [4, 8, 10]
+        assert b"".join(store.iter_chunks(digests)) == data
+    
+    def test_rejects_oversized_chunk(self, tmp_path):
+        """Test that chunks larger than the agreed chunk size are refused"""
+        store = ChunkStore(tmp_path, chunk_size=4)
+        assert store.put_chunk(b"1234")
+        with pytest.raises(ValueError):
+            store.put_chunk(b"12345")
+    
+    def test_rejects_invalid_digest(self, tmp_path):
+        """Test that digests can't be used to reach paths outside the store"""
+        store = ChunkStore(tmp_path)
+        with pytest.raises(ValueError):
+            store.get_chunk("../../users.json")
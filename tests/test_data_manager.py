@@ -2,14 +2,28 @@ import pytest
 import os
 import sys
 import json
+import multiprocessing
+import threading
+import time
 from pathlib import Path
 
 # Add project root to Python path
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(base_dir)
 
+from server.chunk_store import ChunkStore
 from server.data_manager import DataManager
 
+def increment_counter(data_dir, times):
+    """Increment a shared counter from a separate process"""
+    data_manager = DataManager(data_dir)
+    counter_file = data_manager.data_dir / "counter.json"
+    for _ in range(times):
+        with data_manager.lock(counter_file):
+            data = data_manager.load_data(counter_file) or {"count": 0}
+            data["count"] += 1
+            data_manager.save_data(counter_file, data)
+
 class TestDataManager:
     @pytest.fixture
     def test_data_dir(self):
@@ -66,5 +80,128 @@ class TestDataManager:
         # Load and verify
         loaded_data = data_manager.load_data(data_manager.users_file)
         assert loaded_data == updated_data, "Data should be completely replaced"
+
+    def test_lock_prevents_lost_updates_across_processes(self, tmp_path):
+        """Test that concurrent processes don't lose each other's writes"""
+        context = multiprocessing.get_context("spawn")
+        workers = [
+            context.Process(target=increment_counter, args=(str(tmp_path), 50))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(60)
+        
+        data_manager = DataManager(tmp_path)
+        loaded_data = data_manager.load_data(tmp_path / "counter.json")
+        assert loaded_data == {"count": 200}, "No increments should be lost"
+    
+    def test_save_leaves_no_temporary_files(self, tmp_path):
+        """Test that atomic saves clean up after themselves"""
+        data_manager = DataManager(tmp_path)
+        data_manager.save_data(data_manager.users_file, {"key": "value"})
+        
+        assert not list(tmp_path.glob("*.tmp"))
+        assert data_manager.load_data(data_manager.users_file) == {"key": "value"}
+    
+    def test_lock_records_wait_time(self, tmp_path):
+        """Test that a contended lock reports the time spent waiting"""
+        data_manager = DataManager(tmp_path)
+        lock = data_manager.lock(data_manager.emails_file)
+        acquired = threading.Event()
+        
+        def hold():
+            with lock:
+                acquired.set()
+                time.sleep(0.05)
+        
+        thread = threading.Thread(target=hold)
+        thread.start()
+        acquired.wait(5)
+        with lock:
+            pass
+        thread.join()
+        
+        stats = lock.stats()
+        assert stats['acquisitions'] == 2
+        assert stats['max_wait'] >= 0.02
+        assert stats['wait_seconds'] >= stats['max_wait']
+    
+    def test_snapshot_and_restore(self, tmp_path):
+        """Test a full snapshot, an incremental one and restoring the first"""
+        data_manager = DataManager(tmp_path / "data")
+        backup_dir = tmp_path / "backups"
+        data_manager.save_data(data_manager.users_file, {"alice": {}})
+        data_manager.save_data(data_manager.emails_file, {"alice": [{"id": "1"}]})
+        
+        first = data_manager.snapshot(backup_dir)
+        assert first is not None
+        assert json.loads((first / "emails.json").read_text()) == {"alice": [{"id": "1"}]}
+        
+        data_manager.save_data(data_manager.emails_file, {"alice": [{"id": "1"}, {"id": "2"}]})
+        second = data_manager.snapshot(backup_dir)
+        manifest = json.loads((second / "manifest.json").read_text())
+        assert manifest['base'] == first.name
+        assert manifest['changed'] == 1  # Only emails.json was rewritten
+        assert (second / "users.json").stat().st_ino == (first / "users.json").stat().st_ino
+        
+        assert data_manager.restore(first) is True
+        assert data_manager.load_data(data_manager.emails_file) == {"alice": [{"id": "1"}]}
+        # The snapshot itself is untouched by later writes
+        data_manager.save_data(data_manager.emails_file, {})
+        assert json.loads((first / "emails.json").read_text()) == {"alice": [{"id": "1"}]}
+        assert data_manager.list_snapshots(backup_dir) == [first, second]
+    
+    def test_snapshot_while_writing(self, tmp_path):
+        """Test that snapshots taken during writes are always complete"""
+        data_manager = DataManager(tmp_path / "data")
+        stop = threading.Event()
+        
+        def write():
+            count = 0
+            while not stop.is_set():
+                count += 1
+                with data_manager.lock(data_manager.emails_file):
+                    data_manager.save_data(data_manager.emails_file, {"count": count, "padding": "x" * 100000})
+        
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            snapshots = [data_manager.snapshot(tmp_path / "backups") for _ in range(5)]
+        finally:
+            stop.set()
+            writer.join()
+        
+        for snapshot in snapshots:
+            assert "count" in json.loads((snapshot / "emails.json").read_text())
     
-  
+    def test_chunks_are_linked_without_locks(self, tmp_path, monkeypatch):
+        """Test that attachment chunks are snapshotted after the data file locks are released"""
+        data_manager = DataManager(tmp_path / "data")
+        digest = ChunkStore(data_manager.chunks_dir).put_chunk(b"attachment data")
+        emails_lock = data_manager.lock(data_manager.emails_file)
+        linked = []
+        link_or_copy = data_manager._link_or_copy
+        
+        def recording_link_or_copy(source, destination):
+            linked.append((source.name, emails_lock.thread_lock.locked()))
+            return link_or_copy(source, destination)
+        
+        monkeypatch.setattr(data_manager, "_link_or_copy", recording_link_or_copy)
+        snapshot = data_manager.snapshot(tmp_path / "backups")
+        
+        assert ("emails.json", True) in linked
+        assert (digest, False) in linked
+        assert (snapshot / "chunks" / digest[:2] / digest).read_bytes() == b"attachment data"
+    
+    def test_restore_rejects_corrupt_snapshot(self, tmp_path):
+        """Test that restore verifies file digests"""
+        data_manager = DataManager(tmp_path / "data")
+        data_manager.save_data(data_manager.users_file, {"alice": {}})
+        snapshot = data_manager.snapshot(tmp_path / "backups")
+        
+        (snapshot / "users.json").unlink()
+        (snapshot / "users.json").write_text("{}")
+        assert data_manager.restore(snapshot) is False
+        assert data_manager.load_data(data_manager.users_file) == {"alice": {}}
@@ -0,0 +1,149 @@
+import os
+import sys
+import threading
+import time
+
+# Add project root to Python path
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(base_dir)
+
+from server.draft_autosave import DraftAutosaver
+
+class TestDraftAutosaver:
+    def recorder(self):
+        """Save callback that records each persisted version"""
+        saved = []
+        lock = threading.Lock()
+        
+        def save(email_data):
+            with lock:
+                saved.append((time.monotonic(), dict(email_data)))
+        return saved, save
+    
+    def wait_for(self, condition, timeout=5):
+        """Poll until condition() is true"""
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+    
+    def test_edits_are_coalesced(self):
+        """Test that a burst of edits produces one save per interval"""
+        saved, save = self.recorder()
+        autosaver = DraftAutosaver(save, interval=0.3)
+        
+        for i in range(50):
+            autosaver.update({'id': 'd1', 'body': 'x' * i})
+            time.sleep(0.01)
+        
+        assert self.wait_for(lambda: autosaver.pending_count() == 0)
+        # Latest version is always persisted last
+        assert saved[-1][1]['body'] == 'x' * 49
+        # 0.5s of typing at a 0.3s interval -> leading save plus at most two more
+        assert len(saved) <= 3
+        gaps = [b[0] - a[0] for a, b in zip(saved, saved[1:])]
+        assert all(gap >= 0.25 for gap in gaps)
+    
+    def test_drafts_are_independent(self):
+        """Test that each draft has its own interval"""
+        saved, save = self.recorder()
+        autosaver = DraftAutosaver(save, interval=10)
+        
+        autosaver.update({'id': 'd1', 'body': 'a'})
+        autosaver.update({'id': 'd2', 'body': 'b'})
+        
+        assert self.wait_for(lambda: len(saved) == 2)
+        assert sorted(version['id'] for _, version in saved) == ['d1', 'd2']
+    
+    def test_flush_and_discard(self):
+        """Test explicit flush and discarding of pending edits"""
+        saved, save = self.recorder()
+        autosaver = DraftAutosaver(save, interval=10)
+        autosaver.update({'id': 'd1', 'body': 'first'})
+        assert self.wait_for(lambda: len(saved) == 1)
+        
+        # Within the interval: held back until flushed
+        autosaver.update({'id': 'd1', 'body': 'second'})
+        time.sleep(0.1)
+        assert len(saved) == 1
+        autosaver.flush('d1')
+        assert saved[-1][1]['body'] == 'second'
+        
+        autosaver.update({'id': 'd1', 'body': 'third'})
+        autosaver.discard('d1')
+        autosaver.flush()
+        assert len(saved) == 2 and autosaver.pending_count() == 0
+    
+    def test_failed_save_is_retried(self):
+        """Test that an edit is kept when its save fails"""
+        attempts = []
+        
+        def flaky_save(email_data):
+            attempts.append(email_data['body'])
+            if len(attempts) == 1:
+                raise IOError("disk unavailable")
+        
+        autosaver = DraftAutosaver(flaky_save, interval=0.05)
+        autosaver.update({'id': 'd1', 'body': 'text'})
+        
+        assert self.wait_for(lambda: len(attempts) == 2)
+        assert attempts == ['text', 'text']
+    
+    def test_flush_waits_for_save_in_progress(self):
+        """Test that a flush never lets an older version land after a newer one"""
+        saved = []
+        started = threading.Event()
+        release = threading.Event()
+        
+        def slow_save(email_data):
+            started.set()
+            release.wait(5)
+            saved.append(email_data['body'])
+        
+        autosaver = DraftAutosaver(slow_save, interval=10)
+        autosaver.update({'id': 'd1', 'body': 'first'})
+        assert started.wait(5)
+        
+        autosaver.update({'id': 'd1', 'body': 'second'})
+        flusher = threading.Thread(target=autosaver.flush, args=('d1',))
+        flusher.start()
+        time.sleep(0.1)
+        assert saved == []  # The flush is waiting for the first save
+        release.set()
+        flusher.join(5)
+        
+        assert saved == ['first', 'second']
+    
+    def test_discard_during_failed_save(self):
+        """Test that a discarded draft is not kept for retry when its save fails"""
+        started = threading.Event()
+        release = threading.Event()
+        
+        def failing_save(email_data):
+            started.set()
+            release.wait(5)
+            raise IOError("disk unavailable")
+        
+        autosaver = DraftAutosaver(failing_save, interval=0.05)
+        autosaver.update({'id': 'd1', 'body': 'text'})
+        assert started.wait(5)
+        
+        discarder = threading.Thread(target=autosaver.discard, args=('d1',))
+        discarder.start()
+        time.sleep(0.1)
+        release.set()
+        discarder.join(5)
+        
+        assert autosaver.pending_count() == 0
+    
+    def test_save_times_are_pruned(self):
+        """Test that save times are forgotten once they no longer matter"""
+        saved, save = self.recorder()
+        autosaver = DraftAutosaver(save, interval=0.05)
+        for i in range(20):
+            autosaver.update({'id': f'd{i}', 'body': 'text'})
+        assert self.wait_for(lambda: len(saved) == 20)
+        
+        time.sleep(0.1)
+        autosaver.update({'id': 'last', 'body': 'text'})
+        assert self.wait_for(lambda: list(autosaver.last_saved) == ['last'])
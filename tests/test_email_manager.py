@@ -1,9 +1,11 @@
 import pytest
+import json
 import os
 import sys
-from pathlib import Path
 from datetime import datetime
 import uuid
+import threading
+import time
 
 # Add project root to Python path
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -11,35 +13,15 @@ sys.path.append(base_dir)
 
 from server.email_manager import EmailManager
 from server.data_manager import DataManager
+from server.retry import RetryPolicy
 
 class TestEmailManager:
     @pytest.fixture
-    def email_manager(self):
+    def email_manager(self, tmp_path):
         """Create a fresh EmailManager for each test"""
-        # Create a temporary test data directory
-        test_data_dir = Path(base_dir) / "tests" / "test_data"
-        test_data_dir.mkdir(exist_ok=True)
-        
-        # Create test file paths
-        test_emails_file = test_data_dir / "emails.json"
-        
-        # Patch DataManager to use test file
-        data_manager = DataManager()
-        data_manager.emails_file = test_emails_file
-        
-        # Clear any existing test data
-        if test_emails_file.exists():
-            os.remove(test_emails_file)
-        
-        # Create email manager with test data manager
-        email_manager = EmailManager()
-        email_manager.data_manager = data_manager
-        
-        yield email_manager
-        
-        # Cleanup
-        if test_emails_file.exists():
-            os.remove(test_emails_file)
+        # Every file the manager writes (emails, lock files, thread index,
+        # schedule log) goes to a directory pytest removes afterwards
+        return EmailManager(DataManager(tmp_path))
     
     def create_test_email(self, sender="testuser", recipient="recipient"):
         """Helper method to create a test email"""
@@ -183,3 +165,465 @@ class TestEmailManager:
         email_manager.save_draft(draft_email)
         # Implement delete draft logic here
         # Example: email_manager.delete_draft(draft_email['id'])
+
+    def test_subscribe_receives_new_email_events(self, email_manager):
+        """Test that subscribers are notified of new messages"""
+        sender_events = []
+        recipient_events = []
+        email_manager.subscribe("testuser", sender_events.append)
+        email_manager.subscribe("recipient", recipient_events.append)
+        
+        test_email = self.create_test_email()
+        email_manager.save_email(test_email)
+        
+        assert len(sender_events) == 1 and sender_events[0]['type'] == 'new'
+        assert sender_events[0]['email']['status'] == 'sent'
+        assert len(recipient_events) == 1
+        assert recipient_events[0]['email']['status'] == 'inbox'
+    
+    def test_subscribe_receives_status_events(self, email_manager):
+        """Test that trash and read changes publish status events"""
+        test_email = self.create_test_email(sender="other", recipient="testuser")
+        email_manager.save_email(test_email)
+        
+        events = []
+        unsubscribe = email_manager.subscribe("testuser", events.append)
+        email_manager.mark_as_read("testuser", test_email['id'])
+        email_manager.move_to_trash("testuser", test_email['id'])
+        
+        assert [event['type'] for event in events] == ['status', 'status']
+        assert events[0]['previous_read'] is False and events[0]['email']['read'] is True
+        assert events[1]['previous_status'] == 'inbox'
+        assert events[1]['email']['status'] == 'deleted'
+        
+        # No further events after unsubscribing
+        unsubscribe()
+        email_manager.mark_as_read("testuser", test_email['id'])
+        assert len(events) == 2
+    
+    def test_delete_draft_publishes_deleted_event(self, email_manager):
+        """Test that deleting a draft publishes a deletion event"""
+        draft_email = self.create_test_email()
+        email_manager.save_draft(draft_email)
+        
+        events = []
+        email_manager.subscribe("testuser", events.append)
+        email_manager.delete_draft("testuser", draft_email['id'])
+        
+        assert len(events) == 1
+        assert events[0]['type'] == 'deleted' and events[0]['id'] == draft_email['id']
+    
+    def test_concurrent_consumers(self, tmp_path):
+        """Test that several consumer threads persist every task and publish its event"""
+        email_manager = EmailManager(DataManager(tmp_path), consumers=2)
+        events = []
+        email_manager.subscribe("recipient", events.append)
+        
+        test_emails = [self.create_test_email() for _ in range(6)]
+        for test_email in test_emails:
+            # A full lane is rejected rather than waited on; retry as told
+            result = email_manager.enqueue("send_email", test_email)
+            while not result:
+                time.sleep(result.seconds)
+                result = email_manager.enqueue("send_email", test_email)
+        email_manager.email_queue.join()
+        
+        inbox = email_manager.get_user_emails("recipient", "inbox")
+        assert sorted(email['id'] for email in inbox) == sorted(email['id'] for email in test_emails)
+        assert len(events) == len(test_emails)
+    
+    def test_list_headers(self, email_manager):
+        """Test that folder listings carry summaries without bodies"""
+        test_email = self.create_test_email()
+        test_email['body'] = "Hello there,\n  this is the body. " * 20
+        email_manager.save_email(test_email)
+        
+        headers = email_manager.list_headers("recipient", "inbox")
+        assert len(headers) == 1
+        header = headers[0]
+        assert 'body' not in header
+        assert header['id'] == test_email['id']
+        assert header['size'] == len(test_email['body'].encode('utf-8'))
+        assert header['snippet'].startswith("Hello there, this is the body.")
+        assert len(header['snippet']) <= 100
+    
+    def test_list_headers_sees_new_writes(self, email_manager):
+        """Test that cached headers are refreshed after the store changes"""
+        first_email = self.create_test_email()
+        email_manager.save_email(first_email)
+        assert len(email_manager.list_headers("recipient", "inbox")) == 1
+        
+        second_email = self.create_test_email()
+        email_manager.save_email(second_email)
+        email_manager.move_to_trash("recipient", first_email['id'])
+        
+        inbox = email_manager.list_headers("recipient", "inbox")
+        assert [header['id'] for header in inbox] == [second_email['id']]
+        assert len(email_manager.list_headers("recipient", "deleted")) == 1
+    
+    def test_get_message(self, email_manager):
+        """Test fetching a full message by id"""
+        test_email = self.create_test_email()
+        email_manager.save_email(test_email)
+        
+        message = email_manager.get_message("recipient", test_email['id'])
+        assert message['body'] == test_email['body']
+        assert email_manager.get_message("recipient", "missing") is None
+    
+    def test_schedule_send(self, tmp_path):
+        """Test that a scheduled email is delivered once it is due"""
+        email_manager = EmailManager(DataManager(tmp_path))
+        delivered = threading.Event()
+        email_manager.subscribe("recipient", lambda event: delivered.set())
+        
+        test_email = self.create_test_email()
+        task_id = email_manager.schedule_send(test_email, time.time() + 0.2)
+        
+        assert task_id is not None
+        assert email_manager.get_user_emails("recipient", "inbox") == []
+        assert delivered.wait(5), "Scheduled email should be delivered"
+        assert len(email_manager.get_user_emails("recipient", "inbox")) == 1
+    
+    def test_snooze(self, tmp_path):
+        """Test that a snoozed email returns to the inbox unread"""
+        email_manager = EmailManager(DataManager(tmp_path))
+        test_email = self.create_test_email()
+        email_manager.save_email(test_email)
+        email_manager.mark_as_read("recipient", test_email['id'])
+        
+        returned = threading.Event()
+        email_manager.subscribe(
+            "recipient",
+            lambda event: event['email']['status'] == 'inbox' and returned.set()
+        )
+        
+        assert email_manager.snooze("recipient", test_email['id'], time.time() + 0.2) is True
+        assert email_manager.get_user_emails("recipient", "inbox") == []
+        assert returned.wait(5), "Snoozed email should return to the inbox"
+        assert email_manager.get_unread_count("recipient") == 1
+    
+    def test_stale_unsnooze_task_is_ignored(self, tmp_path):
+        """Test that only the task of the current snooze brings a message back"""
+        email_manager = EmailManager(DataManager(tmp_path))
+        test_email = self.create_test_email()
+        email_manager.save_email(test_email)
+        
+        first = time.time() + 3600
+        assert email_manager.snooze("recipient", test_email['id'], first) is True
+        # A manual unsnooze cancels the pending task
+        assert email_manager.unsnooze("recipient", test_email['id']) is True
+        assert email_manager.scheduler.pending() == 0
+        
+        second = time.time() + 7200
+        assert email_manager.snooze("recipient", test_email['id'], second) is True
+        # A task from the first snooze that was already dispatched does nothing
+        assert email_manager._unsnooze("recipient", test_email['id'], first) is False
+        assert email_manager.get_user_emails("recipient", "inbox") == []
+        assert email_manager._unsnooze("recipient", test_email['id'], second) is True
+        assert len(email_manager.get_user_emails("recipient", "inbox")) == 1
+    
+    def test_snapshot_never_loses_unsnooze_task(self, tmp_path):
+        """Test that a snapshot with a snoozed message also has its unsnooze task"""
+        email_manager = EmailManager(DataManager(tmp_path / "data"))
+        test_email = self.create_test_email()
+        email_manager.save_email(test_email)
+        stop = threading.Event()
+        
+        def snooze_repeatedly():
+            while not stop.is_set():
+                email_manager.snooze("recipient", test_email['id'], time.time() + 3600)
+                email_manager.unsnooze("recipient", test_email['id'])
+        
+        thread = threading.Thread(target=snooze_repeatedly)
+        thread.start()
+        try:
+            snapshots = [email_manager.data_manager.snapshot(tmp_path / "backups") for _ in range(10)]
+        finally:
+            stop.set()
+            thread.join()
+        
+        for snapshot in snapshots:
+            emails = json.loads((snapshot / "emails.json").read_text())
+            snoozed = [email['id'] for email in emails["recipient"] if email['status'] == 'snoozed']
+            tasks = set()
+            if (snapshot / "schedule.jsonl").exists():
+                for line in (snapshot / "schedule.jsonl").read_text().splitlines():
+                    record = json.loads(line)
+                    if record['op'] == 'add' and record['task'][0] == "unsnooze":
+                        tasks.add(record['task'][2])
+            assert set(snoozed) <= tasks
+    
+    def fail_writes(self, email_manager, times):
+        """Make the next `times` writes of the emails file raise IOError"""
+        original_write = email_manager.data_manager.write_data
+        failures = {'remaining': times}
+        
+        def flaky_write(file_path, data):
+            if failures['remaining'] > 0:
+                failures['remaining'] -= 1
+                raise IOError("disk unavailable")
+            return original_write(file_path, data)
+        
+        email_manager.data_manager.write_data = flaky_write
+    
+    def test_failed_task_is_retried(self, tmp_path):
+        """Test that a transient failure is retried until it succeeds"""
+        email_manager = EmailManager(DataManager(tmp_path))
+        email_manager.retry_policies["send_email"] = RetryPolicy(max_attempts=5, base_delay=0.01)
+        self.fail_writes(email_manager, 2)
+        delivered = threading.Event()
+        email_manager.subscribe("recipient", lambda event: delivered.set())
+        
+        test_email = self.create_test_email()
+        email_manager.enqueue("send_email", test_email)
+        
+        assert delivered.wait(5), "Email should be delivered after retries"
+        assert len(email_manager.get_user_emails("recipient", "inbox")) == 1
+        assert email_manager.list_dead_letters() == []
+    
+    def test_exhausted_task_is_dead_lettered_and_replayed(self, tmp_path):
+        """Test that a task that keeps failing is dead-lettered and can be replayed"""
+        email_manager = EmailManager(DataManager(tmp_path))
+        email_manager.retry_policies["send_email"] = RetryPolicy(max_attempts=2, base_delay=0.01)
+        self.fail_writes(email_manager, 2)
+        
+        test_email = self.create_test_email()
+        email_manager.enqueue("send_email", test_email)
+        
+        deadline = time.time() + 5
+        while not email_manager.list_dead_letters() and time.time() < deadline:
+            time.sleep(0.02)
+        dead_letters = email_manager.list_dead_letters()
+        assert len(dead_letters) == 1
+        assert dead_letters[0]['attempts'] == 2
+        assert dead_letters[0]['task'][0] == "send_email"
+        assert "disk unavailable" in dead_letters[0]['error']
+        
+        assert email_manager.replay_dead_letter(dead_letters[0]['id']) is True
+        email_manager.email_queue.join()
+        assert email_manager.list_dead_letters() == []
+        assert len(email_manager.get_user_emails("recipient", "inbox")) == 1
+    
+    def test_failed_tasks_are_acknowledged(self, tmp_path):
+        """Test that join() returns even when tasks fail"""
+        email_manager = EmailManager(DataManager(tmp_path))
+        email_manager.enqueue("no_such_action", "x")
+        
+        finished = threading.Event()
+        threading.Thread(target=lambda: (email_manager.email_queue.join(), finished.set()), daemon=True).start()
+        
+        assert finished.wait(5), "join() should return after a failed task"
+        assert email_manager.list_dead_letters()[0]['task'] == ["no_such_action", "x"]
+    
+    def test_replies_share_thread(self, email_manager):
+        """Test that replies are threaded with their parent"""
+        original = self.create_test_email(sender="testuser", recipient="recipient")
+        email_manager.save_email(original)
+        
+        reply = self.create_test_email(sender="recipient", recipient="testuser")
+        reply['in_reply_to'] = original['id']
+        email_manager.save_email(reply)
+        
+        messages = email_manager.get_thread_messages("testuser", original['id'])
+        assert [message['id'] for message in messages] == [original['id'], reply['id']]
+        assert email_manager.get_message("testuser", reply['id'])['thread_id'] == original['id']
+    
+    def test_get_threads(self, email_manager):
+        """Test thread summaries served from the thread index"""
+        first = self.create_test_email(sender="other", recipient="testuser")
+        email_manager.save_email(first)
+        reply = self.create_test_email(sender="other", recipient="testuser")
+        reply['in_reply_to'] = first['id']
+        email_manager.save_email(reply)
+        separate = self.create_test_email(sender="other", recipient="testuser")
+        email_manager.save_email(separate)
+        
+        threads = email_manager.get_threads("testuser", "inbox")
+        assert [thread['thread_id'] for thread in threads] == [separate['id'], first['id']]
+        assert threads[1]['message_count'] == 2 and threads[1]['unread_count'] == 2
+        
+        # Incremental updates on read and trash
+        email_manager.mark_as_read("testuser", first['id'])
+        email_manager.move_to_trash("testuser", separate['id'])
+        threads = email_manager.get_threads("testuser", "inbox")
+        assert len(threads) == 1
+        assert threads[0]['message_count'] == 2 and threads[0]['unread_count'] == 1
+        assert len(email_manager.get_threads("testuser", "deleted")) == 1
+        
+        # Paging
+        assert email_manager.get_threads("testuser", "inbox", page=2) == []
+        assert len(email_manager.get_threads("testuser", "inbox", page=1, page_size=1)) == 1
+    
+    def test_thread_index_matches_rebuild(self, tmp_path):
+        """Test that the incremental index equals a full rebuild"""
+        email_manager = EmailManager(DataManager(tmp_path))
+        
+        def assert_matches_rebuild():
+            incremental = email_manager.data_manager.load_data(email_manager.threads_file)['users']
+            emails = email_manager.data_manager.load_data(email_manager.data_manager.emails_file)
+            assert incremental == email_manager._build_thread_index(emails)
+        
+        first = self.create_test_email(sender="other", recipient="testuser")
+        email_manager.save_email(first)
+        reply = self.create_test_email(sender="other", recipient="testuser")
+        reply['in_reply_to'] = first['id']
+        email_manager.save_email(reply)
+        newer = self.create_test_email(sender="other", recipient="testuser")
+        email_manager.save_email(newer)
+        latest = self.create_test_email(sender="other", recipient="testuser")
+        latest['in_reply_to'] = first['id']
+        email_manager.save_email(latest)
+        email_manager.mark_as_read("testuser", first['id'])
+        email_manager.save_draft(self.create_test_email())
+        assert_matches_rebuild()
+        
+        # Trashing the thread's newest message takes its activity back to
+        # the reply, below the newer thread
+        email_manager.move_to_trash("testuser", latest['id'])
+        assert_matches_rebuild()
+        threads = email_manager.get_threads("testuser", "inbox")
+        assert [thread['thread_id'] for thread in threads] == [newer['id'], first['id']]
+        assert threads[1]['last_activity'] == reply['timestamp']
+        
+        # Snoozing and unsnoozing move a message out of and back into its thread
+        email_manager.snooze("testuser", reply['id'], time.time() + 60)
+        assert_matches_rebuild()
+        email_manager.unsnooze("testuser", reply['id'])
+        assert_matches_rebuild()
+        email_manager.move_to_trash("testuser", newer['id'])
+        assert_matches_rebuild()
+    
+    def test_failed_index_write_does_not_duplicate_send(self, tmp_path):
+        """Test that a failed thread index write neither fails nor repeats a send"""
+        email_manager = EmailManager(DataManager(tmp_path))
+        email_manager.retry_policies["send_email"] = RetryPolicy(max_attempts=3, base_delay=0.01)
+        original_write = email_manager.data_manager.write_data
+        failures = {'remaining': 1}
+        
+        def flaky_write(file_path, data):
+            if file_path == email_manager.threads_file and failures['remaining'] > 0:
+                failures['remaining'] -= 1
+                raise IOError("disk unavailable")
+            return original_write(file_path, data)
+        
+        email_manager.data_manager.write_data = flaky_write
+        test_email = self.create_test_email()
+        email_manager.enqueue("send_email", test_email)
+        email_manager.email_queue.join()
+        
+        assert failures['remaining'] == 0
+        assert len(email_manager.get_user_emails("recipient", "inbox")) == 1
+        assert email_manager.list_dead_letters() == []
+        # The stale index is rebuilt on the next read
+        assert len(email_manager.get_threads("recipient", "inbox")) == 1
+        
+        # A repeated delivery of the same message is ignored
+        email_manager.save_email(test_email)
+        assert len(email_manager.get_user_emails("recipient", "inbox")) == 1
+    
+    def test_save_draft_replaces_by_id(self, email_manager):
+        """Test that editing a draft updates it in place"""
+        draft_email = self.create_test_email()
+        email_manager.save_draft(draft_email)
+        
+        events = []
+        email_manager.subscribe("testuser", events.append)
+        edited = dict(draft_email, subject="Edited Subject")
+        email_manager.save_draft(edited)
+        
+        drafts = email_manager.get_user_emails('testuser', 'draft')
+        assert len(drafts) == 1
+        assert drafts[0]['subject'] == "Edited Subject"
+        assert events[0]['type'] == 'updated'
+    
+    def test_drafts_are_not_evicted(self, email_manager):
+        """Test that saving more drafts keeps the earlier ones"""
+        for _ in range(5):
+            email_manager.save_draft(self.create_test_email())
+        
+        assert len(email_manager.get_user_emails('testuser', 'draft')) == 5
+    
+    def test_autosave_draft(self, tmp_path):
+        """Test that autosaved edits land in a single draft"""
+        email_manager = EmailManager(DataManager(tmp_path))
+        draft_email = self.create_test_email()
+        for i in range(20):
+            email_manager.autosave_draft(dict(draft_email, body=f"Body {i}"))
+        email_manager.flush_drafts()
+        
+        drafts = email_manager.get_user_emails('testuser', 'draft')
+        assert len(drafts) == 1
+        assert drafts[0]['body'] == "Body 19"
+        
+        # Deleting the draft drops any edits still waiting to be saved
+        email_manager.autosave_draft(dict(draft_email, body="Late edit"))
+        email_manager.delete_draft('testuser', draft_email['id'])
+        time.sleep(0.1)
+        assert email_manager.get_user_emails('testuser', 'draft') == []
+    
+    def test_attachment_upload_and_download(self, tmp_path):
+        """Test streaming an attachment in and out of the chunk store"""
+        email_manager = EmailManager(DataManager(tmp_path))
+        chunk_size = email_manager.chunk_store.chunk_size
+        size = 2 * chunk_size + 100
+        source = tmp_path / "report.bin"
+        source.write_bytes(os.urandom(size))
+        
+        attachment = email_manager.upload_attachment(source)
+        assert attachment['filename'] == "report.bin"
+        assert attachment['size'] == size
+        assert len(attachment['chunks']) == 3
+        
+        test_email = self.create_test_email()
+        test_email['attachments'] = [attachment]
+        email_manager._save_email(test_email)
+        
+        # Sender and recipient share the same chunks
+        assert len([p for p in (tmp_path / "chunks").rglob("*") if p.is_file()]) == 3
+        
+        destination = tmp_path / "copy.bin"
+        progress = []
+        assert email_manager.download_attachment(
+            'recipient', test_email['id'], attachment['id'], destination, progress.append
+        ) is True
+        assert destination.read_bytes() == source.read_bytes()
+        assert progress == [chunk_size, 2 * chunk_size, size]
+        assert email_manager.list_headers('recipient', 'inbox')[0]['attachment_count'] == 1
+    
+    def test_attachment_not_visible_to_other_users(self, tmp_path):
+        """Test that attachments are only reachable through the owner's mailbox"""
+        email_manager = EmailManager(DataManager(tmp_path))
+        source = tmp_path / "secret.txt"
+        source.write_bytes(b"secret")
+        test_email = self.create_test_email()
+        test_email['attachments'] = [email_manager.upload_attachment(source)]
+        email_manager._save_email(test_email)
+        
+        attachment_id = test_email['attachments'][0]['id']
+        assert email_manager.get_attachment('intruder', test_email['id'], attachment_id) is None
+        assert email_manager.download_attachment(
+            'intruder', test_email['id'], attachment_id, tmp_path / "out.txt"
+        ) is False
+    
+    def test_consumers_start_on_first_enqueue(self, tmp_path):
+        """Test that constructing a manager starts no threads"""
+        threads_before = threading.active_count()
+        email_manager = EmailManager(DataManager(tmp_path))
+        assert email_manager.consumers_started is False
+        assert threading.active_count() == threads_before
+        
+        email_manager.enqueue("save_draft", self.create_test_email())
+        email_manager.email_queue.join()
+        assert email_manager.consumers_started is True
+        assert len(email_manager.get_user_emails('testuser', 'draft')) == 1
+    
+    def test_warm_up_builds_indexes(self, tmp_path):
+        """Test that warm_up leaves the header cache and thread index current"""
+        data_manager = DataManager(tmp_path)
+        EmailManager(data_manager)._save_email(self.create_test_email())
+        
+        email_manager = EmailManager(data_manager)
+        email_manager.warm_up()
+        assert email_manager.header_cache[0] == data_manager.file_stamp(data_manager.emails_file)
+        assert data_manager.read_data(email_manager.threads_file)['emails_stamp'] == email_manager._emails_stamp()
+        assert email_manager.get_unread_count('recipient') == 1
@@ -0,0 +1,104 @@
+import pytest
+import os
+import sys
+import queue
+import threading
+
+# Add project root to Python path
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(base_dir)
+
+from server.lane_queue import LaneQueue, classify_task
+
+class TestLaneQueue:
+    def test_actions_map_to_lanes(self):
+        """Test the default lane for each queue action"""
+        assert classify_task(("move_to_trash", "user", "id")) == "interactive"
+        assert classify_task(("save_draft", {})) == "interactive"
+        assert classify_task(("send_email", {})) == "normal"
+        assert classify_task(None) == "interactive"
+    
+    def test_fifo_within_lane(self):
+        """Test that a single lane keeps FIFO order"""
+        lane_queue = LaneQueue(maxsize=0)
+        for i in range(5):
+            lane_queue.put(("send_email", i))
+        
+        assert [lane_queue.get()[1] for _ in range(5)] == list(range(5))
+    
+    def test_weighted_fair_scheduling(self):
+        """Test that busy lanes share dequeues by weight"""
+        lane_queue = LaneQueue(maxsize=0)
+        for i in range(100):
+            lane_queue.put(("send_email", i), lane="bulk")
+            lane_queue.put(("send_email", i), lane="normal")
+            lane_queue.put(("move_to_trash", i), lane="interactive")
+        
+        first = [lane_queue.get() for _ in range(13)]
+        counts = {action: sum(1 for task in first if task[0] == action) for action in ("move_to_trash", "send_email")}
+        # 8:4:1 weights -> 8 interactive and 5 normal/bulk per 13 dequeues
+        assert counts["move_to_trash"] == 8
+        assert counts["send_email"] == 5
+    
+    def test_interactive_not_stuck_behind_bulk(self):
+        """Test that an interactive task jumps a bulk backlog"""
+        lane_queue = LaneQueue(maxsize=0)
+        for i in range(50):
+            lane_queue.put(("send_email", i), lane="bulk")
+        lane_queue.put(("move_to_trash", "user", "id"))
+        
+        assert lane_queue.get()[0] == "move_to_trash"
+    
+    def test_full_lane_does_not_block_other_lanes(self):
+        """Test that each lane is bounded independently"""
+        lane_queue = LaneQueue(maxsize=2)
+        lane_queue.put(("send_email", 1), lane="bulk")
+        lane_queue.put(("send_email", 2), lane="bulk")
+        
+        with pytest.raises(queue.Full):
+            lane_queue.put_nowait(("send_email", 3), lane="bulk")
+        with pytest.raises(queue.Full):
+            lane_queue.put(("send_email", 3), lane="bulk", timeout=0.05)
+        lane_queue.put_nowait(("move_to_trash", "user", "id"))
+        assert lane_queue.qsize() == 3
+        assert lane_queue.full("bulk") is True
+    
+    def test_get_timeout(self):
+        """Test that get raises Empty after its timeout"""
+        lane_queue = LaneQueue()
+        with pytest.raises(queue.Empty):
+            lane_queue.get(timeout=0.05)
+        with pytest.raises(queue.Empty):
+            lane_queue.get_nowait()
+    
+    def test_join_waits_for_task_done(self):
+        """Test that join returns once every task is acknowledged"""
+        lane_queue = LaneQueue()
+        lane_queue.put(("send_email", 1))
+        lane_queue.put(("move_to_trash", "user", "id"))
+        
+        def consume():
+            for _ in range(2):
+                lane_queue.get()
+                lane_queue.task_done()
+        
+        thread = threading.Thread(target=consume)
+        thread.start()
+        lane_queue.join()
+        thread.join(5)
+        
+        with pytest.raises(ValueError):
+            lane_queue.task_done()
+    
+    def test_stats(self):
+        """Test per-lane depth and wait statistics"""
+        lane_queue = LaneQueue(maxsize=0)
+        lane_queue.put(("send_email", 1))
+        lane_queue.put(("send_email", 2), lane="bulk")
+        lane_queue.get()
+        
+        stats = lane_queue.stats()
+        assert set(stats) == {"interactive", "normal", "bulk"}
+        assert stats["normal"]["dequeued"] == 1 and stats["normal"]["depth"] == 0
+        assert stats["bulk"]["depth"] == 1 and stats["bulk"]["enqueued"] == 1
+        assert stats["normal"]["wait_p99"] >= 0
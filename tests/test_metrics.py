@@ -0,0 +1,107 @@
+import pytest
+import os
+import sys
+import uuid
+from datetime import datetime
+
+# Add project root to Python path
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(base_dir)
+
+from server.data_manager import DataManager
+from server.email_manager import EmailManager
+from server.metrics import Metrics, metrics
+
+class TestMetrics:
+    def test_disabled_records_nothing(self):
+        """Test that a disabled registry ignores every call"""
+        registry = Metrics()
+        
+        @registry.instrument("test")
+        def work():
+            return 42
+        
+        assert work() == 42
+        registry.inc("calls_total")
+        registry.observe("latency_seconds", 0.1)
+        with registry.span("work"):
+            pass
+        snapshot = registry.snapshot()
+        assert snapshot['counters'] == {}
+        assert snapshot['histograms'] == {}
+        assert snapshot['spans'] == []
+    
+    def test_instrument_times_calls_and_counts_errors(self):
+        """Test the method decorator"""
+        registry = Metrics(enabled=True)
+        
+        @registry.instrument("test")
+        def _fail():
+            raise ValueError("boom")
+        
+        with pytest.raises(ValueError):
+            _fail()
+        snapshot = registry.snapshot()
+        assert snapshot['counters']['mail_operation_errors_total'] == [
+            {'labels': {'component': 'test', 'op': 'fail'}, 'value': 1}
+        ]
+        (histogram,) = snapshot['histograms']['mail_operation_seconds']
+        assert histogram['count'] == 1
+        assert histogram['buckets'][-1] == ['+Inf', 1]
+    
+    def test_prometheus_text(self):
+        """Test the text exposition format"""
+        registry = Metrics(enabled=True)
+        registry.inc("mail_data_read_bytes_total", 100, file="emails.json")
+        registry.observe("mail_task_seconds", 0.003, action="send_email")
+        registry.add_collector(lambda: [("mail_queue_depth", {'lane': 'bulk'}, 2)])
+        
+        text = registry.to_prometheus()
+        assert '# TYPE mail_data_read_bytes_total counter' in text
+        assert 'mail_data_read_bytes_total{file="emails.json"} 100' in text
+        assert 'mail_queue_depth{lane="bulk"} 2' in text
+        assert 'mail_task_seconds_bucket{action="send_email",le="0.0025"} 0' in text
+        assert 'mail_task_seconds_bucket{action="send_email",le="0.005"} 1' in text
+        assert 'mail_task_seconds_count{action="send_email"} 1' in text
+    
+    def test_nested_spans_share_trace(self):
+        """Test that spans opened inside another span join its trace"""
+        registry = Metrics(tracing=True)
+        with registry.span("task", action="send_email"):
+            with registry.span("data.write"):
+                pass
+        
+        child, parent = registry.snapshot()['spans']
+        assert child['trace_id'] == parent['trace_id']
+        assert child['parent_id'] == parent['span_id']
+        assert parent['attributes'] == {'action': 'send_email'}
+    
+    def test_email_manager_metrics(self, tmp_path):
+        """Test that manager operations, file I/O, locks and the queue report metrics"""
+        metrics.reset()
+        metrics.enable()
+        try:
+            email_manager = EmailManager(DataManager(tmp_path))
+            email_manager.enqueue("send_email", {
+                'id': str(uuid.uuid4()),
+                'sender': "alice",
+                'recipient': "bob",
+                'subject': "Test Subject",
+                'body': "Test Body",
+                'timestamp': datetime.now().isoformat(),
+                'status': 'sent'
+            })
+            email_manager.email_queue.join()
+            email_manager.list_headers("bob")
+            
+            snapshot = metrics.snapshot()
+            ops = {h['labels']['op'] for h in snapshot['histograms']['mail_operation_seconds']}
+            assert {'save_email', 'list_headers'} <= ops
+            assert snapshot['histograms']['mail_task_seconds'][0]['labels'] == {'action': 'send_email'}
+            assert 'mail_lock_hold_seconds' in snapshot['histograms']
+            written = snapshot['counters']['mail_data_written_bytes_total']
+            assert any(entry['labels']['file'] == 'emails.json' and entry['value'] > 0 for entry in written)
+            assert any(entry['value'] == 2 for entry in snapshot['gauges']['mail_consumers'])
+        finally:
+            metrics.disable()
+            metrics.reset()
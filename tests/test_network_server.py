@@ -0,0 +1,300 @@
+import pytest
+import os
+import sys
+import asyncio
+import base64
+import threading
+import time
+import uuid
+from datetime import datetime
+
+# Add project root to Python path
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(base_dir)
+
+from server.admission import AdmissionController, RetryAfter
+from server.chunk_store import CHUNK_SIZE
+from server.data_manager import DataManager
+from server.network_server import MailServer
+from client.remote_client import RemoteConnection, RemoteAuthManager, RemoteEmailManager, RemoteError
+
+class TestMailServer:
+    @pytest.fixture
+    def server(self, tmp_path):
+        """Run a MailServer on a free localhost port in a background thread"""
+        mail_server = MailServer("127.0.0.1", 0, DataManager(tmp_path), admin_users=["admin"])
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+        
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(mail_server.start())
+            started.set()
+            loop.run_forever()
+        
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        started.wait(5)
+        
+        yield mail_server
+        
+        asyncio.run_coroutine_threadsafe(mail_server.close(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+    
+    def connect(self, server):
+        """Open a client connection to the test server"""
+        connection = RemoteConnection("127.0.0.1", server.port)
+        return connection, RemoteAuthManager(connection), RemoteEmailManager(connection)
+    
+    def create_test_email(self, sender, recipient):
+        """Helper method to create a test email"""
+        return {
+            'id': str(uuid.uuid4()),
+            'sender': sender,
+            'recipient': recipient,
+            'subject': "Test Subject",
+            'body': "Test Body",
+            'timestamp': datetime.now().isoformat(),
+            'status': 'sent'
+        }
+    
+    def test_register_and_login(self, server):
+        """Test registering and logging in over the network"""
+        connection, auth, _ = self.connect(server)
+        
+        assert auth.register("alice", "secret") is True
+        assert auth.register("alice", "secret") is False
+        assert auth.login("alice", "wrong") is False
+        assert auth.login("alice", "secret") is True
+        connection.close()
+    
+    def test_requires_login(self, server):
+        """Test that mailbox operations are rejected before login"""
+        connection, _, _ = self.connect(server)
+        
+        with pytest.raises(RemoteError):
+            connection.request("get_user_emails", "alice", "inbox")
+        connection.close()
+    
+    def test_cannot_access_other_mailbox(self, server):
+        """Test that a session can only act on its own mailbox"""
+        connection, auth, _ = self.connect(server)
+        auth.register("alice", "secret")
+        auth.login("alice", "secret")
+        
+        with pytest.raises(RemoteError):
+            connection.request("get_user_emails", "bob", "inbox")
+        with pytest.raises(RemoteError):
+            connection.request("enqueue", "send_email", self.create_test_email("bob", "alice"))
+        connection.close()
+    
+    def test_send_pushes_event_to_recipient(self, server):
+        """Test that mail sent by one client is pushed to another"""
+        alice_connection, alice_auth, alice_mail = self.connect(server)
+        bob_connection, bob_auth, bob_mail = self.connect(server)
+        for auth, name in ((alice_auth, "alice"), (bob_auth, "bob")):
+            auth.register(name, "secret")
+            assert auth.login(name, "secret") is True
+        
+        received = threading.Event()
+        events = []
+        bob_mail.subscribe("bob", lambda event: (events.append(event), received.set()))
+        
+        test_email = self.create_test_email("alice", "bob")
+        assert alice_mail.enqueue("send_email", test_email) is True
+        assert received.wait(5), "Recipient should be notified of new mail"
+        
+        assert events[0]['type'] == 'new'
+        assert events[0]['email']['status'] == 'inbox'
+        inbox = bob_mail.get_user_emails("bob", "inbox")
+        assert [email['id'] for email in inbox] == [test_email['id']]
+        assert bob_mail.get_unread_count("bob") == 1
+        
+        alice_connection.close()
+        bob_connection.close()
+    
+    def test_attachment_upload_skips_stored_chunks(self, server, tmp_path, monkeypatch):
+        """Test remote attachment upload, dedup and download"""
+        import client.remote_client as remote_client
+        monkeypatch.setattr(remote_client, "CHUNK_SIZE", 1024)
+        connection, auth, mail = self.connect(server)
+        auth.register("alice", "secret")
+        auth.login("alice", "secret")
+        
+        source = tmp_path / "photo.bin"
+        source.write_bytes(os.urandom(2500))
+        sent_chunks = []
+        original_request = connection.request
+        
+        def counting_request(op, *args):
+            if op == "put_chunk":
+                sent_chunks.append(args[0])
+            return original_request(op, *args)
+        
+        monkeypatch.setattr(connection, "request", counting_request)
+        attachment = mail.upload_attachment(source)
+        assert attachment['size'] == 2500
+        assert len(sent_chunks) == 3
+        
+        # Uploading the same file again sends no chunk data
+        assert mail.upload_attachment(source)['chunks'] == attachment['chunks']
+        assert len(sent_chunks) == 3
+        
+        test_email = self.create_test_email("alice", "alice")
+        test_email['attachments'] = [attachment]
+        assert mail.save_draft(test_email) is True
+        destination = tmp_path / "copy.bin"
+        assert mail.download_attachment("alice", test_email['id'], attachment['id'], destination) is True
+        assert destination.read_bytes() == source.read_bytes()
+        
+        connection.close()
+    
+    def test_chunks_of_other_users_are_not_exposed(self, server, tmp_path):
+        """Test that only uploaded or owned chunks count as present or can be attached"""
+        alice_connection, alice_auth, alice_mail = self.connect(server)
+        alice_auth.register("alice", "secret")
+        alice_auth.login("alice", "secret")
+        source = tmp_path / "secret.bin"
+        source.write_bytes(os.urandom(100))
+        attachment = alice_mail.upload_attachment(source)
+        digests = attachment['chunks']
+        assert alice_connection.request("missing_chunks", digests) == []
+        
+        bob_connection, bob_auth, bob_mail = self.connect(server)
+        bob_auth.register("bob", "hunter2")
+        bob_auth.login("bob", "hunter2")
+        assert bob_connection.request("missing_chunks", digests) == digests
+        assert bob_connection.request("commit_attachment", "stolen.bin", None, digests) is None
+        
+        # Once the chunks reach bob's mailbox he owns them
+        test_email = self.create_test_email("alice", "bob")
+        test_email['attachments'] = [attachment]
+        assert alice_mail.enqueue("send_email", test_email) is True
+        server.email_manager.email_queue.join()
+        assert bob_connection.request("missing_chunks", digests) == []
+        assert bob_connection.request("commit_attachment", "forward.bin", None, digests)['chunks'] == digests
+        
+        alice_connection.close()
+        bob_connection.close()
+    
+    def test_download_resolves_attachment_once(self, server, tmp_path, monkeypatch):
+        """Test that chunk requests don't look the attachment up again"""
+        import client.remote_client as remote_client
+        monkeypatch.setattr(remote_client, "CHUNK_SIZE", 1024)
+        connection, auth, mail = self.connect(server)
+        auth.register("alice", "secret")
+        auth.login("alice", "secret")
+        source = tmp_path / "photo.bin"
+        source.write_bytes(os.urandom(5000))
+        test_email = self.create_test_email("alice", "alice")
+        test_email['attachments'] = [mail.upload_attachment(source)]
+        assert mail.save_draft(test_email) is True
+        attachment_id = test_email['attachments'][0]['id']
+        
+        lookups = []
+        get_attachment = server.email_manager.get_attachment
+        monkeypatch.setattr(
+            server.email_manager, "get_attachment",
+            lambda *args: lookups.append(args) or get_attachment(*args)
+        )
+        destination = tmp_path / "copy.bin"
+        assert mail.download_attachment("alice", test_email['id'], attachment_id, destination) is True
+        assert destination.read_bytes() == source.read_bytes()
+        assert len(lookups) == 1
+        
+        # A chunk requested without the metadata first is resolved once too
+        connection.request("logout")
+        auth.login("alice", "secret")
+        for index in range(5):
+            connection.request("get_attachment_chunk", "alice", test_email['id'], attachment_id, index)
+        assert len(lookups) == 2
+        
+        connection.close()
+    
+    def test_remote_and_local_uploads_share_chunks(self, server, tmp_path):
+        """Test that a file uploaded remotely dedups against a local upload"""
+        connection, auth, mail = self.connect(server)
+        auth.register("alice", "secret")
+        auth.login("alice", "secret")
+        
+        source = tmp_path / "video.bin"
+        source.write_bytes(os.urandom(2 * 1024 * 1024 + 100))
+        local = server.email_manager.upload_attachment(source)
+        remote = mail.upload_attachment(source)
+        assert remote['chunks'] == local['chunks']
+        
+        with pytest.raises(RemoteError):
+            connection.request("put_chunk", base64.b64encode(b"x" * (CHUNK_SIZE + 1)).decode())
+        
+        connection.close()
+    
+    def test_rate_limited_send_returns_retry_after(self, server):
+        """Test that admission rejections reach the client as RetryAfter"""
+        server.email_manager.admission = AdmissionController(send_burst=1, send_rate=0.1)
+        connection, auth, mail = self.connect(server)
+        auth.register("alice", "secret")
+        auth.login("alice", "secret")
+        
+        assert mail.enqueue("send_email", self.create_test_email("alice", "bob")) is True
+        rejected = mail.enqueue("send_email", self.create_test_email("alice", "bob"))
+        assert isinstance(rejected, RetryAfter)
+        assert rejected.seconds > 0
+        # Scheduled sends draw on the same bucket
+        rejected = mail.schedule_send(self.create_test_email("alice", "bob"), time.time() + 60)
+        assert isinstance(rejected, RetryAfter)
+        assert rejected.reason == "rate limited"
+        connection.close()
+    
+    def test_metrics_snapshot(self, server):
+        """Test fetching the server's metrics over the network"""
+        connection, auth, mail = self.connect(server)
+        auth.register("admin", "secret")
+        auth.login("admin", "secret")
+        
+        snapshot = mail.get_metrics()
+        assert set(snapshot) >= {'counters', 'gauges', 'histograms', 'spans'}
+        assert isinstance(mail.get_metrics("prometheus"), str)
+        connection.close()
+    
+    def test_profile_requests(self, server):
+        """Test triggering profiling over the network"""
+        connection, auth, mail = self.connect(server)
+        auth.register("admin", "secret")
+        auth.login("admin", "secret")
+        
+        assert mail.profile("slow_ops", None).endswith("slow_ops.jsonl")
+        with pytest.raises(RemoteError):
+            connection.request("profile", "bogus")
+        connection.close()
+    
+    def test_operator_ops_need_admin(self, server):
+        """Test that ordinary users can't read metrics or start profiling"""
+        connection, auth, mail = self.connect(server)
+        auth.register("alice", "secret")
+        auth.login("alice", "secret")
+        
+        with pytest.raises(RemoteError, match="forbidden"):
+            connection.request("metrics", "json")
+        with pytest.raises(RemoteError, match="forbidden"):
+            connection.request("profile", "slow_ops", 0)
+        assert mail.profile("sample", 1) is None
+        connection.close()
+    
+    def test_many_concurrent_sessions(self, server):
+        """Test that many sessions can be served at once"""
+        connections = [self.connect(server)[0] for _ in range(50)]
+        results = []
+        
+        def ping(connection):
+            results.append(connection.request("ping"))
+        
+        threads = [threading.Thread(target=ping, args=(c,)) for c in connections]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        
+        assert results == ["pong"] * len(connections)
+        for connection in connections:
+            connection.close()
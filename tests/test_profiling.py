@@ -0,0 +1,94 @@
+import pytest
+import os
+import sys
+import json
+import pstats
+import threading
+import time
+import uuid
+from datetime import datetime
+
+# Add project root to Python path
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(base_dir)
+
+from server.data_manager import DataManager
+from server.email_manager import EmailManager
+from server.profiling import NULL_CONTEXT, Profiler, profiler
+
+class TestProfiler:
+    @pytest.fixture
+    def shared_profiler(self, tmp_path):
+        """Point the process-wide profiler at a temporary dump directory"""
+        dump_dir = profiler.dump_dir
+        profiler.configure(tmp_path / "profiles")
+        yield profiler
+        profiler.set_slow_threshold(None)
+        profiler.configure(dump_dir)
+    
+    def create_test_email(self):
+        """Helper method to create a test email"""
+        return {
+            'id': str(uuid.uuid4()),
+            'sender': "testuser",
+            'recipient': "recipient",
+            'subject': "Test Subject",
+            'body': "x" * 1000,
+            'timestamp': datetime.now().isoformat(),
+            'status': 'sent'
+        }
+    
+    def test_inactive_hooks_are_no_ops(self, tmp_path):
+        """Test that nothing is tracked while profiling is off"""
+        idle = Profiler(tmp_path)
+        assert idle.operation("send_email") is NULL_CONTEXT
+        assert idle.phase("load") is NULL_CONTEXT
+    
+    def test_slow_task_is_logged_with_phases(self, tmp_path, shared_profiler):
+        """Test the slow-op log for a queued task"""
+        shared_profiler.set_slow_threshold(0)
+        email_manager = EmailManager(DataManager(tmp_path))
+        email_manager.enqueue("send_email", self.create_test_email())
+        email_manager.email_queue.join()
+        
+        log = shared_profiler.dump_dir / "slow_ops.jsonl"
+        (record,) = [json.loads(line) for line in log.read_text().splitlines()]
+        assert record['action'] == "send_email"
+        assert record['args'][0]['body'].endswith("...")  # Long values are truncated
+        assert set(record['phases']) == {'lock_wait', 'load', 'serialize', 'write', 'mutate'}
+        assert record['phases']['write'] > 0
+        assert sum(record['phases'].values()) == pytest.approx(record['duration'])
+    
+    def test_cprofile_capture(self, tmp_path, shared_profiler):
+        """Test that a cProfile window covers the tasks run during it"""
+        email_manager = EmailManager(DataManager(tmp_path))
+        path = shared_profiler.capture_cprofile(0.5)
+        assert shared_profiler.capture_cprofile(0.5) is None  # One capture at a time
+        email_manager.enqueue("send_email", self.create_test_email())
+        email_manager.email_queue.join()
+        
+        deadline = time.monotonic() + 5
+        while not path.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        functions = {name for _, _, name in pstats.Stats(str(path)).stats}
+        assert "_save_email" in functions
+    
+    def test_sampling_capture(self, tmp_path):
+        """Test that stack samples include other threads' stacks"""
+        sampler = Profiler(tmp_path)
+        stop = threading.Event()
+        
+        def busy_worker():
+            while not stop.is_set():
+                sum(range(1000))
+        
+        thread = threading.Thread(target=busy_worker, name="busy")
+        thread.start()
+        path = sampler.sample(0.2, interval=0.01)
+        while sampler.sampling:
+            time.sleep(0.05)
+        stop.set()
+        thread.join()
+        
+        lines = path.read_text().splitlines()
+        assert any(line.startswith("busy;") and "busy_worker" in line for line in lines)
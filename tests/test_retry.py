@@ -0,0 +1,57 @@
+import pytest
+import os
+import sys
+
+# Add project root to Python path
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(base_dir)
+
+from server.data_manager import DataManager
+from server.retry import RetryPolicy, DeadLetterStore
+
+class TestRetryPolicy:
+    def test_backoff_grows_exponentially_with_cap(self):
+        """Test exponential backoff without jitter"""
+        policy = RetryPolicy(base_delay=1, max_delay=5, jitter=0)
+        assert [policy.delay(attempt) for attempt in range(1, 6)] == [1, 2, 4, 5, 5]
+    
+    def test_jitter_stays_in_range(self):
+        """Test that jitter only shortens the delay by up to its fraction"""
+        policy = RetryPolicy(base_delay=2, jitter=0.5)
+        delays = [policy.delay(2) for _ in range(100)]
+        assert all(2 <= delay <= 4 for delay in delays)
+        assert len(set(delays)) > 1
+    
+    def test_should_retry(self):
+        """Test the attempt limit"""
+        policy = RetryPolicy(max_attempts=3)
+        assert policy.should_retry(2) is True
+        assert policy.should_retry(3) is False
+
+class TestDeadLetterStore:
+    def test_add_list_and_remove(self, tmp_path):
+        """Test recording, inspecting and removing dead letters"""
+        store = DeadLetterStore(DataManager(tmp_path))
+        entry_id = store.add(("send_email", {"id": "1"}), 3, IOError("boom"))
+        
+        entries = store.list()
+        assert len(entries) == 1
+        assert entries[0]['attempts'] == 3
+        assert entries[0]['error'] == "OSError: boom"
+        assert store.get(entry_id)['task'] == ["send_email", {"id": "1"}]
+        
+        assert store.remove(entry_id)['id'] == entry_id
+        assert store.remove(entry_id) is None
+        assert store.list() == []
+    
+    def test_unreadable_file_is_not_overwritten(self, tmp_path):
+        """Test that a corrupt dead-letter file is left alone, not emptied"""
+        data_manager = DataManager(tmp_path)
+        store = DeadLetterStore(data_manager)
+        store.add(("send_email", {"id": "1"}), 3, IOError("boom"))
+        data_manager.dead_letters_file.write_text("[{ not json")
+        
+        with pytest.raises(ValueError):
+            store.add(("send_email", {"id": "2"}), 3, IOError("boom"))
+        assert store.remove("missing") is None
+        assert data_manager.dead_letters_file.read_text() == "[{ not json"
@@ -0,0 +1,150 @@
+import pytest
+import os
+import sys
+import threading
+import time
+
+# Add project root to Python path
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(base_dir)
+
+from server.scheduler import TaskScheduler
+
+class TestTaskScheduler:
+    @pytest.fixture
+    def schedule_file(self, tmp_path):
+        """Path of a fresh schedule log"""
+        return tmp_path / "schedule.jsonl"
+    
+    def collector(self):
+        """Dispatch callback that records tasks and signals each arrival"""
+        dispatched = []
+        arrived = threading.Event()
+        
+        def dispatch(task_id, task):
+            dispatched.append((task_id, task))
+            arrived.set()
+        return dispatched, arrived, dispatch
+    
+    def test_dispatches_in_due_order(self, schedule_file):
+        """Test that tasks are dispatched earliest due first"""
+        dispatched, _, dispatch = self.collector()
+        scheduler = TaskScheduler(schedule_file, dispatch)
+        
+        now = time.time()
+        scheduler.schedule(now + 0.2, ("second",))
+        scheduler.schedule(now + 0.1, ("first",))
+        scheduler.schedule(now + 0.3, ("third",))
+        
+        deadline = time.time() + 5
+        while len(dispatched) < 3 and time.time() < deadline:
+            time.sleep(0.02)
+        scheduler.stop()
+        
+        assert [task for _, task in dispatched] == [("first",), ("second",), ("third",)]
+        # Dispatched tasks stay pending until they are marked as run
+        assert scheduler.pending() == 3
+        for task_id, _ in dispatched:
+            scheduler.complete(task_id)
+        assert scheduler.pending() == 0
+    
+    def test_does_not_dispatch_early(self, schedule_file):
+        """Test that a task waits until it is due"""
+        dispatched, arrived, dispatch = self.collector()
+        scheduler = TaskScheduler(schedule_file, dispatch)
+        
+        scheduler.schedule(time.time() + 60, ("later",))
+        assert not arrived.wait(0.2)
+        assert scheduler.pending() == 1
+        scheduler.stop()
+    
+    def test_cancel(self, schedule_file):
+        """Test that cancelled tasks are never dispatched"""
+        dispatched, arrived, dispatch = self.collector()
+        scheduler = TaskScheduler(schedule_file, dispatch)
+        
+        task_id = scheduler.schedule(time.time() + 0.1, ("cancelled",))
+        assert scheduler.cancel(task_id) is True
+        assert scheduler.cancel(task_id) is False
+        
+        assert not arrived.wait(0.3)
+        assert scheduler.next_due() is None
+        scheduler.stop()
+    
+    def test_pending_tasks_survive_restart(self, schedule_file):
+        """Test that pending tasks are restored from the log"""
+        scheduler = TaskScheduler(schedule_file, lambda task_id, task: None)
+        kept = scheduler.schedule(time.time() + 60, ("kept", 1))
+        dropped = scheduler.schedule(time.time() + 60, ("dropped",))
+        scheduler.cancel(dropped)
+        scheduler.stop()
+        
+        dispatched, _, dispatch = self.collector()
+        restarted = TaskScheduler(schedule_file, dispatch)
+        restarted.load()
+        
+        assert restarted.pending() == 1
+        assert restarted.tasks[kept][1] == ("kept", 1)
+        restarted.stop()
+    
+    def test_unfinished_task_survives_restart(self, schedule_file):
+        """Test that a task dispatched but never completed is dispatched again"""
+        dispatched, arrived, dispatch = self.collector()
+        scheduler = TaskScheduler(schedule_file, dispatch)
+        task_id = scheduler.schedule(time.time(), ("send",))
+        assert arrived.wait(5)
+        scheduler.stop()  # "Crash" before the task is marked as run
+        
+        dispatched, arrived, dispatch = self.collector()
+        restarted = TaskScheduler(schedule_file, dispatch)
+        restarted.load()
+        assert arrived.wait(5)
+        assert dispatched == [(task_id, ("send",))]
+        restarted.complete(task_id)
+        restarted.stop()
+        
+        final = TaskScheduler(schedule_file, dispatch)
+        final.load()
+        assert final.pending() == 0
+    
+    def test_log_is_compacted(self, schedule_file):
+        """Test that finished tasks are eventually dropped from the log"""
+        dispatched, _, dispatch = self.collector()
+        scheduler = TaskScheduler(schedule_file, dispatch)
+        
+        now = time.time()
+        for i in range(1200):
+            scheduler.schedule(now - 1, ("task", i))
+        
+        deadline = time.time() + 10
+        while len(dispatched) < 1200 and time.time() < deadline:
+            time.sleep(0.05)
+        scheduler.stop()
+        for task_id, _ in dispatched:
+            scheduler.complete(task_id)
+        
+        assert len(dispatched) == 1200
+        with open(schedule_file) as f:
+            assert sum(1 for _ in f) < 1200
+    
+    def test_compaction_keeps_tasks_of_other_schedulers(self, schedule_file):
+        """Test that schedulers sharing a log never compact away each other's tasks"""
+        other = TaskScheduler(schedule_file, lambda task_id, task: None)
+        kept = other.schedule(time.time() + 60, ("other",))
+        
+        scheduler = TaskScheduler(schedule_file, lambda task_id, task: None)
+        task_ids = [scheduler.schedule(time.time() + 60, ("task", i)) for i in range(1200)]
+        for task_id in task_ids:
+            scheduler.complete(task_id)
+        with open(schedule_file) as f:
+            assert sum(1 for _ in f) < 1200
+        
+        # The other scheduler's open log was replaced; it appends to the new one
+        added = other.schedule(time.time() + 60, ("added",))
+        other.stop()
+        scheduler.stop()
+        
+        restarted = TaskScheduler(schedule_file, lambda task_id, task: None)
+        restarted.load()
+        assert set(restarted.tasks) == {kept, added}
+        restarted.stop()
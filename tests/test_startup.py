@@ -0,0 +1,31 @@
+import pytest
+import os
+import sys
+import time
+
+# Add project root to Python path
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(base_dir)
+
+from client.startup import StartupTimer
+
+class TestStartupTimer:
+    def test_phases_are_measured_from_start(self):
+        """Test that each phase covers the time since the previous mark"""
+        timer = StartupTimer()
+        time.sleep(0.01)
+        timer.mark("import")
+        timer.mark("init")
+        
+        (first, first_seconds), (second, second_seconds) = timer.phases
+        assert (first, second) == ("import", "init")
+        assert first_seconds >= 0.01
+        assert second_seconds < first_seconds
+        assert timer.total() == pytest.approx(first_seconds + second_seconds)
+    
+    def test_report(self):
+        """Test the one-line report"""
+        timer = StartupTimer(start=0)
+        timer.phases = [("import", 0.1), ("first-paint", 0.05)]
+        timer.last = 0.15
+        assert timer.report() == "Startup: import 100.0 ms, first-paint 50.0 ms (total 150.0 ms)"